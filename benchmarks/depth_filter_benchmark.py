@@ -0,0 +1,214 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import platform
+import importlib.util
+import cv2
+import numpy as np
+
+# Run every depth filter over the depth frames of recordings made with RECORD_PATH and compare
+# per-frame latency, temporal noise, edge preservation and how many missing (zero) pixels get filled.
+#
+# Temporal noise is the per-pixel standard deviation of the filtered depth over windows where the scene
+# holds still (found from the raw frames), averaged over the pixels valid throughout the window.
+# Edge preservation is the filtered depth gradient at raw depth edges divided by the raw gradient there:
+# 1.0 keeps edges as sharp as the camera sees them, lower values blur them into the background.
+# Fill rate is the share of raw zero pixels that the filter gave a depth.
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(base_dir, os.pardir, "common"))
+from recording import RecordingReader, STREAM_DEPTH
+from depth_filters import available_filters, create_filter
+
+CONFIG_PATH = os.path.join(base_dir, os.pardir, "pepper_pipeline", "config.py")
+CSV_COLUMNS = ["filter", "recording", "frames", "runs", "latency_p50_ms", "latency_p95_ms", "latency_max_ms",
+               "temporal_noise_mm", "static_windows", "edge_preservation", "fill_rate"]
+
+
+def load_depth(path, max_frames):
+    # Copy the frames out of the memory map so reading the file is not part of the timing
+    reader = RecordingReader(path)
+    frames = [np.array(reader.read(position)[0]) for position in reader.entries(STREAM_DEPTH)[:max_frames]]
+    reader.close()
+    return frames
+
+
+def pipeline_options():
+    # The pipeline's DEPTH_FILTER_OPTIONS, so filters are benchmarked as they would run on the robot
+    try:
+        spec = importlib.util.spec_from_file_location("pipeline_config", CONFIG_PATH)
+        config = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(config)
+        return dict(config.DEPTH_FILTER_OPTIONS)
+    except Exception as e:
+        print(f"Using filter defaults, could not read {CONFIG_PATH}: {e}")
+        return {}
+
+
+def static_windows(frames, length, max_change, max_ratio):
+    # Start of every run of length frames in which few pixels move by more than max_change mm
+    windows = []
+    start = 0
+    while start + length <= len(frames):
+        first = frames[start].astype(np.int32)
+        still = True
+        for frame in frames[start + 1:start + length]:
+            both = (first > 0) & (frame > 0)
+            moved = np.count_nonzero(both & (np.abs(frame.astype(np.int32) - first) > max_change))
+            if moved > max_ratio * max(np.count_nonzero(both), 1):
+                still = False
+                break
+        if still:
+            windows.append(start)
+            start += length
+        else:
+            start += 1
+    return windows
+
+
+def temporal_noise(outputs, windows, length):
+    # Mean per-pixel standard deviation (mm) over the static windows, None without any
+    noise = []
+    for start in windows:
+        stack = np.array(outputs[start:start + length], dtype=np.float32)
+        valid = np.all(stack > 0, axis=0)
+        if np.any(valid):
+            noise.append(float(stack[:, valid].std(axis=0).mean()))
+    return float(np.mean(noise)) if noise else None
+
+
+def gradient(depth):
+    # Depth change in mm per pixel (Sobel scaled so a ramp of slope s gives s)
+    depth = depth.astype(np.float32)
+    gx = cv2.Sobel(depth, cv2.CV_32F, 1, 0, ksize=3, scale=0.125)
+    gy = cv2.Sobel(depth, cv2.CV_32F, 0, 1, ksize=3, scale=0.125)
+    return cv2.magnitude(gx, gy)
+
+
+def edge_sums(raw, filtered, threshold):
+    # Filtered and raw gradient summed over raw edges, away from zero pixels whose jumps are not edges
+    kernel = np.ones((3, 3), np.uint8)
+    valid = cv2.erode(((raw > 0) & (filtered > 0)).astype(np.uint8), kernel) > 0
+    raw_gradient = gradient(raw)
+    edges = valid & (raw_gradient > threshold)
+    return float(gradient(filtered)[edges].sum()), float(raw_gradient[edges].sum())
+
+
+def bench(name, options, frames, windows, args):
+    depth_filter = create_filter(name, **options)
+    out = np.empty_like(frames[0])
+    latencies = []
+    outputs = []
+    for run in range(args.runs):
+        # Temporal filters start every pass from an empty history
+        depth_filter.reset()
+        for frame in frames:
+            start = time.perf_counter()
+            filtered = depth_filter(frame, out)
+            latencies.append(time.perf_counter() - start)
+            # Quality comes from the first pass, later ones see the same frames
+            if run == 0:
+                outputs.append(filtered.copy())
+
+    edge_filtered = edge_raw = 0.0
+    zeros = filled = 0
+    for raw, filtered in zip(frames, outputs):
+        sums = edge_sums(raw, filtered, args.edge_threshold)
+        edge_filtered += sums[0]
+        edge_raw += sums[1]
+        missing = raw == 0
+        zeros += np.count_nonzero(missing)
+        filled += np.count_nonzero(filtered[missing])
+
+    latencies_ms = [1000.0 * latency for latency in latencies]
+    return {
+        "filter": name,
+        "options": options,
+        "frames": len(frames),
+        "runs": args.runs,
+        "latency_p50_ms": float(np.percentile(latencies_ms, 50)),
+        "latency_p95_ms": float(np.percentile(latencies_ms, 95)),
+        "latency_max_ms": float(max(latencies_ms)),
+        "temporal_noise_mm": temporal_noise(outputs, windows, args.window),
+        "static_windows": len(windows),
+        "edge_preservation": edge_filtered / edge_raw if edge_raw else None,
+        "fill_rate": float(filled) / zeros if zeros else None,
+    }
+
+
+def write_results(results, path):
+    if path.lower().endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_COLUMNS + ["error"])
+            for r in results:
+                writer.writerow([r.get(key, "") for key in CSV_COLUMNS] + [r.get("error", "")])
+    else:
+        with open(path, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "host": platform.node(),
+                "cpu_count": os.cpu_count(),
+                "results": results,
+            }, f, indent=2)
+
+
+def number(value, width, precision):
+    return f"{value:>{width}.{precision}f}" if value is not None else f"{'-':>{width}}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark depth filters on recorded depth frames")
+    parser.add_argument("recordings", nargs="+", help="recording directories written with RECORD_PATH")
+    parser.add_argument("--filters", nargs="+", default=available_filters(), choices=available_filters())
+    parser.add_argument("--options", type=json.loads, default=None,
+                        help="JSON of constructor arguments per filter, e.g. '{\"box\": {\"size\": 3}}' "
+                             "(default: DEPTH_FILTER_OPTIONS from the pipeline config)")
+    parser.add_argument("--runs", type=int, default=3, help="timed passes over the frames")
+    parser.add_argument("--max-frames", type=int, default=300)
+    parser.add_argument("--window", type=int, default=15, help="frames per static window for temporal noise")
+    parser.add_argument("--static-change", type=float, default=100.0,
+                        help="mm a pixel may change within a static window")
+    parser.add_argument("--static-ratio", type=float, default=0.05,
+                        help="share of pixels that may change by more than --static-change in a static window")
+    parser.add_argument("--edge-threshold", type=float, default=50.0,
+                        help="raw depth gradient in mm per pixel that counts as an edge")
+    parser.add_argument("--output", default="depth_filter_benchmark.json", help="results file, .json or .csv")
+    args = parser.parse_args()
+
+    options = pipeline_options() if args.options is None else args.options
+    results = []
+    for path in args.recordings:
+        frames = load_depth(path, args.max_frames)
+        if not frames:
+            print(f"{path}: no depth frames, skipped")
+            continue
+
+        windows = static_windows(frames, args.window, args.static_change, args.static_ratio)
+        print(f"\n{path}: {len(frames)} depth frames of {frames[0].shape[1]}x{frames[0].shape[0]}")
+        print(f"{'filter':<20}{'p50 ms':>9}{'p95 ms':>9}{'noise mm':>10}{'edges':>8}{'filled':>8}")
+        for name in args.filters:
+            try:
+                r = bench(name, options.get(name, {}), frames, windows, args)
+            except Exception as e:
+                r = {"filter": name, "error": str(e)}
+            r["recording"] = path
+            results.append(r)
+            if "error" in r:
+                print(f"{name:<20}  failed: {r['error']}")
+                continue
+            print(f"{name:<20}{r['latency_p50_ms']:>9.2f}{r['latency_p95_ms']:>9.2f}"
+                  f"{number(r['temporal_noise_mm'], 10, 1)}{number(r['edge_preservation'], 8, 2)}"
+                  f"{number(r['fill_rate'], 8, 2)}")
+        if not windows:
+            print(f"No static stretch of {args.window} frames, temporal noise needs the camera to hold still")
+
+    write_results(results, args.output)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import os
+import sys
+import csv
+import json
+import queue
+import glob
+import time
+import argparse
+import platform
+import statistics
+import multiprocessing as mp
+from collections import Counter
+import cv2
+import numpy as np
+
+# Replay a directory of images or a video through detector backends and compare
+# throughput, latency percentiles, peak memory and per-class detection counts.
+# Every detector runs in its own process so its memory and threads are measured alone.
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(base_dir, os.pardir, "object_recognition"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+CSV_COLUMNS = ["detector", "frames", "runs", "threads", "load_s", "fps_mean", "fps_stdev",
+               "latency_p50_ms", "latency_p95_ms", "latency_p99_ms", "peak_rss_mb"]
+
+
+def load_frames(source, max_frames):
+    # Decode everything up front so decoding is not part of the timing
+    frames = []
+    if os.path.isdir(source):
+        paths = sorted(path for path in glob.glob(os.path.join(source, "*"))
+                       if path.lower().endswith(IMAGE_EXTENSIONS))
+        for path in paths[:max_frames]:
+            frame = cv2.imread(path)
+            if frame is not None:
+                frames.append(frame)
+    else:
+        capture = cv2.VideoCapture(source)
+        while len(frames) < max_frames:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frames.append(frame)
+        capture.release()
+    return frames
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024.0 * 1024.0) if platform.system() == "Darwin" else peak / 1024.0
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def bench_worker(spec, args, results):
+    # Runs in a fresh process: pin the thread count before any backend library loads
+    os.environ["OMP_NUM_THREADS"] = str(args.threads)
+    cv2.setNumThreads(args.threads)
+    from detectors import create_detector
+
+    backend, _, model = spec.partition(":")
+    options = {"threads": args.threads, "score_threshold": args.score_threshold}
+    if model:
+        options["model_path"] = model
+
+    try:
+        frames = load_frames(args.source, args.max_frames)
+
+        load_start = time.perf_counter()
+        detector = create_detector(backend, **options)
+        load_time = time.perf_counter() - load_start
+
+        for index in range(args.warmup):
+            detector.detect(frames[index % len(frames)])
+
+        latencies = []
+        run_fps = []
+        class_counts = Counter()
+        for run in range(args.runs):
+            run_start = time.perf_counter()
+            for frame in frames:
+                start = time.perf_counter()
+                detections = detector.detect(frame)
+                latencies.append(time.perf_counter() - start)
+                # Counts come from the first run, later runs see the same frames
+                if run == 0:
+                    class_counts.update(d.category for d in detections)
+            run_fps.append(len(frames) / (time.perf_counter() - run_start))
+
+        latencies_ms = [1000.0 * latency for latency in latencies]
+        results.put({
+            "detector": spec,
+            "frames": len(frames),
+            "runs": args.runs,
+            "threads": args.threads,
+            "load_s": load_time,
+            "fps_mean": statistics.mean(run_fps),
+            "fps_stdev": statistics.stdev(run_fps) if len(run_fps) > 1 else 0.0,
+            "latency_p50_ms": percentile(latencies_ms, 50),
+            "latency_p95_ms": percentile(latencies_ms, 95),
+            "latency_p99_ms": percentile(latencies_ms, 99),
+            "peak_rss_mb": peak_rss_mb(),
+            "class_counts": dict(class_counts),
+        })
+    except Exception as e:
+        results.put({"detector": spec, "error": str(e)})
+
+
+def run(spec, args):
+    context = mp.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=bench_worker, args=(spec, args, results))
+    process.start()
+    while True:
+        try:
+            result = results.get(timeout=1.0)
+            break
+        except queue.Empty:
+            # A crash inside a native runtime (segfault, out of memory) never puts a result
+            if not process.is_alive():
+                # The result may have landed just before the process exited
+                try:
+                    result = results.get(timeout=1.0)
+                except queue.Empty:
+                    result = {"detector": spec, "error": f"worker exited with code {process.exitcode}"}
+                break
+    process.join()
+    return result
+
+
+def write_results(results, path):
+    if path.lower().endswith(".csv"):
+        # One column per detected class, flattened next to the timing columns
+        classes = sorted(set(name for r in results for name in r.get("class_counts", {})))
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_COLUMNS + [f"count_{name}" for name in classes] + ["error"])
+            for r in results:
+                counts = r.get("class_counts", {})
+                writer.writerow([r.get(key, "") for key in CSV_COLUMNS] +
+                                [counts.get(name, 0) for name in classes] + [r.get("error", "")])
+    else:
+        with open(path, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "host": platform.node(),
+                "cpu_count": os.cpu_count(),
+                "results": results,
+            }, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detector backends on recorded frames")
+    parser.add_argument("source", help="directory of images or a video file")
+    parser.add_argument("--detectors", nargs="+", default=["yolo", "mediapipe", "onnx"],
+                        help="backend names, optionally with a model as backend:path (e.g. onnx:yolov8n_int8.onnx)")
+    parser.add_argument("--threads", type=int, default=1, help="CPU threads given to each detector")
+    parser.add_argument("--warmup", type=int, default=5, help="frames run before timing starts")
+    parser.add_argument("--runs", type=int, default=3, help="timed passes over the frames")
+    parser.add_argument("--max-frames", type=int, default=200)
+    parser.add_argument("--score-threshold", type=float, default=0.5)
+    parser.add_argument("--output", default="detector_benchmark.json", help="results file, .json or .csv")
+    args = parser.parse_args()
+
+    if not load_frames(args.source, 1):
+        parser.error(f"No frames could be read from {args.source}")
+
+    results = []
+    print(f"{'detector':<30}{'fps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'rss MB':>9}  classes")
+    for spec in args.detectors:
+        r = run(spec, args)
+        results.append(r)
+        if "error" in r:
+            print(f"{spec:<30}  failed: {r['error']}")
+            continue
+        rss = f"{r['peak_rss_mb']:>9.0f}" if r["peak_rss_mb"] is not None else f"{'-':>9}"
+        counts = ", ".join(f"{name} {count}" for name, count in sorted(r["class_counts"].items()))
+        print(f"{spec:<30}{r['fps_mean']:>8.1f}{r['latency_p50_ms']:>9.1f}{r['latency_p95_ms']:>9.1f}"
+              f"{r['latency_p99_ms']:>9.1f}{rss}  {counts}")
+
+    write_results(results, args.output)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
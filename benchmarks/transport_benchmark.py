@@ -0,0 +1,176 @@
+import os
+import sys
+import time
+import glob
+import socket
+import argparse
+import multiprocessing as mp
+import cv2
+import numpy as np
+
+# Compare frames/sec and CPU per frame of the UDP JPEG and shared-memory video transports.
+# Producer and consumer run in separate processes on this host, like main.py and stream.py.
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(base_dir, os.pardir, "common"))
+from frame_ring import FrameRingWriter, FrameRingReader
+from video_protocol import FrameSender, FrameReassembler
+
+IMAGE_DIR = os.path.join(base_dir, os.pardir, "camera_calibration", "Calibration Images")
+
+
+def load_frames(width, height):
+    # Use real camera images so JPEG sizes are realistic
+    paths = sorted(glob.glob(os.path.join(IMAGE_DIR, "top_camera_*.jpg")))[:10]
+    frames = [cv2.resize(cv2.imread(path), (width, height)) for path in paths]
+    if not frames:
+        frames = [np.random.randint(0, 255, (height, width, 3), dtype=np.uint8)]
+    return frames
+
+
+def udp_producer(port, seconds, width, height, quality, chunk_size, ready, results):
+    frames = load_frames(width, height)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender = FrameSender(sock, ("127.0.0.1", port), chunk_size)
+    ready.wait()
+
+    sent = 0
+    cpu_start = time.process_time()
+    end = time.time() + seconds
+    while time.time() < end:
+        frame = frames[sent % len(frames)]
+        _, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        sender.send(buffer.tobytes(), time.time())
+        sent += 1
+        time.sleep(0.003)
+
+    results.put(("producer", sent, time.process_time() - cpu_start))
+    sock.close()
+
+
+def udp_consumer(port, seconds, ready, results):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sock.bind(("127.0.0.1", port))
+    sock.settimeout(0.5)
+    reassembler = FrameReassembler()
+    ready.set()
+
+    received = 0
+    cpu_start = time.process_time()
+    end = time.time() + seconds + 1.0
+    while time.time() < end:
+        try:
+            data, _ = sock.recvfrom(65536)
+        except socket.timeout:
+            continue
+        result = reassembler.add_packet(data)
+        if result is None:
+            continue
+        frame = cv2.imdecode(np.frombuffer(result[2], dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is not None:
+            received += 1
+
+    results.put(("consumer", received, time.process_time() - cpu_start))
+    sock.close()
+
+
+def shm_producer(path, seconds, width, height, ready, results):
+    frames = load_frames(width, height)
+    ring = FrameRingWriter(path, 8, width * height * 3)
+    ready.set()
+
+    sent = 0
+    cpu_start = time.process_time()
+    end = time.time() + seconds
+    while time.time() < end:
+        ring.write(frames[sent % len(frames)], time.time())
+        sent += 1
+        time.sleep(0.003)
+
+    results.put(("producer", sent, time.process_time() - cpu_start))
+    ring.close()
+
+
+def shm_consumer(path, seconds, ready, results):
+    ready.wait()
+    ring = FrameRingReader(path)
+
+    received = 0
+    last_id = 0
+    cpu_start = time.process_time()
+    end = time.time() + seconds + 1.0
+    while time.time() < end:
+        result = ring.read_latest(last_id)
+        if result is None:
+            time.sleep(0.001)
+            continue
+        last_id, _, frame = result
+        # Touch the pixels so the consumer pays for reading them
+        frame[::16, ::16].sum()
+        if ring.is_intact(last_id):
+            received += 1
+
+    results.put(("consumer", received, time.process_time() - cpu_start))
+    ring.close()
+
+
+def run(transport, args):
+    ready = mp.Event()
+    results = mp.Queue()
+
+    if transport == "udp":
+        producer = mp.Process(target=udp_producer, args=(args.port, args.seconds, args.width, args.height,
+                                                         args.quality, args.chunk_size, ready, results))
+        consumer = mp.Process(target=udp_consumer, args=(args.port, args.seconds, ready, results))
+    else:
+        path = args.ring_path
+        producer = mp.Process(target=shm_producer, args=(path, args.seconds, args.width,
+                                                         args.height, ready, results))
+        consumer = mp.Process(target=shm_consumer, args=(path, args.seconds, ready, results))
+
+    consumer.start()
+    producer.start()
+    producer.join()
+    consumer.join()
+
+    stats = dict((role, (count, cpu)) for role, count, cpu in (results.get(), results.get()))
+    sent, producer_cpu = stats["producer"]
+    received, consumer_cpu = stats["consumer"]
+
+    if transport == "shm" and os.path.exists(args.ring_path):
+        os.remove(args.ring_path)
+
+    return {
+        "transport": transport,
+        "sent_fps": sent / float(args.seconds),
+        "received_fps": received / float(args.seconds),
+        "producer_cpu_ms": 1000.0 * producer_cpu / max(sent, 1),
+        "consumer_cpu_ms": 1000.0 * consumer_cpu / max(received, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the video transports")
+    parser.add_argument("--transport", choices=["udp", "shm", "all"], default="all")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--width", type=int, default=320)
+    parser.add_argument("--height", type=int, default=240)
+    parser.add_argument("--quality", type=int, default=60, help="JPEG quality for UDP")
+    parser.add_argument("--chunk-size", type=int, default=8192, help="UDP payload bytes per datagram")
+    parser.add_argument("--port", type=int, default=18089)
+    parser.add_argument("--ring-path", default=os.path.join(
+        "/dev/shm" if os.path.isdir("/dev/shm") else os.path.expanduser("~"), "pepper_frame_ring_bench"))
+    args = parser.parse_args()
+
+    transports = ["udp", "shm"] if args.transport == "all" else [args.transport]
+
+    print(f"{'transport':<10}{'sent fps':>10}{'recv fps':>10}{'tx cpu ms':>12}{'rx cpu ms':>12}")
+    for transport in transports:
+        r = run(transport, args)
+        print(f"{r['transport']:<10}{r['sent_fps']:>10.1f}{r['received_fps']:>10.1f}"
+              f"{r['producer_cpu_ms']:>12.3f}{r['consumer_cpu_ms']:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,27 @@ import numpy as np
 import cv2
 import signal
 import threading
+import os
 import sys
 import time
 # Path to NAOqi SDK library
 sys.path.append(r"C:/path/to/naoqi-sdk/lib")
 from naoqi import ALProxy, ALBroker  
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from depth_filters import available_filters, create_filter
 
 # Pepper IP address and port
 ip = '192.168.244.207'
 port = 9559
 
+# Depth filter to look at, pass another name on the command line to compare
+filter_name = sys.argv[1] if len(sys.argv) > 1 else 'box'
+if filter_name not in available_filters():
+    print("Unknown filter {}, use one of: {}".format(filter_name, ", ".join(available_filters())))
+    sys.exit(1)
+depth_filter = create_filter(filter_name)
+last_report = time.time()
+
 # Setup Pepper proxies
 broker = ALBroker("pythonBroker", "0.0.0.0", 0, ip, port)
 video_proxy = ALProxy("ALVideoDevice", ip, port)
@@ -39,21 +50,16 @@ signal.signal(signal.SIGINT, cleanup)
 signal.signal(signal.SIGTERM, cleanup)
 
 def smooth_image(depth_image):
-    depth_smoothed = cv2.GaussianBlur(depth_image, (5, 5), 0)
-
-    depth_smoothed = cv2.boxFilter(depth_image, -1, (5, 5))
-
-    # depth_normalised = cv2.normalize(depth_image, None, 0, 255, cv2.NORM_MINMAX)
-    # depth_normalised = np.uint8(depth_normalised)
-    # depth_mean = cv2.fastNlMeansDenoising(depth_normalised, None, 10, 7, 21)
-    # depth_smoothed = cv2.GaussianBlur(depth_mean, (5, 5), 0)
+    global last_report
+    depth_smoothed = depth_filter(depth_image)
 
-    # depth_smoothed = cv2.medianBlur(depth_smoothed, 5)
+    # Print the filter's cost every 5 seconds
+    if time.time() - last_report >= 5.0:
+        stats = depth_filter.poll_stats()
+        if stats:
+            print(depth_filter.format(stats))
+        last_report = time.time()
 
-    # depth_normalised = cv2.normalize(depth_image, None, 0, 255, cv2.NORM_MINMAX)
-    # depth_normalised = np.uint8(depth_normalised)
-    # depth_smoothed = cv2.bilateralFilter(depth_normalised, 9, 75, 75)
-    
     return depth_smoothed
 
 def visulaise_depth_image(depth_image):
@@ -63,7 +69,7 @@ def visulaise_depth_image(depth_image):
     depth_normalised = np.uint8(depth_normalised)
 
     # Display the image
-    cv2.imshow("Depth Image", depth_normalised)
+    cv2.imshow("Depth Image ({})".format(filter_name), depth_normalised)
     cv2.waitKey(1)
 
 # Fuction to get video feed from Pepper
@@ -0,0 +1,48 @@
+import math
+import threading
+from collections import deque
+
+# NTP-style clock offset estimation shared by the pipeline (Python 2.7) and the detector (Python 3).
+#
+# For a ping sent at t0 and answered at t1/t2 on the remote clock, received back at t3:
+#   offset = ((t1 - t0) + (t2 - t3)) / 2    remote clock minus local clock
+#   delay  = (t3 - t0) - (t2 - t1)          network round trip
+# The sample with the smallest delay in the window is the least distorted by queueing.
+
+
+class ClockOffsetEstimator(object):
+    def __init__(self, window=16):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.offset = None
+        self.delay = None
+        self.jitter = None
+
+    def add_sample(self, t0, t1, t2, t3):
+        delay = (t3 - t0) - (t2 - t1)
+        if delay < 0:
+            # Clock stepped during the exchange
+            return
+
+        offset = ((t1 - t0) + (t2 - t3)) / 2.0
+        with self._lock:
+            self._samples.append((delay, offset))
+            self.delay, self.offset = min(self._samples)
+
+            # Spread of the window's offsets around the chosen one
+            offsets = [sample[1] for sample in self._samples]
+            self.jitter = math.sqrt(sum((o - self.offset) ** 2 for o in offsets) / len(offsets))
+
+    @property
+    def synced(self):
+        return self.offset is not None
+
+    def to_local(self, remote_ts):
+        # Convert a remote timestamp to the local clock, unchanged until the first sample
+        return remote_ts - self.offset if self.offset is not None else remote_ts
+
+    def format(self):
+        if self.offset is None:
+            return "not synced"
+        return "offset {:.1f} ms, delay {:.1f} ms, jitter {:.1f} ms".format(
+            1000.0 * self.offset, 1000.0 * self.delay, 1000.0 * self.jitter)
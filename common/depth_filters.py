@@ -0,0 +1,180 @@
+import time
+import cv2
+import numpy as np
+from depth_fusion import DepthFusion
+
+# Depth noise filters selected by name, shared by the pipeline, the filter test and the benchmark.
+#
+# A filter is called once per uint16 depth frame (millimetres, 0 = no reading) as filter(depth, out=None)
+# and returns the filtered uint16 frame, written into out when it fits. Spatial filters treat every frame
+# alone; temporal filters keep state between calls, so they must see the frames of one camera in order
+# and be reset() between sequences.
+
+_REGISTRY = {}
+
+
+class DepthFilter(object):
+    temporal = False
+
+    def __init__(self):
+        self.name = type(self).__name__
+        self._frames = 0
+        self._seconds = 0.0
+
+    def __call__(self, depth, out=None):
+        start = time.time()
+        if out is not None and (out.shape != depth.shape or out.dtype != np.uint16):
+            out = None
+        result = self.apply(depth, out)
+        self._frames += 1
+        self._seconds += time.time() - start
+        return result
+
+    def apply(self, depth, out):
+        raise NotImplementedError
+
+    def reset(self):
+        # Forget earlier frames, nothing to do for spatial filters
+        pass
+
+    def poll_stats(self):
+        # Mean cost per frame since the last call, None without frames
+        if not self._frames:
+            return None
+        stats = {'frames': self._frames, 'ms_per_frame': 1000.0 * self._seconds / self._frames}
+        self._frames = 0
+        self._seconds = 0.0
+        return stats
+
+    def format(self, stats):
+        return "{} filter {:.2f} ms/frame".format(self.name, stats['ms_per_frame'])
+
+
+class NoFilter(DepthFilter):
+    def apply(self, depth, out):
+        if out is None:
+            return depth.copy()
+        np.copyto(out, depth)
+        return out
+
+
+class BoxFilter(DepthFilter):
+    def __init__(self, size=5):
+        DepthFilter.__init__(self)
+        self.size = size
+
+    def apply(self, depth, out):
+        return cv2.boxFilter(depth, -1, (self.size, self.size), dst=out)
+
+
+class GaussianFilter(DepthFilter):
+    def __init__(self, size=5, sigma=0):
+        DepthFilter.__init__(self)
+        self.size = size
+        self.sigma = sigma
+
+    def apply(self, depth, out):
+        return cv2.GaussianBlur(depth, (self.size, self.size), self.sigma, dst=out)
+
+
+class MedianFilter(DepthFilter):
+    def __init__(self, size=5):
+        # OpenCV only takes 16-bit images for 3 and 5 pixel medians
+        DepthFilter.__init__(self)
+        if size not in (3, 5):
+            raise ValueError("Median filter size must be 3 or 5 for 16-bit depth, got {}".format(size))
+        self.size = size
+
+    def apply(self, depth, out):
+        return cv2.medianBlur(depth, self.size, dst=out)
+
+
+class BilateralFilter(DepthFilter):
+    def __init__(self, diameter=9, sigma_depth=50.0, sigma_space=3.0):
+        # Runs on millimetres as float, so sigma_depth is the depth step in mm treated as an edge
+        # (the filter test normalised to 8 bits first, which made the edge threshold depend on the scene)
+        DepthFilter.__init__(self)
+        self.diameter = diameter
+        self.sigma_depth = sigma_depth
+        self.sigma_space = sigma_space
+
+    def apply(self, depth, out):
+        filtered = cv2.bilateralFilter(depth.astype(np.float32), self.diameter, self.sigma_depth,
+                                       self.sigma_space)
+        if out is None:
+            out = np.empty(depth.shape, dtype=np.uint16)
+        np.copyto(out, filtered + 0.5, casting='unsafe')
+        return out
+
+
+class NlMeansFilter(DepthFilter):
+    def __init__(self, strength=30.0, template_size=5, search_size=11):
+        # 16-bit non-local means needs the L1 norm, strength is roughly the noise in mm to remove
+        DepthFilter.__init__(self)
+        self.strength = strength
+        self.template_size = template_size
+        self.search_size = search_size
+
+    def apply(self, depth, out):
+        # Keyword arguments pick the 16-bit overload in every OpenCV version
+        filtered = cv2.fastNlMeansDenoising(depth, h=[float(self.strength)],
+                                            templateWindowSize=self.template_size,
+                                            searchWindowSize=self.search_size, normType=cv2.NORM_L1)
+        if out is None:
+            return filtered
+        np.copyto(out, filtered)
+        return out
+
+
+class TemporalFilter(DepthFilter):
+    temporal = True
+
+    def __init__(self, method='median', **options):
+        # DepthFusion over the last frames, see depth_fusion.py for the options
+        DepthFilter.__init__(self)
+        self.fusion = DepthFusion(method, **options)
+
+    def apply(self, depth, out):
+        return self.fusion.update(depth, out)
+
+    def reset(self):
+        self.fusion = DepthFusion(self.fusion.method, self.fusion.history, self.fusion.max_change,
+                                  self.fusion.motion_ratio, self.fusion.refresh, self.fusion.min_weight)
+
+    def poll_stats(self):
+        # The fusion's own statistics also say how many pixels were recomputed
+        DepthFilter.poll_stats(self)
+        return self.fusion.poll_stats()
+
+    def format(self, stats):
+        return self.fusion.format(stats)
+
+
+def register_filter(name, filter_class, **defaults):
+    # defaults are constructor arguments, overridden by the options given to create_filter
+    _REGISTRY[name] = (filter_class, defaults)
+
+
+def available_filters():
+    return sorted(_REGISTRY)
+
+
+def create_filter(name, **options):
+    if name not in _REGISTRY:
+        raise ValueError("Unknown depth filter '{}', use one of {}".format(name, ", ".join(available_filters())))
+    filter_class, defaults = _REGISTRY[name]
+    arguments = dict(defaults)
+    arguments.update(options)
+    depth_filter = filter_class(**arguments)
+    depth_filter.name = name
+    return depth_filter
+
+
+register_filter('none', NoFilter)
+register_filter('box', BoxFilter)
+register_filter('gaussian', GaussianFilter)
+register_filter('median', MedianFilter)
+register_filter('bilateral', BilateralFilter)
+register_filter('nlmeans', NlMeansFilter)
+register_filter('temporal_median', TemporalFilter, method='median')
+register_filter('temporal_weighted', TemporalFilter, method='weighted')
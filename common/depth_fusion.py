@@ -0,0 +1,174 @@
+import time
+import numpy as np
+
+# Temporal fusion of uint16 depth frames (millimetres, 0 = no reading), shared by the pipeline and the tools.
+#
+# 'median' keeps a ring of the last frames and outputs the per-pixel median of the valid readings.
+# 'weighted' keeps a running average per pixel whose weight (confidence) grows with every agreeing reading,
+# decays while a pixel has no reading, and restarts when a reading disagrees by more than max_change.
+# When many pixels disagree with the fused frame (by more than max_change, or gaining or losing a reading)
+# the camera moved, so the history is dropped instead of smearing two viewpoints together. Otherwise the
+# camera is taken to be still: the median is then recomputed for the disagreeing pixels, where the scene
+# changed, and for a rotating 1/refresh share of all the others, so no median is more than refresh frames
+# old. Every pixel is recomputed while the ring fills after a start or a reset.
+
+METHODS = ('median', 'weighted')
+
+# Up to this many frames the median uses a min/max sorting network (history² passes) and np.choose,
+# which takes at most 32 arrays on NumPy 1.x. Longer histories are sorted with np.sort instead.
+NETWORK_MAX_FRAMES = 16
+
+
+class DepthFusion(object):
+    def __init__(self, method='median', history=5, max_change=100, motion_ratio=0.3, refresh=5,
+                 min_weight=0.5):
+        if method not in METHODS:
+            raise ValueError("Unknown depth fusion method '{}', use one of {}".format(method, ", ".join(METHODS)))
+        if int(history) != history or history < 1:
+            raise ValueError("Depth fusion history must be a whole number of frames, got {}".format(history))
+        self.method = method
+        self.history = int(history)
+        self.max_change = max_change
+        self.motion_ratio = motion_ratio
+        self.refresh = max(1, refresh)
+        self.min_weight = min_weight
+        self._shape = None
+
+        # Statistics since the last poll_stats()
+        self._frames = 0
+        self._seconds = 0.0
+        self._updated = 0
+        self._pixels = 0
+        self._resets = 0
+
+    def reset(self, shape):
+        self._shape = shape
+        self._ring = np.zeros((self.history, int(np.prod(shape))), dtype=np.uint16)
+        self._restart()
+        self._fused = np.zeros(shape, dtype=np.uint16)
+        self._average = np.zeros(shape, dtype=np.float32)
+        self._weight = np.zeros(shape, dtype=np.float32)
+
+    def _restart(self):
+        # Forget the history, the ring fills again from slot 0
+        self._next = 0
+        self._filled = 0
+        self._phase = 0
+
+    def update(self, depth, out=None):
+        # Add a frame and return the fused frame, written into out when given
+        start = time.time()
+        if depth.shape != self._shape:
+            self.reset(depth.shape)
+
+        valid = depth > 0
+        moved = None
+        if self._filled:
+            moved = (valid != (self._fused > 0)) | (valid & (np.abs(depth.astype(np.int32) - self._fused) >
+                                                             self.max_change))
+            if np.count_nonzero(moved) > self.motion_ratio * depth.size:
+                # The camera moved, older frames show a different view
+                self._resets += 1
+                self._restart()
+                self._weight[:] = 0
+                moved = None
+
+        self._ring[self._next] = depth.reshape(-1)
+        self._next = (self._next + 1) % self.history
+        self._filled = min(self._filled + 1, self.history)
+
+        if self.method == 'median':
+            samples = self._ring[:self._filled]
+            stale = None
+            if moved is not None and self._filled == self.history:
+                # Still camera: pixels where the scene changed, plus this frame's share of the rest
+                stale = moved.reshape(-1)
+                stale[self._phase::self.refresh] = True
+                self._phase = (self._phase + 1) % self.refresh
+
+            if stale is None or np.count_nonzero(stale) > depth.size // 2:
+                # Gathering most of the pixels costs more than recomputing them all
+                self._fused.reshape(-1)[:] = _valid_median(samples)
+                updated = depth.size
+            else:
+                index = np.flatnonzero(stale)
+                self._fused.reshape(-1)[index] = _valid_median(samples[:, index])
+                updated = len(index)
+        else:
+            self._update_weighted(depth, valid)
+            updated = depth.size
+
+        if out is None or out.shape != depth.shape or out.dtype != np.uint16:
+            out = np.empty(depth.shape, dtype=np.uint16)
+        np.copyto(out, self._fused)
+
+        self._frames += 1
+        self._seconds += time.time() - start
+        self._updated += updated
+        self._pixels += depth.size
+        return out
+
+    def _update_weighted(self, depth, valid):
+        depth = depth.astype(np.float32)
+        agree = valid & (np.abs(depth - self._average) <= self.max_change) & (self._weight > 0)
+        restart = valid & ~agree
+
+        # Agreeing readings join the average, the weight is capped so the average keeps following slow changes
+        weight = self._weight[agree]
+        self._average[agree] = (self._average[agree] * weight + depth[agree]) / (weight + 1.0)
+        self._weight[agree] = np.minimum(weight + 1.0, self.history)
+
+        self._average[restart] = depth[restart]
+        self._weight[restart] = 1.0
+
+        # Missing readings keep the last value for a while, with less and less confidence
+        self._weight[~valid] *= 0.5
+        confident = self._weight >= self.min_weight
+        self._fused[...] = np.where(confident, self._average + 0.5, 0).astype(np.uint16)
+
+    def poll_stats(self):
+        # Mean cost per frame and share of pixels recomputed since the last call, None without frames
+        if not self._frames:
+            return None
+        stats = {
+            'frames': self._frames,
+            'ms_per_frame': 1000.0 * self._seconds / self._frames,
+            'updated_ratio': float(self._updated) / self._pixels,
+            'resets': self._resets,
+        }
+        self._frames = 0
+        self._seconds = 0.0
+        self._updated = 0
+        self._pixels = 0
+        self._resets = 0
+        return stats
+
+    def format(self, stats):
+        return "{} fusion {:.2f} ms/frame, {:.0%} of pixels updated, {} camera motion resets".format(
+            self.method, stats['ms_per_frame'], stats['updated_ratio'], stats['resets'])
+
+
+def _valid_median(samples):
+    # Median of the non-zero readings of each column of a (frames, pixels) array, 0 where a column has none
+    # Zeros are sorted to the end, then the middle one or two valid readings are averaged
+    # With a handful of frames an odd-even transposition network of element-wise min/max runs faster
+    # than np.sort along the short axis
+    invalid = np.iinfo(np.uint16).max
+    frames = len(samples)
+    if frames > NETWORK_MAX_FRAMES:
+        ordered = np.sort(np.where(samples > 0, samples, invalid).astype(np.uint16), axis=0)
+        count = np.count_nonzero(ordered < invalid, axis=0)
+        lower = np.take_along_axis(ordered, (np.maximum(count - 1, 0) // 2)[np.newaxis], axis=0)[0]
+        upper = np.take_along_axis(ordered, np.minimum(count // 2, frames - 1)[np.newaxis], axis=0)[0]
+    else:
+        rows = [np.where(row > 0, row, invalid).astype(np.uint16) for row in samples]
+        for step in range(frames):
+            for i in range(step % 2, frames - 1, 2):
+                rows[i], rows[i + 1] = np.minimum(rows[i], rows[i + 1]), np.maximum(rows[i], rows[i + 1])
+
+        count = np.zeros(len(rows[0]), dtype=np.intp)
+        for row in rows:
+            count += row < invalid
+        lower = np.choose(np.maximum(count - 1, 0) // 2, rows)
+        upper = np.choose(np.minimum(count // 2, frames - 1), rows)
+    return np.where(count > 0, (lower.astype(np.uint32) + upper) // 2, 0).astype(np.uint16)
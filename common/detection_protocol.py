@@ -0,0 +1,144 @@
+import struct
+from collections import namedtuple
+
+# Binary detection messages sent from the detector (Python 3) to the pipeline (Python 2.7).
+#
+# One datagram carries every object found in a frame: a fixed network-order header
+#   magic (2s), version (B), message type (B), record count (H), frame id (I),
+#   capture, decode, inference and send timestamps (4d)
+# followed by count records of
+#   class id (H), flags (H), score (f), box x1, y1, x2, y2 (4h), track id (I), velocity x, y (2f)
+#
+# The pipeline also pings the detector on the same channel to estimate the clock offset between them:
+#   magic (2s), version (B), message type (B), sequence (I), synced (B),
+#   t0 ping sent, t1 ping received, t2 pong sent (3d), current offset estimate (d)
+
+MAGIC = b'PD'
+VERSION = 1
+
+TYPE_DETECTIONS = 1
+TYPE_PING = 2
+TYPE_PONG = 3
+
+HEADER = struct.Struct('!2sBBHIdddd')
+SYNC = struct.Struct('!2sBBIBdddd')
+RECORD = struct.Struct('!HHf4hIff')
+MAX_DATAGRAM = 65507
+MAX_RECORDS = (MAX_DATAGRAM - HEADER.size) // RECORD.size
+
+# Record flags
+FLAG_DETECTED = 0x1  # Measured by the detector in this frame, not only predicted by the tracker
+
+UNKNOWN_CLASS = 0xFFFF
+
+# COCO class names in the order used by YOLOv8, MediaPipe's EfficientDet uses the same names
+CLASS_NAMES = (
+    'person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck', 'boat',
+    'traffic light', 'fire hydrant', 'stop sign', 'parking meter', 'bench', 'bird', 'cat', 'dog',
+    'horse', 'sheep', 'cow', 'elephant', 'bear', 'zebra', 'giraffe', 'backpack', 'umbrella',
+    'handbag', 'tie', 'suitcase', 'frisbee', 'skis', 'snowboard', 'sports ball', 'kite',
+    'baseball bat', 'baseball glove', 'skateboard', 'surfboard', 'tennis racket', 'bottle',
+    'wine glass', 'cup', 'fork', 'knife', 'spoon', 'bowl', 'banana', 'apple', 'sandwich', 'orange',
+    'broccoli', 'carrot', 'hot dog', 'pizza', 'donut', 'cake', 'chair', 'couch', 'potted plant',
+    'bed', 'dining table', 'toilet', 'tv', 'laptop', 'mouse', 'remote', 'keyboard', 'cell phone',
+    'microwave', 'oven', 'toaster', 'sink', 'refrigerator', 'book', 'clock', 'vase', 'scissors',
+    'teddy bear', 'hair drier', 'toothbrush',
+)
+_CLASS_IDS = dict((name, index) for index, name in enumerate(CLASS_NAMES))
+
+
+def class_id(name):
+    return _CLASS_IDS.get(name, UNKNOWN_CLASS)
+
+
+def class_name(class_id):
+    return CLASS_NAMES[class_id] if class_id < len(CLASS_NAMES) else 'unknown'
+
+
+class ObjectRecord(namedtuple('ObjectRecord', ['class_id', 'score', 'x1', 'y1', 'x2', 'y2',
+                                               'track_id', 'vx', 'vy', 'detected'])):
+    # One object of a frame, box in pixels, velocity in pixels per second, track id 0 when untracked
+    __slots__ = ()
+
+    @property
+    def category(self):
+        return class_name(self.class_id)
+
+    @property
+    def center(self):
+        return (self.x1 + self.x2) / 2.0, (self.y1 + self.y2) / 2.0
+
+
+SyncMessage = namedtuple('SyncMessage', ['message_type', 'sequence', 'synced', 't0', 't1', 't2', 'offset'])
+
+DetectionMessage = namedtuple('DetectionMessage', ['frame_id', 'capture_ts', 'decode_ts', 'inference_ts',
+                                                   'send_ts', 'records'])
+
+
+def encode_detections(frame_id, capture_ts, decode_ts, inference_ts, send_ts, records):
+    # Pack every object of one frame into a single datagram
+    if len(records) > MAX_RECORDS:
+        records = sorted(records, key=lambda r: r.score, reverse=True)[:MAX_RECORDS]
+
+    parts = [HEADER.pack(MAGIC, VERSION, TYPE_DETECTIONS, len(records), frame_id & 0xFFFFFFFF,
+                         capture_ts, decode_ts, inference_ts, send_ts)]
+    for r in records:
+        parts.append(RECORD.pack(r.class_id, FLAG_DETECTED if r.detected else 0, r.score,
+                                 _clamp(r.x1), _clamp(r.y1), _clamp(r.x2), _clamp(r.y2),
+                                 r.track_id & 0xFFFFFFFF, r.vx, r.vy))
+    return b''.join(parts)
+
+
+def message_type(data):
+    # Type of a datagram on the location channel, None when it is not one of ours
+    if len(data) < 4 or data[:2] != MAGIC:
+        return None
+    return struct.unpack_from('!B', data, 3)[0]
+
+
+def encode_ping(sequence, t0, offset=None):
+    # offset is the sender's current estimate, shared so the detector can correct its own metrics
+    synced = offset is not None
+    return SYNC.pack(MAGIC, VERSION, TYPE_PING, sequence & 0xFFFFFFFF, synced, t0, 0.0, 0.0,
+                     offset if synced else 0.0)
+
+
+def encode_pong(ping, t1, t2):
+    return SYNC.pack(MAGIC, VERSION, TYPE_PONG, ping.sequence, ping.synced, ping.t0, t1, t2, ping.offset)
+
+
+def decode_sync(data):
+    # Unpack a ping or pong, raises ValueError when it is not a valid message
+    if len(data) != SYNC.size:
+        raise ValueError("Sync message must be {} bytes, got {}".format(SYNC.size, len(data)))
+
+    magic, version, message_type, sequence, synced, t0, t1, t2, offset = SYNC.unpack(data)
+    if magic != MAGIC or version != VERSION or message_type not in (TYPE_PING, TYPE_PONG):
+        raise ValueError("Not a sync message")
+    return SyncMessage(message_type, sequence, bool(synced), t0, t1, t2, offset)
+
+
+def decode_detections(data):
+    # Unpack a detection datagram, raises ValueError when it is not a valid message
+    if len(data) < HEADER.size:
+        raise ValueError("Message too short ({} bytes)".format(len(data)))
+
+    magic, version, message_type, count, frame_id, capture_ts, decode_ts, inference_ts, send_ts = \
+        HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or message_type != TYPE_DETECTIONS:
+        raise ValueError("Not a detection message")
+    if len(data) != HEADER.size + count * RECORD.size:
+        raise ValueError("Message length does not match {} records".format(count))
+
+    records = []
+    for index in range(count):
+        class_id, flags, score, x1, y1, x2, y2, track_id, vx, vy = \
+            RECORD.unpack_from(data, HEADER.size + index * RECORD.size)
+        records.append(ObjectRecord(class_id, score, x1, y1, x2, y2, track_id, vx, vy,
+                                    bool(flags & FLAG_DETECTED)))
+
+    return DetectionMessage(frame_id, capture_ts, decode_ts, inference_ts, send_ts, records)
+
+
+def _clamp(value):
+    return max(-0x8000, min(0x7FFF, int(round(value))))
@@ -0,0 +1,157 @@
+import mmap
+import os
+import struct
+import numpy as np
+
+# Shared-memory ring buffer for passing raw frames between processes on the same host.
+# Written by the Python 2.7 pipeline and read by the Python 3 detector, so keep it 2/3 compatible.
+#
+# Layout:
+#   ring header (64 bytes): magic, version, slot count, slot size, latest frame id, latest slot
+#   slot header (64 bytes): frame id, capture timestamp, width, height, format, payload size
+#   slot payload (slot size bytes)
+
+MAGIC = b'PFRB'
+VERSION = 1
+
+# Pixel formats stored in the slot header
+FORMAT_BGR8 = 1
+FORMAT_DEPTH16 = 2
+
+_FORMATS = {
+    FORMAT_BGR8: (np.uint8, 3),
+    FORMAT_DEPTH16: (np.uint16, 1),
+}
+
+_RING_HEADER = struct.Struct('<4sIII')
+_LATEST = struct.Struct('<QI')
+_LATEST_OFFSET = _RING_HEADER.size
+_RING_HEADER_SIZE = 64
+
+_SLOT_HEADER = struct.Struct('<QdIIII')
+_SLOT_ID = struct.Struct('<Q')
+_SLOT_HEADER_SIZE = 64
+
+
+def ring_size(slot_count, slot_size):
+    # Total size of the mapped file
+    return _RING_HEADER_SIZE + slot_count * (_SLOT_HEADER_SIZE + slot_size)
+
+
+class FrameRingWriter(object):
+    def __init__(self, path, slot_count=8, slot_size=640 * 480 * 3):
+        # Create (or reset) the ring file and map it
+        self.path = path
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+        self.frame_id = 0
+
+        size = ring_size(slot_count, slot_size)
+        self._file = open(path, 'w+b')
+        self._file.truncate(size)
+        self._mm = mmap.mmap(self._file.fileno(), size)
+
+        _RING_HEADER.pack_into(self._mm, 0, MAGIC, VERSION, slot_count, slot_size)
+        _LATEST.pack_into(self._mm, _LATEST_OFFSET, 0, 0)
+
+    def _slot_offset(self, slot):
+        return _RING_HEADER_SIZE + slot * (_SLOT_HEADER_SIZE + self.slot_size)
+
+    def write(self, frame, timestamp, fmt=FORMAT_BGR8):
+        # Copy a frame into the next slot and publish it as the latest
+        frame = np.ascontiguousarray(frame)
+        if frame.nbytes > self.slot_size:
+            raise ValueError("Frame of {} bytes does not fit in {} byte slot".format(
+                frame.nbytes, self.slot_size))
+
+        height, width = frame.shape[:2]
+        self.frame_id += 1
+        slot = self.frame_id % self.slot_count
+        offset = self._slot_offset(slot)
+
+        # Invalidate the slot while the payload is being replaced
+        _SLOT_ID.pack_into(self._mm, offset, 0)
+
+        start = offset + _SLOT_HEADER_SIZE
+        self._mm[start:start + frame.nbytes] = frame.tobytes()
+        _SLOT_HEADER.pack_into(self._mm, offset, 0, timestamp, width, height, fmt, frame.nbytes)
+
+        # Frame id goes in last so readers never see a half written slot as valid
+        _SLOT_ID.pack_into(self._mm, offset, self.frame_id)
+        _LATEST.pack_into(self._mm, _LATEST_OFFSET, self.frame_id, slot)
+
+        return self.frame_id
+
+    def close(self):
+        try:
+            self._mm.close()
+            self._file.close()
+        except Exception:
+            pass
+
+
+class FrameRingReader(object):
+    def __init__(self, path):
+        # Map an existing ring file read-only
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < _RING_HEADER_SIZE:
+            self._file.close()
+            raise ValueError("Frame ring {} is not initialised".format(path))
+
+        self._mm = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+
+        magic, version, slot_count, slot_size = _RING_HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("Frame ring {} has unexpected header".format(path))
+        if size < ring_size(slot_count, slot_size):
+            self.close()
+            raise ValueError("Frame ring {} is truncated".format(path))
+
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+
+    def _slot_offset(self, slot):
+        return _RING_HEADER_SIZE + slot * (_SLOT_HEADER_SIZE + self.slot_size)
+
+    def latest_frame_id(self):
+        return _LATEST.unpack_from(self._mm, _LATEST_OFFSET)[0]
+
+    def read_latest(self, last_frame_id=0):
+        # Return (frame_id, timestamp, frame) for the newest frame, or None if nothing new.
+        # The frame is a read-only view into shared memory, valid while is_intact(frame_id) holds.
+        frame_id, slot = _LATEST.unpack_from(self._mm, _LATEST_OFFSET)
+        if frame_id == 0 or frame_id == last_frame_id:
+            return None
+
+        offset = self._slot_offset(slot)
+        slot_id, timestamp, width, height, fmt, size = _SLOT_HEADER.unpack_from(self._mm, offset)
+        if slot_id != frame_id or fmt not in _FORMATS:
+            # Producer lapped us while reading the header
+            return None
+
+        dtype, channels = _FORMATS[fmt]
+        count = size // np.dtype(dtype).itemsize
+        frame = np.frombuffer(self._mm, dtype=dtype, count=count,
+                              offset=offset + _SLOT_HEADER_SIZE)
+        if channels > 1:
+            frame = frame.reshape((height, width, channels))
+        else:
+            frame = frame.reshape((height, width))
+
+        return frame_id, timestamp, frame
+
+    def is_intact(self, frame_id):
+        # Check the slot holding frame_id has not been overwritten since it was read
+        offset = self._slot_offset(frame_id % self.slot_count)
+        return _SLOT_ID.unpack_from(self._mm, offset)[0] == frame_id
+
+    def close(self):
+        try:
+            self._mm.close()
+        except (BufferError, ValueError):
+            # Views handed out by read_latest are still alive, leave it to the GC
+            pass
+        self._file.close()
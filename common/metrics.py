@@ -0,0 +1,81 @@
+import time
+import threading
+from collections import deque
+
+# Lightweight counters shared by the pipeline (Python 2.7) and the detector (Python 3)
+
+
+class RateCounters(object):
+    def __init__(self, names, interval=1.0):
+        # Named event counters reported as per-second rates every interval
+        self.names = list(names)
+        self.interval = interval
+        self.totals = dict((name, 0) for name in self.names)
+        self._window = dict((name, 0) for name in self.names)
+        self._window_start = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, name, count=1):
+        with self._lock:
+            self.totals[name] += count
+            self._window[name] += count
+
+    def poll(self, now=None):
+        # Return {name: events per second} once per interval, otherwise None
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            elapsed = now - self._window_start
+            if elapsed < self.interval:
+                return None
+
+            rates = dict((name, self._window[name] / elapsed) for name in self.names)
+            self._window = dict((name, 0) for name in self.names)
+            self._window_start = now
+
+        return rates
+
+    def format(self, rates):
+        return ", ".join("{} {:.1f}/s".format(name, rates[name]) for name in self.names)
+
+
+class LatencyTracker(object):
+    def __init__(self, stages, window=500, interval=1.0):
+        # Rolling latency samples per pipeline stage, reported as percentiles every interval
+        self.stages = list(stages)
+        self.interval = interval
+        self._samples = dict((stage, deque(maxlen=window)) for stage in self.stages)
+        self._last_report = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples[stage].append(seconds)
+
+    def percentiles(self, stage, points=(50, 95, 99)):
+        # Nearest-rank percentiles in seconds, None when no samples yet
+        with self._lock:
+            samples = sorted(self._samples[stage])
+        if not samples:
+            return None
+        return dict((point, samples[min(len(samples) - 1, int(len(samples) * point / 100.0))])
+                    for point in points)
+
+    def poll(self, now=None):
+        # Return {stage: percentiles} once per interval, otherwise None
+        if now is None:
+            now = time.time()
+        if now - self._last_report < self.interval:
+            return None
+        self._last_report = now
+        return dict((stage, self.percentiles(stage)) for stage in self.stages)
+
+    def format(self, report):
+        parts = []
+        for stage in self.stages:
+            stats = report.get(stage)
+            if stats:
+                parts.append("{} p50 {:.1f} p95 {:.1f} p99 {:.1f} ms".format(
+                    stage, stats[50] * 1000, stats[95] * 1000, stats[99] * 1000))
+        return "; ".join(parts)
@@ -0,0 +1,88 @@
+import os
+import json
+import time
+import socket
+
+# Readiness signals between run_all.py and the processes it supervises (Python 2.7 and 3).
+#
+# The supervisor passes its UDP port in PEPPER_READY_PORT. Children send small JSON messages
+# such as {"name": "detector", "state": "ready"} to it, and the pipeline waits for a "start"
+# reply before streaming video. Without the variable every call is a no-op, so the scripts
+# still run on their own.
+
+READY_PORT_ENV = 'PEPPER_READY_PORT'
+
+
+class ReadinessNotifier(object):
+    def __init__(self, name):
+        port = os.environ.get(READY_PORT_ENV)
+        self.name = name
+        self.enabled = bool(port)
+        self.sock = None
+
+        if self.enabled:
+            self.address = ('127.0.0.1', int(port))
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.bind(('127.0.0.1', 0))
+
+    def notify(self, state, **fields):
+        # Report a state change such as 'ready' or 'first_detection' to the supervisor
+        if not self.enabled:
+            return
+        fields.update(name=self.name, state=state, ts=time.time(), pid=os.getpid())
+        try:
+            self.sock.sendto(json.dumps(fields).encode('utf-8'), self.address)
+        except socket.error:
+            pass
+
+    def wait_for_start(self, timeout=None, poll=0.5):
+        # Block until the supervisor sends 'start', True straight away when not supervised
+        if not self.enabled:
+            return True
+
+        deadline = None if timeout is None else time.time() + timeout
+        while deadline is None or time.time() < deadline:
+            self.sock.settimeout(poll)
+            try:
+                data, _ = self.sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            if _decode(data).get('state') == 'start':
+                return True
+        return False
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+
+
+class ReadinessListener(object):
+    def __init__(self, port=0):
+        # Supervisor side, children are told the port through READY_PORT_ENV
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', port))
+        self.port = self.sock.getsockname()[1]
+
+    def poll(self, timeout=0.5):
+        # Next (message, address) from a child, or None when nothing arrives in time
+        self.sock.settimeout(timeout)
+        try:
+            data, address = self.sock.recvfrom(4096)
+        except socket.timeout:
+            return None
+        message = _decode(data)
+        return (message, address) if message else None
+
+    def send_start(self, address):
+        self.sock.sendto(json.dumps({'state': 'start', 'ts': time.time()}).encode('utf-8'), address)
+
+    def close(self):
+        self.sock.close()
+
+
+def _decode(data):
+    try:
+        message = json.loads(data.decode('utf-8'))
+    except ValueError:
+        return {}
+    return message if isinstance(message, dict) else {}
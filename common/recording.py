@@ -0,0 +1,140 @@
+import os
+import struct
+import threading
+import numpy as np
+
+# Append-only recording of camera frames and odometry, shared by the pipeline and the tools.
+#
+# A recording is a directory with two files:
+#   data.bin   chunks of chunk header (magic, stream, payload size) followed by the raw array bytes
+#   index.bin  16 byte file header, then one fixed-size INDEX_DTYPE entry per chunk
+# The index can be memory-mapped as a numpy array and every payload read as a zero-copy view.
+# Chunks are written before their index entry, so a crash never leaves an entry without data.
+
+MAGIC = b'PREC'
+VERSION = 1
+
+STREAM_TOP = 1
+STREAM_DEPTH = 2
+STREAM_ODOMETRY = 3
+
+FILE_HEADER = struct.Struct('<4sI8x')
+CHUNK_HEADER = struct.Struct('<4sBxxxQ')
+
+INDEX_DTYPE = np.dtype([
+    ('stream', '<u1'), ('dtype', '<u1'), ('reserved', '<u2'),
+    ('height', '<u4'), ('width', '<u4'), ('channels', '<u4'),
+    ('timestamp', '<f8'), ('offset', '<u8'), ('size', '<u8'),
+])
+
+_DTYPES = {1: np.dtype('uint8'), 2: np.dtype('uint16'), 3: np.dtype('<f8'), 4: np.dtype('<f4')}
+_DTYPE_CODES = dict((dtype, code) for code, dtype in _DTYPES.items())
+
+
+class RecordingWriter(object):
+    def __init__(self, path):
+        # Start a new recording in directory path, or append to an existing one
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        index_path = os.path.join(path, 'index.bin')
+        new_index = not os.path.exists(index_path) or os.path.getsize(index_path) == 0
+
+        self.path = path
+        self._data = open(os.path.join(path, 'data.bin'), 'ab')
+        self._index = open(index_path, 'ab')
+        self._lock = threading.Lock()
+        self.count = 0
+
+        if new_index:
+            self._index.write(FILE_HEADER.pack(MAGIC, VERSION))
+
+    def write(self, stream, array, timestamp):
+        # Append one frame or sample, array is 1 to 3 dimensional
+        array = np.ascontiguousarray(array)
+        dtype = array.dtype.newbyteorder('<') if array.dtype.byteorder == '>' else array.dtype
+        code = _DTYPE_CODES.get(np.dtype(dtype))
+        if code is None:
+            raise ValueError("Cannot record arrays of type {}".format(array.dtype))
+
+        shape = array.shape + (1,) * (3 - array.ndim)
+        payload = array.astype(dtype, copy=False).tobytes()
+
+        entry = np.zeros(1, dtype=INDEX_DTYPE)
+        entry['stream'] = stream
+        entry['dtype'] = code
+        entry['height'], entry['width'], entry['channels'] = shape
+        entry['timestamp'] = timestamp
+        entry['size'] = len(payload)
+
+        with self._lock:
+            self._data.seek(0, os.SEEK_END)
+            entry['offset'] = self._data.tell() + CHUNK_HEADER.size
+            self._data.write(CHUNK_HEADER.pack(MAGIC, stream, len(payload)))
+            self._data.write(payload)
+            self._index.write(entry.tobytes())
+            self.count += 1
+
+    def flush(self):
+        with self._lock:
+            self._data.flush()
+            self._index.flush()
+
+    def close(self):
+        with self._lock:
+            self._data.close()
+            self._index.close()
+
+
+class RecordingReader(object):
+    def __init__(self, path):
+        # Memory-map a recording written by RecordingWriter
+        index_path = os.path.join(path, 'index.bin')
+        with open(index_path, 'rb') as f:
+            magic, version = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a recording".format(path))
+
+        self.path = path
+        count = (os.path.getsize(index_path) - FILE_HEADER.size) // INDEX_DTYPE.itemsize
+        data_path = os.path.join(path, 'data.bin')
+        if count:
+            self.index = np.memmap(index_path, dtype=INDEX_DTYPE, mode='r', offset=FILE_HEADER.size,
+                                   shape=(count,))
+            self._data = np.memmap(data_path, dtype=np.uint8, mode='r')
+        else:
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+            self._data = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def entries(self, stream=None):
+        # Positions of the entries of one stream (or all) in timestamp order
+        if stream is None:
+            positions = np.arange(len(self.index))
+        else:
+            positions = np.flatnonzero(self.index['stream'] == stream)
+        return positions[np.argsort(self.index['timestamp'][positions], kind='mergesort')]
+
+    def read(self, position):
+        # (array, timestamp) of one entry, the array is a read-only view into the file
+        entry = self.index[position]
+        dtype = _DTYPES[int(entry['dtype'])]
+        start = int(entry['offset'])
+        payload = self._data[start:start + int(entry['size'])]
+
+        shape = (int(entry['height']), int(entry['width']), int(entry['channels']))
+        while len(shape) > 1 and shape[-1] == 1:
+            shape = shape[:-1]
+        return payload.view(dtype).reshape(shape), float(entry['timestamp'])
+
+    def time_range(self):
+        if not len(self.index):
+            return None, None
+        timestamps = self.index['timestamp']
+        return float(timestamps.min()), float(timestamps.max())
+
+    def close(self):
+        self.index = None
+        self._data = None
@@ -0,0 +1,154 @@
+import random
+import struct
+import time
+from metrics import RateCounters
+
+# Fragmented UDP video protocol shared by the pipeline (Python 2.7) and the detector (Python 3).
+#
+# Every datagram carries a fixed network-order header followed by one chunk of the encoded frame:
+#   magic (2s), version (B), flags (B), session (I), frame id (I), chunk index (H), chunk count (H),
+#   capture timestamp (d)
+# The session is random per sender, so a receiver notices a restarted sender whose frame ids begin again at 1.
+
+MAGIC = b'PV'
+VERSION = 2
+
+HEADER = struct.Struct('!2sBBIIHHd')
+MAX_DATAGRAM = 65507
+MAX_CHUNK_SIZE = MAX_DATAGRAM - HEADER.size
+
+_FRAME_ID_MASK = 0xFFFFFFFF
+
+
+def _is_newer(frame_id, other_id):
+    # Frame id comparison that survives 32-bit wrap around
+    return frame_id != other_id and ((frame_id - other_id) & _FRAME_ID_MASK) < 0x80000000
+
+
+class FrameSender(object):
+    def __init__(self, sock, address, chunk_size=8192, stats_interval=5.0):
+        # Split encoded frames into numbered chunks and send them to address
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError("Chunk size must be between 1 and {}".format(MAX_CHUNK_SIZE))
+
+        self.sock = sock
+        self.address = address
+        self.chunk_size = chunk_size
+        self.session = random.getrandbits(32)
+        self.frame_id = 0
+        self.counters = RateCounters(('sent', 'chunks'), stats_interval)
+
+    def send(self, payload, timestamp):
+        # Send one encoded frame, returns its frame id
+        chunk_count = max(1, (len(payload) + self.chunk_size - 1) // self.chunk_size)
+        if chunk_count > 0xFFFF:
+            raise ValueError("Frame of {} bytes needs too many chunks".format(len(payload)))
+
+        self.frame_id = (self.frame_id + 1) & _FRAME_ID_MASK
+
+        for index in range(chunk_count):
+            chunk = payload[index * self.chunk_size:(index + 1) * self.chunk_size]
+            header = HEADER.pack(MAGIC, VERSION, 0, self.session, self.frame_id, index, chunk_count,
+                                 timestamp)
+            self.sock.sendto(header + chunk, self.address)
+
+        self.counters.add('sent')
+        self.counters.add('chunks', chunk_count)
+        return self.frame_id
+
+
+class _PartialFrame(object):
+    def __init__(self, timestamp, chunk_count, first_seen):
+        self.timestamp = timestamp
+        self.chunks = [None] * chunk_count
+        self.received = 0
+        self.first_seen = first_seen
+
+
+class FrameReassembler(object):
+    def __init__(self, max_pending=4, max_age=0.5, stats_interval=5.0):
+        # Rebuild frames from chunks, never waiting on a frame once a newer one completes
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.pending = {}
+        self.session = None
+        self.last_delivered = None
+        self._last_late = None
+        self._old_sessions = set()
+        self.counters = RateCounters(('reassembled', 'dropped', 'late', 'invalid', 'restarts'), stats_interval)
+
+    def add_packet(self, data, now=None):
+        # Feed one datagram, returns (frame_id, timestamp, payload) when a frame completes
+        if now is None:
+            now = time.time()
+
+        if len(data) < HEADER.size:
+            self.counters.add('invalid')
+            return None
+
+        magic, version, _, session, frame_id, index, chunk_count, timestamp = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION or chunk_count == 0 or index >= chunk_count:
+            self.counters.add('invalid')
+            return None
+
+        if session != self.session:
+            # Datagrams still in flight from a sender that has since restarted
+            if session in self._old_sessions:
+                self.counters.add('late')
+                return None
+            # A new sender numbers its frames from 1 again, forget the old one's frames
+            if self.session is not None:
+                self._old_sessions.add(self.session)
+                self.counters.add('restarts')
+            self.session = session
+            self.pending.clear()
+            self.last_delivered = None
+            self._last_late = None
+
+        # Chunks of frames older than the last delivered one are useless
+        if self.last_delivered is not None and not _is_newer(frame_id, self.last_delivered):
+            if frame_id != self._last_late:
+                self._last_late = frame_id
+                self.counters.add('late')
+            return None
+
+        partial = self.pending.get(frame_id)
+        if partial is None:
+            self._evict(now)
+            partial = _PartialFrame(timestamp, chunk_count, now)
+            self.pending[frame_id] = partial
+
+        if len(partial.chunks) != chunk_count:
+            self.counters.add('invalid')
+            return None
+
+        if partial.chunks[index] is None:
+            partial.chunks[index] = data[HEADER.size:]
+            partial.received += 1
+
+        if partial.received < chunk_count:
+            return None
+
+        del self.pending[frame_id]
+        self.last_delivered = frame_id
+        self.counters.add('reassembled')
+
+        # Anything older still incomplete can no longer be delivered
+        for pending_id in list(self.pending):
+            if _is_newer(frame_id, pending_id):
+                del self.pending[pending_id]
+                self.counters.add('dropped')
+
+        return frame_id, partial.timestamp, b''.join(partial.chunks)
+
+    def _evict(self, now):
+        # Drop incomplete frames that are too old or over the pending limit
+        for pending_id, partial in list(self.pending.items()):
+            if now - partial.first_seen > self.max_age:
+                del self.pending[pending_id]
+                self.counters.add('dropped')
+
+        while len(self.pending) >= self.max_pending:
+            oldest = min(self.pending, key=lambda pending_id: self.pending[pending_id].first_seen)
+            del self.pending[oldest]
+            self.counters.add('dropped')
@@ -0,0 +1,285 @@
+import os
+import time
+import threading
+import multiprocessing as mp
+from collections import deque
+from multiprocessing import shared_memory
+from queue import Empty
+import numpy as np
+
+MERGE_POLICIES = ("newest", "ordered")
+
+
+def _worker_main(index, generation, backend, options, shm_name, tasks, results, threads):
+    # Detector process: load the backend once, then run it on frames placed in shared memory
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    import cv2
+    cv2.setNumThreads(threads)
+    from detectors import create_detector
+    detector = create_detector(backend, threads=threads, **options)
+    detector.warm_up()
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    results.put(("ready", index, generation, None, None, 0.0))
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+
+            sequence, shape, dtype = task
+            frame = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+            start = time.perf_counter()
+            try:
+                detection = detector.detect(frame)
+            except Exception as e:
+                print(f"Error in detector worker {index}: {e}")
+                detection = []
+            busy = time.perf_counter() - start
+
+            del frame
+            results.put(("result", index, generation, sequence, detection, busy))
+    finally:
+        shm.close()
+
+
+class _Worker:
+    def __init__(self, index, shm):
+        self.index = index
+        self.shm = shm
+        self.process = None
+        self.tasks = None
+        self.generation = 0
+        self.restarts = 0
+        self.dead = False
+        self.ready = False
+        self.busy_time = 0.0
+        self.in_flight = None
+
+
+class DetectorPool:
+    def __init__(self, backend, workers, slot_size, merge_policy="newest", threads=None, stats_interval=5.0,
+                 options=None, max_restarts=3):
+        # Run the detector backend in separate processes, one frame slot of shared memory each
+        if merge_policy not in MERGE_POLICIES:
+            raise ValueError(f"Unknown merge policy {merge_policy}, expected one of {MERGE_POLICIES}")
+
+        # By default the CPU cores are split evenly between the workers
+        if not threads:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+
+        self.merge_policy = merge_policy
+        self.slot_size = slot_size
+        self.stats_interval = stats_interval
+        self.max_restarts = max_restarts
+        self.on_result = None
+
+        self._backend = backend
+        self._options = options or {}
+        self._threads = threads
+        self._context = mp.get_context("spawn")
+        self._results = self._context.Queue()
+        self._workers = []
+        for index in range(workers):
+            worker = _Worker(index, shared_memory.SharedMemory(create=True, size=slot_size))
+            self._start_worker(worker)
+            self._workers.append(worker)
+
+        self._condition = threading.Condition()
+        self._idle = deque()
+        self._sequence = 0
+        self._frame_info = {}
+        self._dispatched = deque()
+        self._finished = {}
+        self._last_emitted = 0
+        self._stats_start = time.time()
+        self.running = True
+
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _start_worker(self, worker):
+        # (Re)start the worker's process on its shared memory slot, with a fresh task queue
+        # The generation tells results of a dead process apart from those of its replacement
+        worker.generation += 1
+        worker.ready = False
+        worker.in_flight = None
+        worker.tasks = self._context.Queue()
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(worker.index, worker.generation, self._backend, self._options, worker.shm.name, worker.tasks,
+                  self._results, self._threads),
+            daemon=True,
+        )
+        worker.process.start()
+
+    def _check_alive(self):
+        # Called with the condition held
+        if all(worker.dead for worker in self._workers):
+            raise RuntimeError("Every detector worker has died")
+
+    def wait_idle(self, timeout=0.5):
+        # Block until a worker can take a frame
+        with self._condition:
+            self._check_alive()
+            if not self._idle and self.running:
+                self._condition.wait(timeout)
+            self._check_alive()
+            return bool(self._idle)
+
+    def submit(self, frame_id, frame, info):
+        # Copy frame into an idle worker's slot and start inference, False if all workers are busy
+        if frame.nbytes > self.slot_size:
+            raise ValueError(f"Frame of {frame.nbytes} bytes does not fit in {self.slot_size} byte slot")
+
+        with self._condition:
+            self._check_alive()
+            if not self._idle:
+                return False
+            worker = self._idle.popleft()
+            self._sequence += 1
+            sequence = self._sequence
+            worker.in_flight = sequence
+            self._frame_info[sequence] = (frame_id, info)
+            self._dispatched.append(sequence)
+
+        slot = np.ndarray(frame.shape, dtype=frame.dtype, buffer=worker.shm.buf)
+        np.copyto(slot, frame)
+        del slot
+        worker.tasks.put((sequence, frame.shape, frame.dtype.str))
+        return True
+
+    def _collect(self):
+        # Gather results from workers and release them according to the merge policy
+        while self.running:
+            # Checked every time round, results from the other workers would otherwise hide a dead one
+            emit = self._check_workers()
+            try:
+                kind, index, generation, sequence, detection, busy = self._results.get(timeout=0.5)
+            except Empty:
+                kind = None
+            except (EOFError, OSError):
+                break
+
+            worker = self._workers[index] if kind else None
+            with self._condition:
+                if worker is None or generation != worker.generation or worker.dead:
+                    # Nothing arrived, or a message from a process that has since been replaced
+                    pass
+                elif kind == "ready":
+                    worker.ready = True
+                    print(f"Detector worker {index} ready")
+                    self._idle.append(worker)
+                    self._condition.notify()
+                else:
+                    worker.busy_time += busy
+                    worker.in_flight = None
+                    if sequence in self._frame_info:
+                        emit += self._merge(sequence, detection)
+                    self._idle.append(worker)
+                    self._condition.notify()
+
+            self._emit(emit)
+
+    def _emit(self, emit):
+        for info, detection, done_ts in emit:
+            if self.on_result:
+                self.on_result(info, detection, done_ts)
+
+    def _merge(self, sequence, detection):
+        # Decide which finished results to hand on, called with the condition held
+        done_ts = time.time()
+
+        if self.merge_policy == "newest":
+            self._dispatched.remove(sequence)
+            _, info = self._frame_info.pop(sequence)
+            if sequence < self._last_emitted:
+                # A newer frame has already been reported
+                return []
+            self._last_emitted = sequence
+            return [(info, detection, done_ts)]
+
+        # In order: hold results until everything dispatched before them has finished
+        self._finished[sequence] = (detection, done_ts)
+        return self._release_ordered()
+
+    def _release_ordered(self):
+        # Results at the head of the dispatch order that can be handed on, called with the condition held
+        emit = []
+        while self._dispatched and self._dispatched[0] in self._finished:
+            head = self._dispatched.popleft()
+            detection, done_ts = self._finished.pop(head)
+            _, info = self._frame_info.pop(head)
+            emit.append((info, detection, done_ts))
+        return emit
+
+    def _check_workers(self):
+        # Restart workers that have died, busy or idle, and forget the frame they held
+        # Returns the ordered results that were only waiting on that frame
+        emit = []
+        died = False
+        with self._condition:
+            for worker in self._workers:
+                if worker.dead or worker.process.is_alive():
+                    continue
+
+                died = True
+                print(f"Detector worker {worker.index} exited with code {worker.process.exitcode}")
+                if worker in self._idle:
+                    self._idle.remove(worker)
+                if worker.in_flight is not None:
+                    if worker.in_flight in self._dispatched:
+                        self._dispatched.remove(worker.in_flight)
+                    self._frame_info.pop(worker.in_flight, None)
+                    if self.merge_policy == "ordered":
+                        emit += self._release_ordered()
+
+                if worker.restarts < self.max_restarts and self.running:
+                    worker.restarts += 1
+                    print(f"Restarting detector worker {worker.index} ({worker.restarts}/{self.max_restarts})")
+                    self._start_worker(worker)
+                else:
+                    worker.dead = True
+                    worker.in_flight = None
+                    print(f"Detector worker {worker.index} restarted too often, giving up on it")
+            if died:
+                # Wake wait_idle() so it notices when no worker is left
+                self._condition.notify_all()
+        return emit
+
+    def poll_stats(self):
+        # Per-worker utilisation (busy time / wall time) once per interval, otherwise None
+        now = time.time()
+        elapsed = now - self._stats_start
+        if elapsed < self.stats_interval:
+            return None
+
+        with self._condition:
+            usage = [worker.busy_time / elapsed for worker in self._workers]
+            for worker in self._workers:
+                worker.busy_time = 0.0
+            self._stats_start = now
+            restarts = sum(worker.restarts for worker in self._workers)
+            dead = sum(worker.dead for worker in self._workers)
+
+        report = ", ".join(f"worker {index} {100 * busy:.0f}%" for index, busy in enumerate(usage))
+        if restarts or dead:
+            report += f" ({restarts} restarts, {dead} of {len(self._workers)} workers dead)"
+        return report
+
+    def close(self):
+        self.running = False
+        with self._condition:
+            self._condition.notify_all()
+
+        for worker in self._workers:
+            if not worker.dead:
+                worker.tasks.put(None)
+        for worker in self._workers:
+            worker.process.join(2.0)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.shm.close()
+            worker.shm.unlink()
@@ -0,0 +1,54 @@
+import importlib
+from collections import namedtuple
+import numpy as np
+
+# Objects to detect
+ALLOWED_OBJECTS = {'bottle', 'cup', 'remote'}
+
+# Common result type for every backend, box corners in pixels of the input frame
+Detection = namedtuple("Detection", ["x1", "y1", "x2", "y2", "category", "score"])
+
+def detection_label(detection):
+    return f"{detection.category} {int(detection.score * 100)}%"
+
+class Detector:
+    name = None
+
+    def __init__(self, score_threshold=0.5, allowed_objects=ALLOWED_OBJECTS, threads=None):
+        # Base for detector backends, subclasses load their model and set input_size (width, height)
+        self.score_threshold = score_threshold
+        self.allowed_objects = set(allowed_objects)
+        self.threads = threads
+        self.input_size = (640, 640)
+
+    def detect(self, frame):
+        # Return a list of Detection for allowed objects in a BGR frame
+        raise NotImplementedError
+
+    def warm_up(self, runs=2):
+        # Run a few blank frames through the model so the first real frame is not slow
+        width, height = self.input_size
+        blank = np.zeros((height, width, 3), dtype=np.uint8)
+        for _ in range(runs):
+            self.detect(blank)
+
+# Backends are imported only when selected, so their libraries stay optional
+_REGISTRY = {}
+
+def register_detector(name, target):
+    # target is "module:ClassName" of a Detector subclass
+    _REGISTRY[name] = target
+
+def available_detectors():
+    return sorted(_REGISTRY)
+
+def create_detector(name, **options):
+    if name not in _REGISTRY:
+        raise ValueError(f"Unknown detector {name}, expected one of {available_detectors()}")
+    module_name, class_name = _REGISTRY[name].split(":")
+    detector_class = getattr(importlib.import_module(module_name), class_name)
+    return detector_class(**options)
+
+register_detector("yolo", "yolo_recognition:YoloDetector")
+register_detector("mediapipe", "mediapipe_recognition:MediaPipeDetector")
+register_detector("onnx", "onnx_recognition:OnnxYoloDetector")
@@ -0,0 +1,63 @@
+import os
+import argparse
+import cv2
+import numpy as np
+
+# Export the YOLOv8 model to ONNX for the 'onnx' detector backend, optionally quantised to INT8
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+def export(weights, image_size, opset):
+    from ultralytics import YOLO
+    return YOLO(weights).export(format="onnx", imgsz=image_size, opset=opset, simplify=True, dynamic=False)
+
+def quantize_dynamic(model_path, output_path):
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(model_path, output_path, weight_type=QuantType.QUInt8)
+
+class CalibrationImages:
+    def __init__(self, model_path, image_dir, limit=100):
+        # Feeds letterboxed images to the static quantiser, as the detector would see them
+        from onnx_recognition import OnnxYoloDetector
+        self.detector = OnnxYoloDetector(model_path=model_path)
+
+        paths = sorted(os.path.join(image_dir, name) for name in os.listdir(image_dir)
+                       if name.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")))
+        self.paths = iter(paths[:limit])
+
+    def get_next(self):
+        for path in self.paths:
+            image = cv2.imread(path)
+            if image is not None:
+                blob = self.detector._letterbox(image)[0]
+                return {self.detector.input_name: blob.astype(np.float32)}
+        return None
+
+def quantize_static(model_path, output_path, image_dir):
+    from onnxruntime.quantization import quantize_static, QuantFormat, QuantType
+    quantize_static(model_path, output_path, CalibrationImages(model_path, image_dir),
+                    quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8)
+
+def main():
+    parser = argparse.ArgumentParser(description="Export YOLOv8 to ONNX for the onnx detector backend")
+    parser.add_argument("--weights", default=os.path.join(script_dir, "yolov8n.pt"))
+    parser.add_argument("--image-size", type=int, default=640)
+    parser.add_argument("--opset", type=int, default=12)
+    parser.add_argument("--int8", action="store_true", help="also write an INT8 quantised model")
+    parser.add_argument("--calibration-dir", default=None,
+                        help="images for static INT8 quantisation, dynamic quantisation is used without it")
+    args = parser.parse_args()
+
+    model_path = export(args.weights, args.image_size, args.opset)
+    print(f"Exported {model_path}")
+
+    if args.int8:
+        output_path = os.path.splitext(model_path)[0] + "_int8.onnx"
+        if args.calibration_dir:
+            quantize_static(model_path, output_path, args.calibration_dir)
+        else:
+            quantize_dynamic(model_path, output_path)
+        print(f"Quantised model written to {output_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import threading
+from metrics import RateCounters
+
+class LatestFrameScheduler:
+    def __init__(self, stats_interval=5.0):
+        # Single slot hand-off between the frame receiver and the detector, newest frame wins
+        self._condition = threading.Condition()
+        self._pending = None
+        self._last_frame_id = None
+        self.counters = RateCounters(("arrived", "inferred", "shed"), stats_interval)
+
+    def submit(self, frame_id, frame, info):
+        # Offer a new frame, replacing one that is still waiting for the detector
+        with self._condition:
+            if frame_id == self._last_frame_id:
+                return
+            self._last_frame_id = frame_id
+
+            if self._pending is not None:
+                self.counters.add("shed")
+            self._pending = (frame_id, frame, info)
+            self.counters.add("arrived")
+            self._condition.notify()
+
+    def next_frame(self, timeout=0.5):
+        # Take the newest frame not yet handed out, or None if nothing arrives in time
+        with self._condition:
+            if self._pending is None:
+                self._condition.wait(timeout)
+            pending, self._pending = self._pending, None
+        return pending
+
+    def frame_done(self):
+        # Mark one inference as completed
+        self.counters.add("inferred")
+
+    def poll_stats(self):
+        # Arrival vs inference fps once per interval, otherwise None
+        rates = self.counters.poll()
+        if rates is None:
+            return None
+        shed_percent = 100.0 * rates["shed"] / rates["arrived"] if rates["arrived"] else 0.0
+        return f"{self.counters.format(rates)} ({shed_percent:.0f}% shed)"
@@ -1,10 +1,11 @@
 import os
 import cv2
 import mediapipe as mp
+from detectors import Detector, Detection
 
 # Path to mediapipe model
 script_dir = os.path.dirname(os.path.abspath(__file__))
-model_path = os.path.join(script_dir, "efficientdet_lite0.tflite")
+default_model_path = os.path.join(script_dir, "efficientdet_lite0.tflite")
 
 # Set up mediapipe model
 BaseOptions = mp.tasks.BaseOptions
@@ -12,55 +13,47 @@ ObjectDetector = mp.tasks.vision.ObjectDetector
 objectDetectorOptions = mp.tasks.vision.ObjectDetectorOptions
 VisionRunningMode = mp.tasks.vision.RunningMode
 
-# Objects to detect
-ALLOWED_OBJECTS = {'bottle', 'cup', 'remote'}
+class MediaPipeDetector(Detector):
+    name = "mediapipe"
 
-options = objectDetectorOptions(
-    base_options = BaseOptions(model_asset_path=model_path),
-    running_mode = VisionRunningMode.IMAGE,
-    max_results=5,
-    score_threshold=0.5,
-)
+    def __init__(self, model_path=None, max_results=5, **options):
+        super().__init__(**options)
 
-detector = ObjectDetector.create_from_options(options)
+        detector_options = objectDetectorOptions(
+            base_options = BaseOptions(model_asset_path=model_path or default_model_path),
+            running_mode = VisionRunningMode.IMAGE,
+            max_results=max_results,
+            score_threshold=self.score_threshold,
+        )
 
-def process_frame(frame):
-    try:
-        if frame is None:
-            print("Error: Received empty frame.")
-            return None
-        
-        mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame)
-        result = detector.detect(mp_image)
+        self.detector = ObjectDetector.create_from_options(detector_options)
 
-        obj = None
-        object_center = None
+        # EfficientDet-Lite0 input resolution
+        self.input_size = (320, 320)
 
-        for detection in result.detections:
-            category = detection.categories[0].category_name
+    def detect(self, frame):
+        detections = []
 
-            if category in ALLOWED_OBJECTS:
-                bbox = detection.bounding_box
-                x, y, w, h = int(bbox.origin_x), int(bbox.origin_y), int(bbox.width), int(bbox.height)
+        try:
+            if frame is None:
+                print("Error: Received empty frame.")
+                return detections
 
-                category_info = detection.categories[0]
-                score_percent = int(category_info.score * 100)
-                label = f"{category} {score_percent}%"
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                cv2.putText(frame, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-                # Calculate object center
-                x_cen = x + w // 2
-                y_cen = y + h // 2
-                object_center = (x_cen, y_cen)
-                obj = category
+            # MediaPipe expects RGB, frames arrive as OpenCV BGR
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            mp_image = mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_frame)
+            result = self.detector.detect(mp_image)
 
-        cv2.imshow('Pepper Camera Feed', frame)
-        cv2.waitKey(1) 
-
-        return object_center, obj
+            for detection in result.detections:
+                category_info = detection.categories[0]
+                category = category_info.category_name
 
-    except Exception as e:
-        print(f"Error processing frame: {e}")
+                if category in self.allowed_objects:
+                    bbox = detection.bounding_box
+                    x, y, w, h = int(bbox.origin_x), int(bbox.origin_y), int(bbox.width), int(bbox.height)
+                    detections.append(Detection(x, y, x + w, y + h, category, float(category_info.score)))
 
+        except Exception as e:
+            print(f"Error processing frame: {e}")
 
+        return detections
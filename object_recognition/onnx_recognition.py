@@ -0,0 +1,105 @@
+import os
+import ast
+import cv2
+import numpy as np
+import onnxruntime as ort
+from detectors import Detector, Detection
+
+# Path to the exported YOLOv8 model, see export_onnx.py
+script_dir = os.path.dirname(os.path.abspath(__file__))
+default_model_path = os.path.join(script_dir, "yolov8n.onnx")
+
+class OnnxYoloDetector(Detector):
+    name = "onnx"
+
+    def __init__(self, model_path=None, iou_threshold=0.45, **options):
+        super().__init__(**options)
+        self.iou_threshold = iou_threshold
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            session_options.intra_op_num_threads = self.threads
+            session_options.inter_op_num_threads = 1
+
+        self.session = ort.InferenceSession(model_path or default_model_path, session_options,
+                                            providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        height, width = model_input.shape[2:4]
+        self.input_size = (width if isinstance(width, int) else 640, height if isinstance(height, int) else 640)
+
+        # Ultralytics stores class names in the model metadata as a dict literal
+        names = self.session.get_modelmeta().custom_metadata_map.get("names")
+        self.class_names = ast.literal_eval(names) if names else {}
+        self.allowed_ids = np.array(sorted(class_id for class_id, name in self.class_names.items()
+                                           if name in self.allowed_objects), dtype=np.int64)
+
+    def _letterbox(self, frame):
+        # Resize keeping aspect ratio and pad to the model input size
+        input_width, input_height = self.input_size
+        height, width = frame.shape[:2]
+        scale = min(input_width / width, input_height / height)
+        resized_width, resized_height = int(round(width * scale)), int(round(height * scale))
+        pad_x = (input_width - resized_width) // 2
+        pad_y = (input_height - resized_height) // 2
+
+        padded = np.full((input_height, input_width, 3), 114, dtype=np.uint8)
+        padded[pad_y:pad_y + resized_height, pad_x:pad_x + resized_width] = cv2.resize(
+            frame, (resized_width, resized_height), interpolation=cv2.INTER_LINEAR)
+
+        blob = cv2.dnn.blobFromImage(padded, 1.0 / 255, swapRB=True)
+        return blob, scale, pad_x, pad_y
+
+    def detect(self, frame):
+        detections = []
+
+        try:
+            if frame is None:
+                print("Error: Received empty frame.")
+                return detections
+
+            blob, scale, pad_x, pad_y = self._letterbox(frame)
+
+            # Output is (1, 4 + classes, anchors) with boxes as centre x, centre y, width, height
+            predictions = self.session.run(None, {self.input_name: blob})[0][0].T
+
+            class_scores = predictions[:, 4:]
+            if len(self.allowed_ids):
+                class_scores = class_scores[:, self.allowed_ids]
+            best = class_scores.argmax(axis=1)
+            scores = class_scores[np.arange(len(best)), best]
+
+            keep = scores > self.score_threshold
+            if not keep.any():
+                return detections
+
+            class_ids = self.allowed_ids[best[keep]] if len(self.allowed_ids) else best[keep]
+            scores = scores[keep]
+            centre_x, centre_y, box_w, box_h = predictions[keep, :4].T
+
+            # Undo the letterbox transform
+            x1 = (centre_x - box_w / 2 - pad_x) / scale
+            y1 = (centre_y - box_h / 2 - pad_y) / scale
+            widths = box_w / scale
+            heights = box_h / scale
+
+            # Per-class non-maximum suppression by offsetting boxes of different classes
+            offset = class_ids * 4096.0
+            nms_boxes = np.stack([x1 + offset, y1, widths, heights], axis=1).tolist()
+            indices = cv2.dnn.NMSBoxes(nms_boxes, scores.tolist(), self.score_threshold, self.iou_threshold)
+
+            height, width = frame.shape[:2]
+            for index in np.array(indices).reshape(-1):
+                detections.append(Detection(
+                    int(max(0, x1[index])), int(max(0, y1[index])),
+                    int(min(width - 1, x1[index] + widths[index])), int(min(height - 1, y1[index] + heights[index])),
+                    self.class_names.get(int(class_ids[index]), str(class_ids[index])),
+                    float(scores[index]),
+                ))
+
+        except Exception as e:
+            print(f"Error processing frame: {e}")
+
+        return detections
@@ -0,0 +1,120 @@
+import time
+import cv2
+from metrics import RateCounters
+from detectors import Detector, Detection
+
+class RoiDetector(Detector):
+    def __init__(self, detector, refresh_interval=10, expansion=2.0, min_score=0.6, stats_interval=5.0):
+        # Wrap a detector so a confidently found object is followed by running on a crop around it
+        super().__init__(detector.score_threshold, detector.allowed_objects, detector.threads)
+        self.detector = detector
+        self.input_size = detector.input_size
+        self.refresh_interval = refresh_interval
+        self.expansion = expansion
+        self.min_score = min_score
+
+        # Last confident detection and ROI passes since the last full frame
+        self._track = None
+        self._since_full = 0
+
+        self.counters = RateCounters(("full", "roi", "lost"), stats_interval)
+        self._pass_time = {"full": 0.0, "roi": 0.0}
+
+    def detect(self, frame):
+        # No ROI attempt when the crop around the track would not be smaller than the frame
+        region = None
+        if self._track is not None and self._since_full < self.refresh_interval:
+            region = self._region(frame)
+
+        if region is not None:
+            start = time.perf_counter()
+            detections = self._detect_roi(frame, region)
+            if detections is not None:
+                self._count("roi", start)
+                return detections
+
+            # Track lost inside the crop, look at the whole frame again
+            self._pass_time["roi"] += time.perf_counter() - start
+            self.counters.add("lost")
+
+        start = time.perf_counter()
+        detections = self.detector.detect(frame)
+        self._since_full = 0
+        self._track = self._best(detections)
+        self._count("full", start)
+        return detections
+
+    def _count(self, kind, start):
+        self._pass_time[kind] += time.perf_counter() - start
+        self.counters.add(kind)
+
+    def _best(self, detections, category=None):
+        # Most confident detection worth tracking, optionally of one category
+        candidates = [d for d in detections
+                      if d.score >= self.min_score and (category is None or d.category == category)]
+        return max(candidates, key=lambda d: d.score) if candidates else None
+
+    def _region(self, frame):
+        # Expanded box around the track with the model's aspect ratio, shifted to stay inside the frame,
+        # None when it would cover the whole frame width or height
+        frame_height, frame_width = frame.shape[:2]
+        input_width, input_height = self.input_size
+        track = self._track
+
+        width = (track.x2 - track.x1) * self.expansion
+        height = (track.y2 - track.y1) * self.expansion
+        if width * input_height > height * input_width:
+            height = width * input_height / input_width
+        else:
+            width = height * input_width / input_height
+
+        width, height = int(round(width)), int(round(height))
+        if width >= frame_width or height >= frame_height:
+            return None
+
+        x0 = min(max(0, (track.x1 + track.x2 - width) // 2), frame_width - width)
+        y0 = min(max(0, (track.y1 + track.y2 - height) // 2), frame_height - height)
+        return x0, y0, width, height
+
+    def _detect_roi(self, frame, region):
+        # Detections in frame coordinates, or None when the tracked object is not found
+        x0, y0, width, height = region
+        input_width, input_height = self.input_size
+        crop = cv2.resize(frame[y0:y0 + height, x0:x0 + width], (input_width, input_height),
+                          interpolation=cv2.INTER_LINEAR)
+
+        scale_x = width / input_width
+        scale_y = height / input_height
+        detections = [Detection(int(d.x1 * scale_x) + x0, int(d.y1 * scale_y) + y0,
+                                int(d.x2 * scale_x) + x0, int(d.y2 * scale_y) + y0, d.category, d.score)
+                      for d in self.detector.detect(crop)]
+
+        track = self._best(detections, self._track.category)
+        if track is None:
+            self._track = None
+            return None
+
+        self._track = track
+        self._since_full += 1
+        return detections
+
+    def poll_stats(self):
+        # Share of frames served by ROI passes and the speed-up over full frames, once per interval
+        rates = self.counters.poll()
+        if rates is None:
+            return None
+
+        total = rates["full"] + rates["roi"]
+        if not total:
+            return None
+
+        full_time, roi_time = self._pass_time["full"], self._pass_time["roi"]
+        self._pass_time = {"full": 0.0, "roi": 0.0}
+
+        report = f"{self.counters.format(rates)} ({100.0 * rates['roi'] / total:.0f}% ROI"
+        if rates["full"] and rates["roi"]:
+            # Frames per second relative to running every frame at full size
+            full_mean = full_time / rates["full"]
+            mean = (full_time + roi_time) / total
+            report += f", {full_mean / mean:.2f}x fps"
+        return report + ")"
@@ -1,99 +1,380 @@
+import os
+import sys
 import cv2
 import numpy as np
 import socket 
 import threading
-import struct
 import time
-# from mediapipe_recognition import process_frame
-from yolo_recognition import process_frame
+
+# Share settings and transport modules with the robot pipeline
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(base_dir, os.pardir, "pepper_pipeline"))
+sys.path.append(os.path.join(base_dir, os.pardir, "common"))
+from config import (SERVER_IP, VIDEO_PORT, LOCATION_PORT, VIDEO_TRANSPORT, FRAME_RING_PATH,
+                    FRAME_RING_SLOT_SIZE, STATS_INTERVAL, DETECTOR_BACKEND, DETECTOR_WORKERS,
+                    DETECTOR_THREADS, DETECTOR_MERGE_POLICY, DETECTOR_MODEL,
+                    DETECTOR_SCORE_THRESHOLD, ROI_ENABLED, ROI_REFRESH_INTERVAL, ROI_EXPANSION,
+                    ROI_MIN_SCORE, TRACKER_ENABLED, TRACKER_OPTICAL_FLOW, TRACKER_IOU_THRESHOLD,
+                    TRACKER_MAX_AGE, DETECTOR_HEADLESS,
+                    VISUALISER_MAX_FPS, VISUALISER_OUTPUT)
+from frame_ring import FrameRingReader
+from video_protocol import FrameReassembler
+from detection_protocol import (ObjectRecord, class_id, encode_detections, encode_pong, decode_sync,
+                                message_type, TYPE_PING)
+from metrics import LatencyTracker
+from frame_scheduler import LatestFrameScheduler
+from detectors import create_detector, detection_label
+from detector_pool import DetectorPool
+from roi_tracker import RoiDetector
+from tracker import ObjectTracker
+from visualiser import Visualiser
+from readiness import ReadinessNotifier
 
 stop_event = threading.Event()
 
-# Socket for live video feed
-video_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-video_sock.bind(('127.0.0.1', 8089))
+# Sockets are created in main() so detector worker processes can import this module safely
+video_sock = None
+location_sock = None
+
+# Offset of this clock from the pipeline's, as estimated and shared by the pipeline's pings
+clock_offset = 0.0
+
+# Shared-memory frame ring (opened once the pipeline has created it)
+frame_ring = None
+
+# Detector backend, either loaded in this process or in a pool of worker processes
+detector = None
+detector_pool = None
+
+# Optional tracker sending smoothed positions for every frame between detector runs
+tracker = None
 
-# socket to send object loaction
-location_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+# Optional annotated output, rendered off the detection path
+visualiser = None
 
-latest_frame = None
-lock = threading.Lock()
+# Hands the newest received frame to the detector, shedding frames that arrive while it is busy
+scheduler = LatestFrameScheduler(STATS_INTERVAL)
+
+# Tells run_all.py when the model is loaded and when the first detection goes out
+# Created in main(), like the sockets, so worker processes importing this module do not bind one each
+readiness = None
+first_detection_sent = False
+
+# Detector side latency stages, the pipeline tracks the full capture to motion chain
+latency = LatencyTracker(("capture->decode", "decode->inference"), interval=STATS_INTERVAL)
 
 def get_frames():
-    global latest_frame
-    while True:
+    reassembler = FrameReassembler(stats_interval=STATS_INTERVAL)
+    while not stop_event.is_set():
         try:
             data, _ = video_sock.recvfrom(65536)
-            size = struct.unpack("L", data[:4])[0]
-            frame_data = data[4:size+4]
 
+            # Incomplete and stale frames are dropped by the reassembler
+            result = reassembler.add_packet(data)
+
+            rates = reassembler.counters.poll()
+            if rates:
+                print(f"Video stream: {reassembler.counters.format(rates)}")
+
+            if result is None:
+                continue
+
+            frame_id, capture_ts, frame_data = result
             frame = cv2.imdecode(np.frombuffer(frame_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            decode_ts = time.time()
 
             if frame is None or frame.size == 0:
                 print("Error: Received empty frame.")
                 continue
 
-            with lock:
-                latest_frame = frame  
+            # Frame info is (frame id, NAOqi capture timestamp, decode timestamp)
+            frame_info = (frame_id, capture_ts, decode_ts)
+            scheduler.submit(frame_id, frame, frame_info)
 
+            if tracker:
+                track_frame(frame, frame_info)
+
+        except socket.timeout:
+            continue
         except Exception as e:
             print(f"Error receiving frame: {e}")
 
+def get_frames_shm():
+    global frame_ring
+    last_frame_id = 0
+    while not stop_event.is_set():
+        try:
+            if frame_ring is None:
+                # Wait for the pipeline to create the ring
+                if not os.path.exists(FRAME_RING_PATH):
+                    time.sleep(0.5)
+                    continue
+                frame_ring = FrameRingReader(FRAME_RING_PATH)
+                print(f"Reading frames from shared memory at {FRAME_RING_PATH}")
+
+            result = frame_ring.read_latest(last_frame_id)
+            if result is None:
+                time.sleep(0.002)
+                continue
+
+            # Zero-copy view into the ring, copied by process_frames
+            last_frame_id, capture_ts, frame = result
+            frame_info = (last_frame_id, capture_ts, time.time())
+            scheduler.submit(last_frame_id, frame, frame_info)
+
+            if tracker:
+                # Copied like next_intact_frame() does, the pipeline may be overwriting the slot
+                tracked_frame = frame.copy()
+                if frame_ring.is_intact(last_frame_id):
+                    track_frame(tracked_frame, frame_info)
+
+        except Exception as e:
+            print(f"Error reading frame ring: {e}")
+            time.sleep(0.5)
+
 def process_frames():
-    global latest_frame
     while not stop_event.is_set():
-        frame = None
-        with lock:
-            if latest_frame is not None:
-                frame = latest_frame.copy()
-            else:
-                time.sleep(0.1)
-                continue  
+        # Newest frame not yet processed, anything older has already been shed
+        pending = next_intact_frame()
+        if pending is None:
+            continue
+
+        frame, frame_info = pending
+
+        try:
+            # Get the allowed objects found in the frame
+            detections = detector.detect(frame)
+        except Exception as e:
+            print(f"Error in detector: {e}") 
+            continue
+
+        handle_detection(frame_info, detections, time.time(), frame)
+
+def dispatch_frames():
+    # Feed the newest frame to whichever detector worker becomes idle first
+    while not stop_event.is_set():
+        try:
+            if not detector_pool.wait_idle():
+                continue
+        except RuntimeError as e:
+            # No worker left to restart, stop rather than silently detecting nothing
+            print(f"Detector pool failed: {e}")
+            stop_event.set()
+            break
+
+        pending = next_intact_frame()
+        if pending is None:
+            continue
+
+        # Keep the frame with its info only when it will be drawn later
+        frame, frame_info = pending
+        detector_pool.submit(frame_info[0], frame, (frame_info, frame if visualiser else None))
+
+def next_intact_frame():
+    # Take the next frame from the scheduler, returns (frame, frame_info) or None
+    pending = scheduler.next_frame()
+    if pending is None:
+        return None
+
+    frame_id, frame, frame_info = pending
 
-        # Get the object category and center co-ordinate
-        object_center, category = process_frame(frame) 
+    if frame_ring is not None:
+        # Copy out of shared memory and discard frames the pipeline overwrote meanwhile
+        frame = frame.copy()
+        if not frame_ring.is_intact(frame_id):
+            return None
 
-        if object_center:
-            x_cen, y_cen = object_center
-            send_object_location(x_cen, y_cen, category)
+    return frame, frame_info
 
-        if frame is not None:
-            try:
-                process_frame(frame)
-            except Exception as e:
-                print(f"Error in process_frame: {e}") 
+def track_frame(frame, frame_info):
+    # Predict tracked objects on every received frame and send them
+    tracked = tracker.step(frame, frame_info[1], frame_info)
+    if tracked:
+        send_objects([tracked_record(t) for t in tracked], frame_info, time.time())
 
+def detection_record(d):
+    return ObjectRecord(class_id(d.category), d.score, d.x1, d.y1, d.x2, d.y2, 0, 0.0, 0.0, True)
 
-def send_object_location(x_cen, y_cen, category):
+def tracked_record(t):
+    return ObjectRecord(class_id(t.category), t.score, t.x - t.w / 2, t.y - t.h / 2, t.x + t.w / 2,
+                        t.y + t.h / 2, t.track_id, t.vx, t.vy, t.detected)
+
+def handle_pool_result(info, detections, inference_ts):
+    frame_info, frame = info
+    handle_detection(frame_info, detections, inference_ts, frame)
+
+def handle_detection(frame_info, detections, inference_ts, frame=None):
+    # Record timing of a finished inference and forward any detected object
+    scheduler.frame_done()
+
+    # NAOqi capture timestamps assume the robot clock is synced with the pipeline host
+    _, capture_ts, decode_ts = frame_info
+    latency.record("capture->decode", decode_ts - clock_offset - capture_ts)
+    latency.record("decode->inference", inference_ts - decode_ts)
+
+    report = latency.poll()
+    if report:
+        print(f"Detector latency: {latency.format(report)}")
+
+    stats = scheduler.poll_stats()
+    if stats:
+        print(f"Detector frames: {stats}")
+
+    if isinstance(detector, RoiDetector):
+        roi_stats = detector.poll_stats()
+        if roi_stats:
+            print(f"Detector passes: {roi_stats}")
+
+    if detector_pool:
+        usage = detector_pool.poll_stats()
+        if usage:
+            print(f"Detector utilisation: {usage}")
+
+    # Every finished frame is shown, so the output does not freeze while nothing is found
+    if visualiser and frame is not None:
+        visualiser.submit(frame, [(d.x1, d.y1, d.x2, d.y2, detection_label(d)) for d in detections])
+
+    if not detections:
+        return
+
+    if tracker:
+        # Sent now rather than on the next frame, positions are moved forward to the newest tracked frame,
+        # so they are sent as that frame's objects (its depth frame matches the boxes)
+        tracked, tracked_info = tracker.update(detections, frame_info[1])
+        records = [tracked_record(t) for t in tracked]
+        frame_info = tracked_info or frame_info
+    else:
+        records = [detection_record(d) for d in detections]
+
+    send_objects(records, frame_info, inference_ts)
+
+
+def send_objects(records, frame_info, inference_ts):
+    global first_detection_sent
     try:
-        # Get current time stamp
-        timestamp = time.time()
-        data =  f"{x_cen},{y_cen},{category},{timestamp}".encode() 
-        location_sock.sendto(data, ("127.0.0.1", 9090))
+        # Every object of the frame in one datagram, with the source frame id and its timing
+        frame_id, capture_ts, decode_ts = frame_info
+        data = encode_detections(frame_id, capture_ts, decode_ts, inference_ts, time.time(), records)
+        location_sock.sendto(data, (SERVER_IP, LOCATION_PORT))
+
+        if not first_detection_sent and readiness:
+            first_detection_sent = True
+            readiness.notify("first_detection")
     except Exception as e:
-        print(f"Error sending object location: {e}")
- 
-# Start threads for receiving and processing frames
-receive_thread = threading.Thread(target=get_frames, daemon=True)
-receive_thread.start()
+        print(f"Error sending object locations: {e}")
 
-process_thread = threading.Thread(target=process_frames, daemon=True)
-process_thread.start()
+def answer_pings():
+    # Reply to the pipeline's clock pings on the location socket
+    global clock_offset
+    while not stop_event.is_set():
+        try:
+            data, address = location_sock.recvfrom(1024)
+            t1 = time.time()
+            if message_type(data) != TYPE_PING:
+                continue
 
-print("Receiving and processing video...")
+            ping = decode_sync(data)
+            location_sock.sendto(encode_pong(ping, t1, time.time()), address)
+            if ping.synced:
+                clock_offset = ping.offset
 
-while True:
-    if cv2.waitKey(1) & 0xFF == ord('q'): 
+        except socket.timeout:
+            continue
+        except Exception as e:
+            if not stop_event.is_set():
+                print(f"Error answering clock ping: {e}")
+
+def on_key(key):
+    if key == ord('q'):
         print("Exiting... (q key pressed)")
-        stop_event.set()  
-        break
+        stop_event.set()
+
+def main():
+    global video_sock, location_sock, detector, detector_pool, visualiser, tracker, readiness
+
+    readiness = ReadinessNotifier("detector")
+
+    # Socket for live video feed
+    if VIDEO_TRANSPORT != "shm":
+        video_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        video_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        video_sock.settimeout(0.5)
+        video_sock.bind((SERVER_IP, VIDEO_PORT))
+
+    # socket to send object loaction, bound so the pipeline's clock pings can be answered
+    location_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    location_sock.bind(("", 0))
+    location_sock.settimeout(0.5)
+
+    detector_options = {"score_threshold": DETECTOR_SCORE_THRESHOLD}
+    if DETECTOR_MODEL:
+        detector_options["model_path"] = DETECTOR_MODEL
+
+    if DETECTOR_WORKERS > 1:
+        # Each worker process loads its own copy of the model
+        detector_pool = DetectorPool(DETECTOR_BACKEND, DETECTOR_WORKERS, FRAME_RING_SLOT_SIZE,
+                                     DETECTOR_MERGE_POLICY, DETECTOR_THREADS, STATS_INTERVAL,
+                                     detector_options)
+        detector_pool.on_result = handle_pool_result
+        print(f"Started {DETECTOR_WORKERS} {DETECTOR_BACKEND} workers ({DETECTOR_MERGE_POLICY} results)")
+    else:
+        detector = create_detector(DETECTOR_BACKEND, threads=DETECTOR_THREADS, **detector_options)
+        detector.warm_up()
+        print(f"Loaded {DETECTOR_BACKEND} detector")
+
+        if ROI_ENABLED:
+            # Crops only pay off when frames are processed in order by one detector
+            detector = RoiDetector(detector, ROI_REFRESH_INTERVAL, ROI_EXPANSION, ROI_MIN_SCORE, STATS_INTERVAL)
+
+    if TRACKER_ENABLED:
+        tracker = ObjectTracker(TRACKER_IOU_THRESHOLD, TRACKER_MAX_AGE, TRACKER_OPTICAL_FLOW)
+
+    # Headless runs only render when writing to a video file
+    if not DETECTOR_HEADLESS or VISUALISER_OUTPUT:
+        visualiser = Visualiser(VISUALISER_MAX_FPS, VISUALISER_OUTPUT,
+                                show_window=not DETECTOR_HEADLESS, on_key=on_key)
+        visualiser.start()
+
+    # Start threads for receiving and processing frames
+    receive_thread = threading.Thread(
+        target=get_frames_shm if VIDEO_TRANSPORT == "shm" else get_frames, daemon=True)
+    receive_thread.start()
+
+    process_thread = threading.Thread(
+        target=dispatch_frames if detector_pool else process_frames, daemon=True)
+    process_thread.start()
+
+    ping_thread = threading.Thread(target=answer_pings, daemon=True)
+    ping_thread.start()
+
+    # Workers load their models in the background, ready once one of them can take frames
+    while detector_pool and not detector_pool.wait_idle() and not stop_event.is_set():
+        pass
+    readiness.notify("ready")
+
+    print("Receiving and processing video...")
+
+    try:
+        while not stop_event.is_set():
+            stop_event.wait(0.5)
+    except KeyboardInterrupt:
+        print("Exiting... (interrupted)")
+        stop_event.set()
 
-    if stop_event.is_set():
-        break
+    receive_thread.join()
+    process_thread.join()
+    ping_thread.join()
 
-receive_thread.join()
-process_thread.join()
+    if visualiser:
+        visualiser.stop()
+    if detector_pool:
+        detector_pool.close()
+    if video_sock:
+        video_sock.close()
+    if frame_ring:
+        frame_ring.close()
+    location_sock.close()
+    readiness.close()
 
-video_sock.close()
-location_sock.close()
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import threading
+from collections import namedtuple
+import cv2
+import numpy as np
+
+# Smoothed object state emitted for every frame, centre and size in pixels, velocity in pixels per second
+TrackedObject = namedtuple("TrackedObject", ["track_id", "category", "score", "x", "y", "w", "h",
+                                             "vx", "vy", "detected"])
+
+def iou(a, b):
+    # Intersection over union of two (x1, y1, x2, y2) boxes
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+class KalmanBoxFilter:
+    # Noise as fractions of the box height, so near and far objects are treated alike
+    POSITION_STD = 0.05
+    VELOCITY_STD = 0.5
+    MEASUREMENT_STD = 0.05
+
+    def __init__(self, box):
+        # Constant velocity model on state (cx, cy, w, h, vx, vy, vw, vh)
+        self.x = np.zeros(8)
+        self.x[:4] = box
+        std = np.r_[[2 * self.POSITION_STD * box[3]] * 4, [10 * self.VELOCITY_STD * box[3]] * 4]
+        self.P = np.diag(std ** 2)
+
+    def predict(self, dt):
+        if dt <= 0:
+            return
+        F = np.eye(8)
+        F[:4, 4:] = np.eye(4) * dt
+        height = self.x[3]
+        Q = np.diag(np.r_[[self.POSITION_STD * height] * 4, [self.VELOCITY_STD * height] * 4] ** 2) * dt
+        self.x = F.dot(self.x)
+        self.P = F.dot(self.P).dot(F.T) + Q
+
+    def update(self, measurement, size=4, std_scale=1.0):
+        # Correct with a measured (cx, cy, w, h), or only (cx, cy) when size is 2
+        H = np.eye(8)[:size]
+        R = np.eye(size) * (self.MEASUREMENT_STD * std_scale * self.x[3]) ** 2
+        residual = np.asarray(measurement, dtype=float) - H.dot(self.x)
+        S = H.dot(self.P).dot(H.T) + R
+        K = self.P.dot(H.T).dot(np.linalg.inv(S))
+        self.x = self.x + K.dot(residual)
+        self.P = (np.eye(8) - K.dot(H)).dot(self.P)
+
+    @property
+    def box(self):
+        cx, cy, w, h = self.x[:4]
+        return cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2
+
+class _Track:
+    def __init__(self, track_id, detection, ts):
+        self.track_id = track_id
+        self.category = detection.category
+        self.score = detection.score
+        self.filter = KalmanBoxFilter(_centre_size(detection))
+        self.ts = ts
+        self.detected_ts = ts
+
+    def predict_to(self, ts):
+        self.filter.predict(ts - self.ts)
+        self.ts = max(self.ts, ts)
+
+    def output(self, detected):
+        cx, cy, w, h, vx, vy = self.filter.x[:6]
+        return TrackedObject(self.track_id, self.category, self.score, float(cx), float(cy), float(w), float(h),
+                             float(vx), float(vy), detected)
+
+def _centre_size(detection):
+    return ((detection.x1 + detection.x2) / 2.0, (detection.y1 + detection.y2) / 2.0,
+            float(detection.x2 - detection.x1), float(detection.y2 - detection.y1))
+
+class ObjectTracker:
+    def __init__(self, iou_threshold=0.3, max_age=1.0, optical_flow=False):
+        # Keeps objects between detector runs: predicts them on every frame and corrects them on detections
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.optical_flow = optical_flow
+
+        self._tracks = []
+        self._next_id = 1
+        self._prev_gray = None
+        self._frame = (None, None)
+        self._lock = threading.Lock()
+
+    def step(self, frame, ts, frame_info=None):
+        # Advance every track to a new frame captured at ts, returns the tracked objects
+        # frame_info is kept and handed back by update() when it predicts objects to this frame
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if self.optical_flow else None
+
+        with self._lock:
+            for track in self._tracks:
+                previous_box = track.filter.box
+                track.predict_to(ts)
+                if gray is not None and self._prev_gray is not None:
+                    self._flow_update(track, previous_box, gray)
+
+            # Objects the detector has not seen for a while are dropped
+            self._tracks = [t for t in self._tracks if ts - t.detected_ts <= self.max_age]
+            self._prev_gray = gray
+            if self._frame[0] is None or ts >= self._frame[0]:
+                self._frame = (ts, frame_info)
+            return [t.output(False) for t in self._tracks]
+
+    def update(self, detections, ts):
+        # Correct tracks with detections from a frame captured at ts
+        # Returns the tracked objects and the frame_info given to step() for the frame they are predicted to,
+        # None when that is the detection's own frame
+        with self._lock:
+            for track in self._tracks:
+                if track.ts < ts:
+                    track.predict_to(ts)
+
+            # Detections arrive after later frames were tracked, so move them forward along each track
+            candidates = []
+            for t_index, track in enumerate(self._tracks):
+                lag = track.ts - ts
+                vx, vy = track.filter.x[4:6]
+                for d_index, detection in enumerate(detections):
+                    if detection.category != track.category:
+                        continue
+                    shifted = (detection.x1 + vx * lag, detection.y1 + vy * lag,
+                               detection.x2 + vx * lag, detection.y2 + vy * lag)
+                    overlap = iou(track.filter.box, shifted)
+                    if overlap >= self.iou_threshold:
+                        candidates.append((overlap, t_index, d_index, lag))
+
+            # Greedy association, best overlaps first
+            matched_tracks, matched_detections = set(), set()
+            for overlap, t_index, d_index, lag in sorted(candidates, reverse=True):
+                if t_index in matched_tracks or d_index in matched_detections:
+                    continue
+                matched_tracks.add(t_index)
+                matched_detections.add(d_index)
+
+                track = self._tracks[t_index]
+                detection = detections[d_index]
+                cx, cy, w, h = _centre_size(detection)
+                vx, vy = track.filter.x[4:6]
+                track.filter.update((cx + vx * lag, cy + vy * lag, w, h))
+                track.score = detection.score
+                track.detected_ts = ts
+
+            clock = max([ts] + [t.ts for t in self._tracks])
+            for d_index, detection in enumerate(detections):
+                if d_index not in matched_detections:
+                    track = _Track(self._next_id, detection, clock)
+                    track.detected_ts = ts
+                    self._next_id += 1
+                    self._tracks.append(track)
+                    matched_tracks.add(len(self._tracks) - 1)
+
+            objects = [t.output(index in matched_tracks) for index, t in enumerate(self._tracks)]
+            return objects, (self._frame[1] if clock > ts and clock == self._frame[0] else None)
+
+    def _flow_update(self, track, box, gray):
+        # Follow corner features inside the previous box with Lucas-Kanade and correct the centre
+        height, width = gray.shape
+        x1, y1 = max(0, int(box[0])), max(0, int(box[1]))
+        x2, y2 = min(width, int(box[2])), min(height, int(box[3]))
+        if x2 - x1 < 8 or y2 - y1 < 8:
+            return
+
+        mask = np.zeros_like(self._prev_gray)
+        mask[y1:y2, x1:x2] = 255
+        points = cv2.goodFeaturesToTrack(self._prev_gray, maxCorners=20, qualityLevel=0.01,
+                                         minDistance=3, mask=mask)
+        if points is None:
+            return
+
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, points, None,
+                                                    winSize=(15, 15), maxLevel=2)
+        good = status.reshape(-1) == 1
+        if good.sum() < 3:
+            return
+
+        shift = np.median((moved - points).reshape(-1, 2)[good], axis=0)
+        centre = ((box[0] + box[2]) / 2.0 + shift[0], (box[1] + box[3]) / 2.0 + shift[1])
+        # Flow is noisier than a detection
+        track.filter.update(centre, size=2, std_scale=2.0)
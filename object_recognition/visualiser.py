@@ -0,0 +1,82 @@
+import time
+import threading
+import cv2
+
+def draw_boxes(frame, boxes):
+    # Draw (x1, y1, x2, y2, label) boxes onto frame in place
+    for x1, y1, x2, y2, label in boxes:
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+    return frame
+
+class Visualiser:
+    def __init__(self, max_fps=10, output_path=None, show_window=True, window_name="Pepper Camera Feed",
+                 on_key=None):
+        # Render annotated frames on a separate thread, never faster than max_fps
+        self.interval = 1.0 / max_fps
+        self.output_path = output_path
+        self.show_window = show_window
+        self.window_name = window_name
+        self.on_key = on_key
+
+        self._latest = None
+        self._lock = threading.Lock()
+        self._writer = None
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(1.0)
+
+    def submit(self, frame, boxes):
+        # Offer the latest frame and its boxes, older undrawn frames are simply replaced
+        with self._lock:
+            self._latest = (frame, boxes)
+
+    def _run(self):
+        while self.running:
+            start = time.time()
+
+            with self._lock:
+                latest, self._latest = self._latest, None
+
+            try:
+                if latest is not None:
+                    self._render(*latest)
+
+                # GUI events are handled here so only this thread talks to the window
+                if self.show_window:
+                    key = cv2.waitKey(1) & 0xFF
+                    if key != 0xFF and self.on_key:
+                        self.on_key(key)
+
+            except Exception as e:
+                print(f"Error rendering frame: {e}")
+
+            time.sleep(max(0.0, self.interval - (time.time() - start)))
+
+        if self._writer:
+            self._writer.release()
+        if self.show_window:
+            cv2.destroyAllWindows()
+
+    def _render(self, frame, boxes):
+        frame = draw_boxes(frame, boxes)
+
+        if self.output_path:
+            if self._writer is None:
+                height, width = frame.shape[:2]
+                fourcc = cv2.VideoWriter_fourcc(*"MJPG")
+                self._writer = cv2.VideoWriter(self.output_path, fourcc, 1.0 / self.interval, (width, height))
+                print(f"Writing annotated frames to {self.output_path}")
+            self._writer.write(frame)
+
+        if self.show_window:
+            cv2.imshow(self.window_name, frame)
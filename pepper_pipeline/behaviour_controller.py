@@ -1,6 +1,10 @@
 import time
+from config import STATS_INTERVAL, DETECTION_MAX_AGE
 from utils import logger
-from robot_map import PepperRobotMap
+from metrics import LatencyTracker
+
+# Glass to decision latency stages (NAOqi capture timestamps assume the robot clock is synced)
+LATENCY_STAGES = ("capture->decode", "decode->inference", "inference->received", "received->motion")
 
 class BehaviourController:
     def __init__(self, camera_manager, spatial_mapper, motion_controller, speech_manager, network_listener):
@@ -13,6 +17,7 @@ class BehaviourController:
         self.detected_objects = []
         self.target_positions = []
         self.actual_positions = []
+        self.latency = LatencyTracker(LATENCY_STAGES, interval=STATS_INTERVAL)
 
     def start(self):
         self.running = True
@@ -42,15 +47,18 @@ class BehaviourController:
         
         while self.running:
             try:
-                # Get object coordinates from network
-                x_cen, y_cen, category = self.network_listener.get_object_coords()
+                # Newest detection not yet acted on, waits briefly when there is none
+                x_cen, y_cen, category, info = self.network_listener.get_object_coords(DETECTION_MAX_AGE)
 
                 if x_cen is None:
-                    logger.info("No object detected, skipping iteration")
+                    logger.debug("No object detected, skipping iteration")
                     continue
 
-                # Get 3D position
-                depth, position = self.spatial_mapper.get_3d_position(x_cen, y_cen, self.camera_manager)
+                self._record_detection_latency(info)
+
+                # Get 3D position using the depth frame captured with the detection
+                depth, position = self.spatial_mapper.get_3d_position(
+                    x_cen, y_cen, self.camera_manager, info.get('capture_ts'), info.get('box'))
 
                 if position is None:
                     logger.warning("Could not get position data, skipping")
@@ -104,6 +112,11 @@ class BehaviourController:
                 self._update_map(self.detected_objects, self.actual_positions, self.target_positions)
 
                 # Move to object
+                self.latency.record("received->motion", time.time() - info['received_ts'])
+                report = self.latency.poll()
+                if report:
+                    logger.info("Detection latency: {}".format(self.latency.format(report)))
+
                 success = self.motion_controller.move_to_position(x, y, theta)
 
                 if success:
@@ -143,8 +156,20 @@ class BehaviourController:
             except Exception as e:
                 logger.error("Error in object tracking loop: {}".format(e))
 
+    def _record_detection_latency(self, info):
+        # Record the detector and network stages of a received detection
+        if 'capture_ts' not in info:
+            return
+        if info.get('detected', True):
+            # Predicted tracker positions did not go through the detector
+            self.latency.record("capture->decode", info['decode_ts'] - info['capture_ts'])
+            self.latency.record("decode->inference", info['inference_ts'] - info['decode_ts'])
+        self.latency.record("inference->received", info['received_ts'] - info['inference_ts'])
+
     def _update_map(self, detected_objects, actual_positions=None, target_positions=None):
         if detected_objects:
+            # matplotlib is slow to import, so the map module loads with the first detection
+            from robot_map import PepperRobotMap
             robot_map = PepperRobotMap()
             robot_map.update_map(detected_objects, actual_positions, target_positions)
             map_filepath = robot_map.save()
@@ -1,11 +1,14 @@
 import numpy as np
 import cv2
-import struct
-import socket
 import time
+import socket
 import threading
 from config import *
 from utils import logger
+from frame_ring import FrameRingWriter
+from video_protocol import FrameSender
+from frame_grabber import FrameGrabber, FrameHistory
+from depth_filters import create_filter
 
 class CameraManager:
     def __init__(self, video_proxy):
@@ -14,6 +17,11 @@ class CameraManager:
         self.depth_cam = None
         self.image_cam = None
         self.video_sock = None
+        self.frame_ring = None
+        self.grabbers = {}
+        self.depth_history = FrameHistory(DEPTH_HISTORY_SIZE)
+        self.depth_filter = create_filter(DEPTH_FILTER, **DEPTH_FILTER_OPTIONS.get(DEPTH_FILTER, {}))
+        self._filter_report = time.time()
         self.initialised = False
         self.shutting_down = False
 
@@ -42,9 +50,26 @@ class CameraManager:
             
             logger.info("Camera subscription successful")
 
-            # Setup socket for video stream
-            self.video_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            logger.info("Streaming video socket initialised")
+            # Make sure the top camera is the active camera for the video feed
+            self.video_proxy.setActiveCamera(TOP_CAM_ID)
+
+            # Start one grabber thread per subscribed camera
+            self.grabbers['top'] = FrameGrabber(self.video_proxy, self.image_cam, 'top', self._decode_top)
+            if self.depth_cam:
+                self.grabbers['depth'] = FrameGrabber(self.video_proxy, self.depth_cam, 'depth',
+                                                      self._decode_depth)
+                self.grabbers['depth'].add_listener(self.depth_history.add)
+            for grabber in self.grabbers.values():
+                grabber.start()
+
+            if VIDEO_TRANSPORT == 'shm':
+                # Setup shared-memory ring for same-host streaming
+                self.frame_ring = FrameRingWriter(FRAME_RING_PATH, FRAME_RING_SLOTS, FRAME_RING_SLOT_SIZE)
+                logger.info("Streaming frame ring initialised at {}".format(FRAME_RING_PATH))
+            else:
+                # Setup socket for video stream
+                self.video_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                logger.info("Streaming video socket initialised")
 
             self.initialised = True
             return True
@@ -57,100 +82,146 @@ class CameraManager:
         # Unsubscribe from cameras and close sockets
         self.shutting_down = True
         try:
+            for grabber in self.grabbers.values():
+                grabber.stop()
             if self.image_cam:
                 self.video_proxy.unsubscribe(self.image_cam)
             if self.depth_cam:
                 self.video_proxy.unsubscribe(self.depth_cam)
             if self.video_sock:
                 self.video_sock.close()
+            if self.frame_ring:
+                self.frame_ring.close()
             logger.info("Unsubscribed from Cameras")
 
         except Exception as e:
             logger.error("Error during camera cleanup: {}".format(e))
 
+    def _decode_top(self, image, out):
+        # Convert raw top camera image into an OpenCV frame
+        width = image[0]
+        height = image[1]
+        image_np = np.frombuffer(image[6], dtype=np.uint8).reshape((height, width, 3))
+        return cv2.cvtColor(image_np, cv2.COLOR_BGR2RGB, dst=out)
+
+    def _decode_depth(self, image, out):
+        # Convert raw depth image and apply the configured filter to reduce noise
+        width = image[0]
+        height = image[1]
+        depth_image = np.frombuffer(image[6], dtype=np.uint16).reshape(height, width)
+        filtered = self.depth_filter(depth_image, out)
+
+        # The filter runs on the grabber thread, report its cost so it stays cheap enough for the frame rate
+        now = time.time()
+        if now - self._filter_report >= STATS_INTERVAL:
+            stats = self.depth_filter.poll_stats()
+            if stats:
+                logger.info("Depth {}".format(self.depth_filter.format(stats)))
+            self._filter_report = now
+        return filtered
+
+    def get_camera_stats(self):
+        # Achieved frame rate and RPC latency per camera
+        return dict((name, grabber.get_stats()) for name, grabber in self.grabbers.items())
+
     def get_video_frame(self):
-        # Get frame from top camera
-        if not self.initialised or not self.image_cam:
+        # Get newest frame and NAOqi capture timestamp from top camera
+        if not self.initialised or 'top' not in self.grabbers:
             logger.error("Camera not initialised")
             return None
         
-        try:
-            frame = self.video_proxy.getImageRemote(self.image_cam)
-
-            if frame is None:
-                if not self.shutting_down:
-                    logger.warning("Received empty frame from camera")
-                return None
-            
-            width = frame[0]
-            height = frame[1]
-            raw_image = frame[6]
-
-            image_np = np.frombuffer(raw_image, dtype=np.uint8).reshape((height, width, 3))
-            image_rgb = cv2.cvtColor(image_np, cv2.COLOR_BGR2RGB)
-
-            # Release the image to prevent memory buildup
-            self.video_proxy.releaseImage(self.image_cam)
+        latest = self.grabbers['top'].get_latest()
+        if latest is None:
+            return None
 
-            return image_rgb
+        frame, timestamp, _ = latest
+        return frame, timestamp
         
-        except Exception as e:
-            logger.error("Error getting video frame: {}".format(e))
+    def get_resolution(self, camera, timeout=0.0):
+        # (width, height) of the 'top' or 'depth' camera frames, None if no frame arrives within timeout
+        if camera not in self.grabbers:
             return None
-        
+        latest = self.grabbers[camera].get_latest()
+        if latest is None and timeout > 0:
+            latest = self.grabbers[camera].wait_for_frame(0, timeout)
+        if latest is None:
+            return None
+        height, width = latest[0].shape[:2]
+        return width, height
+
     def get_depth_image(self):
-        # Get depth Image
-        if not self.initialised or not self.depth_cam:
+        # Get newest depth Image
+        if not self.initialised or 'depth' not in self.grabbers:
             logger.error("Camera not initialised or depth camera not available")
             return None
         
-        try:
-            depth_frame = self.video_proxy.getImageRemote(self.depth_cam)
+        latest = self.grabbers['depth'].get_latest()
+        if latest is None:
+            logger.warning("No depth frame received yet")
+            return None
 
-            if depth_frame is None:
-                logger.warning("Recieved empty depth frame")
-                return None
-            
-            width = depth_frame[0]
-            height = depth_frame[1]
-            raw_depth_image = depth_frame[6]
+        depth_smoothed = latest[0]
+        height, width = depth_smoothed.shape[:2]
+        return depth_smoothed, width, height
 
-            depth_image = np.frombuffer(raw_depth_image, dtype=np.uint16).reshape(height, width)
+    def get_depth_image_at(self, timestamp):
+        # Get the depth image captured closest to a NAOqi timestamp
+        if not self.initialised or 'depth' not in self.grabbers:
+            logger.error("Camera not initialised or depth camera not available")
+            return None
 
-            # Apply box filter to reduce noise
-            depth_smoothed = cv2.boxFilter(depth_image, -1, (5, 5))
+        nearest = self.depth_history.get_nearest(timestamp)
+        if nearest is None:
+            logger.warning("No depth frame received yet")
+            return None
 
-            # Switch back to top camera for video feed
-            self.video_proxy.setActiveCamera(0)
+        depth_smoothed, depth_timestamp = nearest
+        offset = depth_timestamp - timestamp
+        if abs(offset) > 2.0 / DEPTH_CAM_FPS:
+            logger.warning("Nearest depth frame is {:.3f}s away from the detection frame".format(offset))
+        else:
+            logger.debug("Depth frame offset from detection frame: {:.3f}s".format(offset))
 
-            return depth_smoothed, width, height
-        
-        except Exception as e:
-            logger.error("Error getting depth image: {}".format(e))
-            return None
+        height, width = depth_smoothed.shape[:2]
+        return depth_smoothed, width, height
         
     def stream_video(self, server_ip, port):
-        # Stream video to socket server
-        if not self.initialised or not self.video_sock:
+        # Stream video to socket server or shared-memory ring
+        if not self.initialised or not (self.video_sock or self.frame_ring):
             logger.error("Camera not initialised or socket not availaible")
             return
         
         try:
+            sender = None
+            if self.video_sock:
+                sender = FrameSender(self.video_sock, (server_ip, port), VIDEO_CHUNK_SIZE, STATS_INTERVAL)
+
+            top_grabber = self.grabbers['top']
+            sequence = 0
+
             while not self.shutting_down:
-                frame = self.get_video_frame()
+                # Wait for the grabber to deliver a frame we have not sent yet
+                result = top_grabber.wait_for_frame(sequence)
+
+                if result is None:
+                    continue
+
+                frame, timestamp, sequence = result
+
+                if self.frame_ring:
+                    # Raw frame straight into shared memory, no encoding needed
+                    self.frame_ring.write(frame, timestamp)
 
-                if frame is not None:
+                else:
                     # Encode frame as JPEG
-                    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 60])
+                    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, VIDEO_JPEG_QUALITY])
 
-                    # Send frame
-                    self.video_sock.sendto(
-                        struct.pack("L", len(buffer)) + buffer.tobytes(),
-                        (server_ip, port)
-                    )
+                    # Send frame as sequence-numbered chunks
+                    sender.send(buffer.tobytes(), timestamp)
 
-                    # Small delay to avoid overload
-                    time.sleep(0.003)
+                    rates = sender.counters.poll()
+                    if rates:
+                        logger.info("Video stream: {}".format(sender.counters.format(rates)))
 
         except Exception as e:
             logger.error("Error streaming video: {}".format(e))
@@ -1,11 +1,42 @@
+import os
+import tempfile
+
 ROBOT_IP = '192.168.244.207'
 ROBOT_PORT = 9559
 
+# Simulator settings, USE_SIMULATOR runs against naoqi_sim instead of the robot at ROBOT_IP
+USE_SIMULATOR = False
+SIM_RPC_LATENCY = 0.005 # Seconds added to every simulated NAOqi call
+SIM_RPC_JITTER = 0.0 # Extra random delay of up to this many seconds per call
+SIM_FRAME_DIR = None # Directory of top camera images, None serves synthetic frames
+SIM_DEPTH_DIR = None # Directory of 16-bit depth PNGs in millimetres, None serves a flat wall
+SIM_DEPTH_MM = 1000 # Distance of the synthetic wall
+REPLAY_PATH = None # Recording to replay through the simulator instead of the sources above
+REPLAY_SPEED = 1.0 # 1.0 real time, 2.0 twice as fast, 0 as fast as possible
+REPLAY_LOOP = True # Start the recording again when it ends
+RECORD_PATH = None # Directory to record camera frames and odometry to, None disables recording
+RECORD_ODOMETRY_RATE = 10.0 # Robot position samples per second while recording
+
 # Camera Settigns
 DEPTH_CAM_ID = 2
 DEPTH_CAM_RES = 10
 DEPTH_CAM_COLOUR = 17 
 DEPTH_CAM_FPS = 15
+DEPTH_HISTORY_SIZE = 15 # Depth frames kept for timestamp matching (1s at 15 fps)
+DEPTH_WINDOW = 3 # Depth pixels sampled per side around a point, or across a box
+DEPTH_TRIM = 0.2 # Share of the nearest and of the farthest depth samples left out of the trimmed mean
+DEPTH_MIN_VALID_RATIO = 0.5 # Warn when fewer sampled depth pixels than this have a reading
+DEPTH_FILTER = 'temporal_median' # none, box, gaussian, median, bilateral, nlmeans, temporal_median or temporal_weighted
+DEPTH_FILTER_OPTIONS = { # Constructor arguments per filter (see common/depth_filters.py), missing ones use defaults
+    'box': {'size': 5},
+    'bilateral': {'diameter': 9, 'sigma_depth': 50.0, 'sigma_space': 3.0},
+    # history: frames fused per pixel (median ring size, or cap on the running average weight)
+    # max_change: mm a reading may differ from the fused depth and still agree with it
+    # motion_ratio: share of disagreeing pixels taken as camera motion, which drops the history
+    # refresh: with a still camera every median is recomputed at least once per this many frames
+    'temporal_median': {'history': 5, 'max_change': 100, 'motion_ratio': 0.3, 'refresh': 5},
+    'temporal_weighted': {'history': 5, 'max_change': 100, 'motion_ratio': 0.3},
+}
 
 TOP_CAM_ID = 0
 TOP_CAM_RES = 10
@@ -15,10 +46,51 @@ TOP_CAM_FPS = 30
 # Server settings
 SERVER_IP = '127.0.0.1'
 VIDEO_PORT = 8089
+VIDEO_TRANSPORT = 'udp' # 'udp' or 'shm' (shared-memory ring, same host only)
+VIDEO_JPEG_QUALITY = 60
+VIDEO_CHUNK_SIZE = 8192 # UDP payload bytes per datagram, use ~1400 across a real network
+FRAME_RING_PATH = os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+                               'pepper_frame_ring')
+FRAME_RING_SLOTS = 8
+FRAME_RING_SLOT_SIZE = 1280 * 960 * 3 # Largest top camera frame in bytes
 LOCATION_PORT = 9090
+DETECTION_MAX_AGE = 2.0 # Seconds before a received detection is too old to act on
+CLOCK_SYNC_INTERVAL = 1.0 # Seconds between clock offset pings to the detector
+STATS_INTERVAL = 5.0 # Seconds between transport statistics reports
+
+# Object recognition settings
+DETECTOR_BACKEND = 'yolo' # 'yolo', 'mediapipe' or 'onnx'
+DETECTOR_MODEL = None # Model file for the backend, None uses its default model
+DETECTOR_SCORE_THRESHOLD = 0.5
+DETECTOR_WORKERS = 1 # More than 1 runs the detector in a pool of processes
+DETECTOR_THREADS = None # CPU threads per detector, None splits the cores between workers
+DETECTOR_MERGE_POLICY = 'newest' # 'newest' drops late results, 'ordered' reports in frame order
+ROI_ENABLED = False # Follow a confident detection by running on a crop around it
+ROI_REFRESH_INTERVAL = 10 # Full-frame pass at least every this many frames
+ROI_EXPANSION = 2.0 # Crop size relative to the tracked box
+ROI_MIN_SCORE = 0.6 # Confidence needed to start or keep a track
+TRACKER_ENABLED = False # Smooth detections and send object positions for every camera frame
+TRACKER_OPTICAL_FLOW = False # Refine tracks between detections with sparse optical flow
+TRACKER_IOU_THRESHOLD = 0.3 # Overlap needed to match a detection to a track
+TRACKER_MAX_AGE = 1.0 # Seconds a track is kept without a detection
+DETECTOR_HEADLESS = False # True skips all drawing and windows
+VISUALISER_MAX_FPS = 10
+VISUALISER_OUTPUT = None # Path of a video file to write annotated frames to, e.g. 'detections.avi'
 
 # Path to NAOqi libraries
 NAOQI_PATH = r"C:/path/to/naoqi-sdk/lib"
 
 # Calibration file
-CALIBRATION_FILE = 'camera_transformation.npz'
\ No newline at end of file
+CALIBRATION_FILE = 'camera_transformation.npz'
+CALIBRATION_RESOLUTION = (320, 240) # Top camera image size the calibration images were taken at
+DEPTH_CALIBRATION_RESOLUTION = (320, 240) # Depth camera image size the calibration images were taken at
+REGISTRATION_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'pepper_registration') # None disables the cache
+
+# Object localisation from the depth pixels inside a detection box, needs the calibration file
+OBJECT_MAX_POINTS = 4096 # Depth pixels used per box, larger boxes are sampled with a stride
+OBJECT_MIN_POINTS = 10 # Fewer valid points than this falls back to the box centre
+OBJECT_VOXEL_SIZE = 0.01 # Metres, the point cloud is reduced to one point per voxel
+OBJECT_DEPTH_BIN = 0.05 # Metres per bin of the depth histogram used to separate object and background
+OBJECT_DEPTH_BAND = 0.15 # Metres either side of the object's depth that count as the object
+CAMERA_TRANSFORM_MAX_AGE = 0.1 # Seconds the top camera pose is reused before asking the robot again
+RAY_TABLE_STEP = 1 # Pixels between ray table entries, larger values build faster and interpolate between
\ No newline at end of file
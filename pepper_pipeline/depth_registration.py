@@ -0,0 +1,132 @@
+import os
+import time
+import hashlib
+import numpy as np
+import cv2
+from utils import logger, scale_camera_matrix
+
+# Bump when the cached maps change meaning, so old cache files are not used
+CACHE_VERSION = 1
+
+class DepthRegistration:
+    def __init__(self, calibration, depth_size, top_size, depth_calibration_size, top_calibration_size,
+                 cache_dir=None, calibration_hash=None):
+        # Reprojects whole depth frames into the top camera image, so a detection pixel's depth is one lookup
+        # Stereo calibration maps top camera points to depth camera points as P_depth = R P_top + T,
+        # so a depth pixel back-projected to P_depth lands in the top camera at R^T (P_depth - T)
+        self.depth_size = depth_size
+        self.top_size = top_size
+        self.R = np.asarray(calibration['R'], dtype=np.float32)
+        self.T = np.asarray(calibration['T'], dtype=np.float32).reshape(3)
+        self.camera_matrix_top = scale_camera_matrix(calibration['camera_matrix_top'], top_calibration_size,
+                                                     top_size)
+
+        cache_path = None
+        if cache_dir and calibration_hash:
+            # The calibration image sizes change the maps too, so they are part of the key
+            key = hashlib.sha1("{} {} {}".format(calibration_hash, tuple(depth_calibration_size),
+                                                 tuple(top_calibration_size)).encode('utf-8')).hexdigest()
+            cache_path = os.path.join(cache_dir, "registration_v{}_{}_{}x{}_{}x{}.npz".format(
+                CACHE_VERSION, key[:16], depth_size[0], depth_size[1], top_size[0], top_size[1]))
+
+        start = time.time()
+        if cache_path and os.path.exists(cache_path):
+            try:
+                maps = np.load(cache_path)
+                self.depth_rays, self.map_x, self.map_y = maps['depth_rays'], maps['map_x'], maps['map_y']
+                logger.info("Loaded depth registration maps from {} in {:.0f} ms".format(
+                    cache_path, 1000.0 * (time.time() - start)))
+                return
+            except Exception as e:
+                logger.warning("Ignoring unreadable registration cache {}: {}".format(cache_path, e))
+
+        self._build_maps(calibration, depth_calibration_size)
+        logger.info("Built depth registration maps in {:.0f} ms".format(1000.0 * (time.time() - start)))
+
+        if cache_path:
+            try:
+                if not os.path.isdir(cache_dir):
+                    os.makedirs(cache_dir)
+                np.savez(cache_path, depth_rays=self.depth_rays, map_x=self.map_x, map_y=self.map_y)
+            except Exception as e:
+                logger.warning("Could not cache registration maps: {}".format(e))
+
+    def _build_maps(self, calibration, depth_calibration_size):
+        # depth_rays: undistorted normalised coordinates of every depth pixel
+        # map_x, map_y: where every raw top camera pixel lies in the undistorted top image, for cv2.remap
+        width, height = self.depth_size
+        camera_matrix_depth = scale_camera_matrix(calibration['camera_matrix_depth'], depth_calibration_size,
+                                                  self.depth_size)
+        grid = np.stack(np.meshgrid(np.arange(width, dtype=np.float64),
+                                    np.arange(height, dtype=np.float64)), axis=-1).reshape(-1, 1, 2)
+        rays = cv2.undistortPoints(grid, camera_matrix_depth, np.asarray(calibration['dist_coeffs_left'],
+                                                                         dtype=np.float64))
+        self.depth_rays = rays.reshape(height, width, 2).astype(np.float32)
+
+        width, height = self.top_size
+        grid = np.stack(np.meshgrid(np.arange(width, dtype=np.float64),
+                                    np.arange(height, dtype=np.float64)), axis=-1).reshape(-1, 1, 2)
+        undistorted = cv2.undistortPoints(grid, self.camera_matrix_top,
+                                          np.asarray(calibration['dist_coeffs_top'], dtype=np.float64),
+                                          P=self.camera_matrix_top)
+        undistorted = undistorted.reshape(height, width, 2).astype(np.float32)
+        self.map_x = np.ascontiguousarray(undistorted[:, :, 0])
+        self.map_y = np.ascontiguousarray(undistorted[:, :, 1])
+
+    def register(self, depth_image):
+        # Depth image in millimetres as seen from the raw top camera, 0 where no depth pixel lands
+        # Where several depth pixels land on the same top pixel the nearest wins (z-buffer)
+        height, width = self.depth_size[1], self.depth_size[0]
+        if depth_image.shape[:2] != (height, width):
+            raise ValueError("Depth image is {}x{}, registration was built for {}x{}".format(
+                depth_image.shape[1], depth_image.shape[0], width, height))
+
+        depth = depth_image.reshape(-1)
+        valid = np.flatnonzero(depth)
+        z = depth[valid].astype(np.float32) / 1000.0 # Convert from mm to m
+
+        # Back-project into the depth camera, then move into the top camera frame
+        rays = self.depth_rays.reshape(-1, 2)[valid]
+        points = np.empty((len(valid), 3), dtype=np.float32)
+        points[:, :2] = rays * z[:, np.newaxis]
+        points[:, 2] = z
+        points = np.dot(points - self.T, self.R) # Row vectors, so this is R^T (P - T)
+
+        # Project into the undistorted top image
+        top_width, top_height = self.top_size
+        k = self.camera_matrix_top
+        in_front = points[:, 2] > 0
+        points = points[in_front]
+        u = np.round(k[0, 0] * points[:, 0] / points[:, 2] + k[0, 2]).astype(np.intp)
+        v = np.round(k[1, 1] * points[:, 1] / points[:, 2] + k[1, 2]).astype(np.intp)
+        inside = (u >= 0) & (u < top_width) & (v >= 0) & (v < top_height)
+        pixels = (v[inside] * top_width + u[inside]).astype(np.int64)
+        depth_mm = np.minimum(points[inside, 2] * 1000.0, 65535).astype(np.int64)
+
+        # Nearest point per pixel: one sort on (pixel, depth) packed into a single key,
+        # then keep the first entry of each pixel
+        keys = np.sort(pixels * 65536 + depth_mm)
+        pixels = keys // 65536
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = pixels[1:] != pixels[:-1]
+
+        registered = np.zeros((top_height, top_width), dtype=np.uint16)
+        registered.reshape(-1)[pixels[first]] = (keys[first] % 65536).astype(np.uint16)
+
+        # Scattering leaves pinholes between projected pixels, fill them from the nearest neighbour
+        # (dilating the inverted depth takes the closest surface, like the z-buffer)
+        inverted = np.where(registered > 0, 65535 - registered, 0).astype(np.uint16)
+        nearest = cv2.dilate(inverted, np.ones((3, 3), np.uint8))
+        holes = (registered == 0) & (nearest > 0)
+        registered[holes] = 65535 - nearest[holes]
+
+        # Resample onto the raw (distorted) top camera pixels, where detections are reported
+        return cv2.remap(registered, self.map_x, self.map_y, cv2.INTER_NEAREST)
+
+def file_hash(path):
+    # Hash of a calibration file, part of the registration cache key
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,160 @@
+import time
+import threading
+import numpy as np
+from utils import logger
+from config import STATS_INTERVAL
+
+class FrameGrabber:
+    def __init__(self, video_proxy, subscriber, name, decode):
+        # Continuously fetch frames from one camera subscription
+        # decode(image, out) turns a NAOqi image into a numpy frame, reusing out when it can
+        self.video_proxy = video_proxy
+        self.subscriber = subscriber
+        self.name = name
+        self.decode = decode
+
+        # Double-buffered slot, consumers read the front while the grabber fills the back
+        self._buffers = [None, None]
+        self._slots = [None, None]
+        self._front = 0
+        self._condition = threading.Condition()
+        self.sequence = 0
+
+        self.running = False
+        self.thread = None
+        self.listeners = []
+        self.raw_listeners = []
+
+        # Statistics
+        self.fps = 0.0
+        self.rpc_latency = 0.0
+        self._frames_in_window = 0
+        self._window_start = time.time()
+
+    def add_listener(self, callback):
+        # callback(frame, timestamp, sequence) runs on the grabber thread for every new frame
+        self.listeners.append(callback)
+
+    def add_raw_listener(self, callback):
+        # callback(image, timestamp) gets the NAOqi image before decode, e.g. unfiltered depth
+        self.raw_listeners.append(callback)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="{}_grabber".format(self.name))
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        with self._condition:
+            self._condition.notify_all()
+        if self.thread:
+            self.thread.join(1.0)
+
+    def _run(self):
+        while self.running:
+            try:
+                start = time.time()
+                image = self.video_proxy.getImageRemote(self.subscriber)
+                rpc_latency = time.time() - start
+
+                if image is None:
+                    if self.running:
+                        logger.warning("Received empty frame from {} camera".format(self.name))
+                    time.sleep(0.01)
+                    continue
+
+                timestamp = image[4] + image[5] * 1e-6
+
+                for callback in self.raw_listeners:
+                    callback(image, timestamp)
+
+                back = 1 - self._front
+                frame = self.decode(image, self._buffers[back])
+                self._buffers[back] = frame
+
+                # Release the image to prevent memory buildup
+                self.video_proxy.releaseImage(self.subscriber)
+
+                with self._condition:
+                    self.sequence += 1
+                    self._slots[back] = (frame, timestamp, self.sequence)
+                    self._front = back
+                    self._condition.notify_all()
+
+                for callback in self.listeners:
+                    callback(frame, timestamp, self.sequence)
+
+                self._update_stats(rpc_latency)
+
+            except Exception as e:
+                if self.running:
+                    logger.error("Error grabbing {} frame: {}".format(self.name, e))
+                    time.sleep(0.1)
+
+    def _update_stats(self, rpc_latency):
+        # Exponential moving average of RPC latency and windowed frame rate
+        self.rpc_latency = rpc_latency if self.sequence == 1 else 0.9 * self.rpc_latency + 0.1 * rpc_latency
+        self._frames_in_window += 1
+
+        now = time.time()
+        elapsed = now - self._window_start
+        if elapsed >= STATS_INTERVAL:
+            self.fps = self._frames_in_window / elapsed
+            self._frames_in_window = 0
+            self._window_start = now
+            logger.info("{} camera: {:.1f} fps, RPC latency {:.1f} ms".format(
+                self.name, self.fps, self.rpc_latency * 1000))
+
+    def get_latest(self):
+        # Newest (frame, timestamp, sequence) or None, valid until two more frames arrive
+        with self._condition:
+            return self._slots[self._front]
+
+    def wait_for_frame(self, last_sequence, timeout=1.0):
+        # Block until a frame newer than last_sequence is available
+        with self._condition:
+            if self.sequence <= last_sequence and self.running:
+                self._condition.wait(timeout)
+            if self.sequence <= last_sequence:
+                return None
+            return self._slots[self._front]
+
+    def get_stats(self):
+        return {
+            'fps': self.fps,
+            'rpc_latency_ms': self.rpc_latency * 1000,
+            'frames': self.sequence,
+        }
+
+
+class FrameHistory:
+    def __init__(self, size):
+        # Bounded ring of recent frames indexed by NAOqi capture timestamp
+        self.size = size
+        self._frames = None
+        self._timestamps = np.full(size, np.nan)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def add(self, frame, timestamp, sequence=None):
+        # Copy frame into the oldest slot, usable directly as a grabber listener
+        with self._lock:
+            if self._frames is None or self._frames.shape[1:] != frame.shape:
+                self._frames = np.empty((self.size,) + frame.shape, dtype=frame.dtype)
+                self._timestamps[:] = np.nan
+
+            np.copyto(self._frames[self._next], frame)
+            self._timestamps[self._next] = timestamp
+            self._next = (self._next + 1) % self.size
+
+    def get_nearest(self, timestamp):
+        # Return (frame, frame timestamp) closest to timestamp, or None if empty
+        # The frame is a view into the ring, valid until the ring wraps around
+        with self._lock:
+            if self._frames is None or np.isnan(self._timestamps).all():
+                return None
+
+            index = int(np.nanargmin(np.abs(self._timestamps - timestamp)))
+            return self._frames[index], self._timestamps[index]
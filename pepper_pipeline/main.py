@@ -1,19 +1,48 @@
 import sys
 import time
+
+# Start of the startup-time breakdown, taken before the heavier imports
+startup_start = time.time()
+
 import signal
 import threading
 from config import *
 from utils import logger
 
-from naoqi import ALProxy
+from proxies import create_proxies, LazyProxy
 from camera_manager import CameraManager
 from spatial_mapper import SpatialMapper
 from speech_manager import SpeechManager
 from motion_controller import MotionController
 from network_listener import NetworkListener
+from recorder import Recorder
 from behaviour_controller import BehaviourController
+from readiness import ReadinessNotifier
 
 controller = None
+recorder = None
+
+class StartupTimer:
+    def __init__(self, start):
+        # Time each startup stage so the slowest can be found
+        self.start = start
+        self.last = start
+        self.stages = []
+
+    def mark(self, stage, details=None):
+        now = time.time()
+        self.stages.append((stage, now - self.last, details))
+        self.last = now
+
+    def report(self):
+        parts = []
+        for stage, seconds, details in self.stages:
+            part = "{} {:.2f}s".format(stage, seconds)
+            if details:
+                part += " ({})".format(", ".join("{} {:.2f}s".format(name, value)
+                                                 for name, value in sorted(details.items())))
+            parts.append(part)
+        logger.info("Startup took {:.2f}s: {}".format(self.last - self.start, "; ".join(parts)))
 
 def signal_handler(dig, frame):
     # Handle termination signal gracefully
@@ -23,24 +52,36 @@ def signal_handler(dig, frame):
     sys.exit(0)
 
 def main():
-    global controller
+    global controller, recorder
 
     # Register signal handler
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
+    # Tells run_all.py when the robot side is ready, no-op when run on its own
+    readiness = ReadinessNotifier('pipeline')
+    startup = StartupTimer(startup_start)
+    startup.mark("imports")
+
     try:
         # Connect to robot
         logger.info("Connecting to Pepper at {}.{}".format(ROBOT_IP, ROBOT_PORT))
 
-        # Initialise proxies
-        video_proxy = ALProxy("ALVideoDevice", ROBOT_IP, ROBOT_PORT)
-        motion_proxy = ALProxy("ALMotion", ROBOT_IP, ROBOT_PORT)
-        speech_proxy = ALProxy("ALTextToSpeech", ROBOT_IP, ROBOT_PORT)
-        awareness_proxy = ALProxy("ALBasicAwareness", ROBOT_IP, ROBOT_PORT)
-        face_proxy = ALProxy("ALFaceDetection", ROBOT_IP, ROBOT_PORT)
-        autoLife_proxy = ALProxy("ALAutonomousLife", ROBOT_IP, ROBOT_PORT)
-        navigation_proxy = ALProxy("ALNavigation", ROBOT_IP, ROBOT_PORT)
+        # Initialise every proxy used on each run concurrently
+        # (face detection is switched off at startup and autonomous life reset at cleanup, so both are always used)
+        proxies, proxy_times = create_proxies(
+            ["ALVideoDevice", "ALMotion", "ALTextToSpeech", "ALBasicAwareness", "ALFaceDetection",
+             "ALAutonomousLife"], ROBOT_IP, ROBOT_PORT)
+        video_proxy = proxies["ALVideoDevice"]
+        motion_proxy = proxies["ALMotion"]
+        speech_proxy = proxies["ALTextToSpeech"]
+        awareness_proxy = proxies["ALBasicAwareness"]
+        face_proxy = proxies["ALFaceDetection"]
+        autoLife_proxy = proxies["ALAutonomousLife"]
+        startup.mark("proxies", proxy_times)
+
+        # Navigation is only needed once the robot walks to an object, it connects when first used
+        navigation_proxy = LazyProxy("ALNavigation", ROBOT_IP, ROBOT_PORT)
         
         # Initialise components
         camera_manager = CameraManager(video_proxy)
@@ -58,21 +99,43 @@ def main():
             speech_manager,
             network_listener
         )
+        startup.mark("components")
 
         # Check initialisation
         logger.info("Initialising camera ...")
         if not camera_manager.initialise():
             logger.error("Failed to initialise camera, exiting")
             return
+        startup.mark("camera")
+
+        # Build the ray table and depth registration now rather than on the first detection
+        top_size = camera_manager.get_resolution('top', timeout=2.0)
+        if top_size and spatial_mapper.prepare(top_size, camera_manager.get_resolution('depth', timeout=2.0)):
+            startup.mark("spatial tables")
+
+        if RECORD_PATH:
+            recorder = Recorder(RECORD_PATH, RECORD_ODOMETRY_RATE)
+            recorder.attach(camera_manager, motion_controller)
+            recorder.start()
         
         logger.info("Initialising network listener ...")
         if not network_listener.initialise(SERVER_IP, LOCATION_PORT):
             logger.error("Failed to initialise network listener, exiting")
             return
+        startup.mark("network")
         
+        # Frames sent before the detector has loaded its model would be wasted
+        readiness.notify('ready')
+        if readiness.enabled:
+            logger.info("Waiting for the detector ...")
+            readiness.wait_for_start()
+            startup.mark("waiting for detector")
+
         # Start video streaming
         logger.info("Starting video stream ...")
         video_thread = camera_manager.start_video_stream(SERVER_IP, VIDEO_PORT)
+        startup.mark("video stream")
+        startup.report()
 
         # Start behaviour controller
         logger.info("Starting object tracking ...")
@@ -96,6 +159,8 @@ def main():
         # Cleanup
         if controller:
             controller.cleanup()
+        if recorder:
+            recorder.stop()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,84 @@
+# Local stand-in for the NAOqi proxies used by the pipeline, selected with USE_SIMULATOR in config.py
+#
+# All proxies share one simulated robot. Cameras serve frames from SIM_FRAME_DIR / SIM_DEPTH_DIR
+# (or synthetic frames), every call waits SIM_RPC_LATENCY plus up to SIM_RPC_JITTER seconds,
+# and moves are integrated kinematically so getRobotPosition follows them.
+# With REPLAY_PATH set, cameras and odometry replay a recording made with RECORD_PATH instead.
+
+import threading
+from config import (TOP_CAM_ID, DEPTH_CAM_ID, SIM_RPC_LATENCY, SIM_RPC_JITTER, SIM_FRAME_DIR,
+                    SIM_DEPTH_DIR, SIM_DEPTH_MM, REPLAY_PATH, REPLAY_SPEED, REPLAY_LOOP)
+from utils import logger
+from .robot import SimRobot
+from .frames import ImageDirectorySource, SyntheticSource
+from .services import GenericService, SimVideoDevice, SimMotion, SimNavigation, SimTextToSpeech
+
+_lock = threading.Lock()
+_robot = None
+_services = {}
+_sources = {}
+
+def get_robot():
+    # The simulated robot shared by every proxy
+    global _robot
+    with _lock:
+        if _robot is None:
+            _robot = SimRobot()
+        return _robot
+
+def set_frame_source(camera_id, source):
+    # Serve a camera from source, an object with next_frame() returning (frame, timestamp)
+    _sources[camera_id] = source
+
+def _replay_sources(robot):
+    # Cameras and odometry from the recording at REPLAY_PATH
+    from recording import STREAM_TOP, STREAM_DEPTH
+    from .replay import open_replay
+
+    sources, odometry = open_replay(REPLAY_PATH, REPLAY_SPEED, REPLAY_LOOP)
+    for camera_id, stream in ((TOP_CAM_ID, STREAM_TOP), (DEPTH_CAM_ID, STREAM_DEPTH)):
+        if camera_id not in _sources and stream in sources:
+            _sources[camera_id] = sources[stream]
+    if odometry:
+        robot.pose_source = odometry.pose_at
+    logger.info("Replaying {} at {}".format(
+        REPLAY_PATH, "{}x speed".format(REPLAY_SPEED) if REPLAY_SPEED > 0 else "full speed"))
+
+def _default_sources(robot):
+    if REPLAY_PATH:
+        _replay_sources(robot)
+    if TOP_CAM_ID not in _sources:
+        _sources[TOP_CAM_ID] = ImageDirectorySource(SIM_FRAME_DIR) if SIM_FRAME_DIR else SyntheticSource()
+    if DEPTH_CAM_ID not in _sources:
+        _sources[DEPTH_CAM_ID] = (ImageDirectorySource(SIM_DEPTH_DIR, depth=True) if SIM_DEPTH_DIR
+                                  else SyntheticSource(depth=True, depth_mm=SIM_DEPTH_MM))
+
+def ALProxy(name, ip=None, port=None):
+    # Same signature as naoqi.ALProxy, the address is ignored
+    robot = get_robot()
+    with _lock:
+        service = _services.get(name)
+        if service is None:
+            if name == "ALVideoDevice":
+                _default_sources(robot)
+                service = SimVideoDevice(name, robot, _sources, SIM_RPC_LATENCY, SIM_RPC_JITTER)
+            elif name == "ALMotion":
+                service = SimMotion(name, robot, SIM_RPC_LATENCY, SIM_RPC_JITTER)
+            elif name == "ALNavigation":
+                service = SimNavigation(name, robot, SIM_RPC_LATENCY, SIM_RPC_JITTER)
+            elif name == "ALTextToSpeech":
+                service = SimTextToSpeech(name, SIM_RPC_LATENCY, SIM_RPC_JITTER)
+            else:
+                service = GenericService(name, SIM_RPC_LATENCY, SIM_RPC_JITTER)
+            _services[name] = service
+
+    # Connecting costs a round trip like on the robot
+    service._rpc()
+    return service
+
+class ALBroker:
+    def __init__(self, *args):
+        pass
+
+    def shutdown(self):
+        pass
@@ -0,0 +1,76 @@
+import os
+import glob
+import time
+import cv2
+import numpy as np
+
+# Frame sources for the simulated cameras
+# next_frame() returns (frame, timestamp), timestamp is None to use the time the frame is served
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+class ImageDirectorySource:
+    def __init__(self, path, depth=False, loop=True):
+        # Cycle through the images of a directory in name order, 16-bit PNGs for depth
+        self.paths = sorted(p for p in glob.glob(os.path.join(path, '*'))
+                            if p.lower().endswith(IMAGE_EXTENSIONS))
+        if not self.paths:
+            raise ValueError("No images found in {}".format(path))
+        self.flags = cv2.IMREAD_UNCHANGED if depth else cv2.IMREAD_COLOR
+        self.loop = loop
+        self.index = 0
+        self._cache = {}
+
+    def next_frame(self):
+        if self.index >= len(self.paths):
+            if not self.loop:
+                return None, None
+            self.index = 0
+
+        path = self.paths[self.index]
+        self.index += 1
+
+        # Decoded images are kept so looping does not pay for decoding again
+        frame = self._cache.get(path)
+        if frame is None:
+            frame = cv2.imread(path, self.flags)
+            self._cache[path] = frame
+        return frame, None
+
+class SyntheticSource:
+    def __init__(self, depth=False, depth_mm=1000):
+        # A moving gradient for colour, a flat wall at depth_mm for depth
+        self.depth = depth
+        self.depth_mm = depth_mm
+        self.count = 0
+
+    def next_frame(self):
+        self.count += 1
+        if self.depth:
+            return np.full((240, 320), self.depth_mm, dtype=np.uint16), None
+
+        x = (np.arange(320, dtype=np.uint16) + 4 * self.count) % 256
+        row = np.stack([x, np.full(320, 128, np.uint16), 255 - x], axis=1).astype(np.uint8)
+        return np.repeat(row[np.newaxis], 240, axis=0), None
+
+def fit_frame(frame, width, height):
+    # Resize a source frame to the subscribed resolution, nearest neighbour keeps depth values real
+    if frame.shape[1] == width and frame.shape[0] == height:
+        return frame
+    interpolation = cv2.INTER_NEAREST if frame.dtype == np.uint16 else cv2.INTER_AREA
+    return cv2.resize(frame, (width, height), interpolation=interpolation)
+
+class FramePacer:
+    def __init__(self, fps):
+        # Hand out frames no faster than the subscribed frame rate
+        self.interval = 1.0 / fps if fps else 0.0
+        self.next_time = time.time()
+
+    def wait(self):
+        now = time.time()
+        if self.next_time > now:
+            time.sleep(self.next_time - now)
+        else:
+            # Running late, do not try to catch up
+            self.next_time = now
+        self.next_time += self.interval
@@ -0,0 +1,117 @@
+import time
+import threading
+import numpy as np
+from recording import RecordingReader, STREAM_TOP, STREAM_DEPTH, STREAM_ODOMETRY
+
+# Replay of a recording made with recorder.py through the simulated cameras and odometry
+
+class ReplayClock:
+    def __init__(self, start_ts, end_ts, speed=1.0, loop=True):
+        # Maps recording time to wall time, speed 2.0 replays twice as fast, 0 as fast as possible
+        # Each loop shifts the mapped timestamps by the recording length so they keep increasing
+        self.start_ts = start_ts
+        self.duration = max(end_ts - start_ts, 1e-3)
+        self.speed = speed
+        self.loop = loop
+        self._wall_start = None
+        self._served_ts = start_ts
+        self._lock = threading.Lock()
+
+    def _begin(self):
+        with self._lock:
+            if self._wall_start is None:
+                self._wall_start = time.time()
+            return self._wall_start
+
+    def wait_until(self, ts, lap=0):
+        # Sleep until ts of the given lap is due, returns the timestamp to serve the frame with
+        wall_start = self._begin()
+        self._served_ts = ts
+        elapsed = ts - self.start_ts + lap * self.duration
+        if self.speed <= 0:
+            return wall_start + elapsed
+
+        due = wall_start + elapsed / self.speed
+        now = time.time()
+        if due > now:
+            time.sleep(due - now)
+        return due
+
+    def recording_time(self, now=None):
+        # Recording timestamp being replayed at wall time now, None before replay starts
+        # As fast as possible there is no wall time mapping, the newest frame served sets the time
+        if self._wall_start is None:
+            return None
+        if self.speed <= 0:
+            return self._served_ts
+        elapsed = ((time.time() if now is None else now) - self._wall_start) * self.speed
+        if self.loop:
+            elapsed %= self.duration
+        return self.start_ts + min(elapsed, self.duration)
+
+class RecordingSource:
+    # Frames are served when the replay clock says so, not at the subscribed frame rate
+    paced = True
+
+    def __init__(self, reader, stream, clock, loop=True):
+        self.reader = reader
+        self.positions = reader.entries(stream)
+        if not len(self.positions):
+            raise ValueError("Recording {} has no frames for stream {}".format(reader.path, stream))
+        self.clock = clock
+        self.loop = loop
+        self.index = 0
+        self.lap = 0
+        self.last_ts = None
+
+    def next_frame(self):
+        if self.index >= len(self.positions):
+            if not self.loop:
+                # Keep the grabber idle instead of spinning on empty frames
+                time.sleep(0.1)
+                return None, None
+            self.index = 0
+            self.lap += 1
+
+        frame, ts = self.reader.read(self.positions[self.index])
+        self.index += 1
+        self.last_ts = self.clock.wait_until(ts, self.lap)
+        return frame, self.last_ts
+
+class ReplayOdometry:
+    def __init__(self, reader, clock):
+        # Robot pose interpolated from the recorded odometry at the replay clock's time
+        positions = reader.entries(STREAM_ODOMETRY)
+        self.clock = clock
+        self.timestamps = reader.index['timestamp'][positions].astype(np.float64)
+        self.poses = np.array([reader.read(p)[0][:3] for p in positions], dtype=np.float64)
+        # Unwrapped heading so interpolation goes the shortest way round
+        self.theta = np.unwrap(self.poses[:, 2]) if len(positions) else None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def pose_at(self, now=None):
+        ts = self.clock.recording_time(now)
+        if ts is None:
+            return tuple(float(value) for value in self.poses[0])
+        x = np.interp(ts, self.timestamps, self.poses[:, 0])
+        y = np.interp(ts, self.timestamps, self.poses[:, 1])
+        theta = np.interp(ts, self.timestamps, self.theta)
+        return float(x), float(y), float((theta + np.pi) % (2 * np.pi) - np.pi)
+
+def open_replay(path, speed=1.0, loop=True):
+    # Returns ({camera stream: source}, odometry or None) sharing one replay clock
+    reader = RecordingReader(path)
+    start_ts, end_ts = reader.time_range()
+    if start_ts is None:
+        raise ValueError("Recording {} is empty".format(path))
+
+    clock = ReplayClock(start_ts, end_ts, speed, loop)
+    sources = {}
+    for stream in (STREAM_TOP, STREAM_DEPTH):
+        if len(reader.entries(stream)):
+            sources[stream] = RecordingSource(reader, stream, clock, loop)
+
+    odometry = ReplayOdometry(reader, clock)
+    return sources, (odometry if len(odometry) else None)
@@ -0,0 +1,71 @@
+import math
+import time
+import threading
+
+# Kinematic stand-in for Pepper's base and joints
+
+LINEAR_SPEED = 0.35 # m/s
+ANGULAR_SPEED = 1.0 # rad/s
+
+class SimRobot:
+    def __init__(self):
+        # World pose (x, y, theta) and joint angles, moves are straight-line interpolations in time
+        self._lock = threading.Lock()
+        self._pose = (0.0, 0.0, 0.0)
+        self._move = None
+        self.pose_source = None # pose_source(now) overrides the integrated pose, e.g. replayed odometry
+        self.joints = {}
+        self.stiffness = {}
+
+    def get_pose(self, now=None):
+        # Current world pose, part way along any move in progress
+        if self.pose_source is not None:
+            return self.pose_source(now)
+        with self._lock:
+            return self._pose_at(time.time() if now is None else now)
+
+    def _pose_at(self, now):
+        if self._move is None:
+            return self._pose
+        start_pose, end_pose, start, duration = self._move
+        progress = 1.0 if duration <= 0 else min(1.0, (now - start) / duration)
+        pose = tuple(a + (b - a) * progress for a, b in zip(start_pose, end_pose))
+        if progress >= 1.0:
+            self._pose = end_pose
+            self._move = None
+        return pose
+
+    def is_moving(self):
+        with self._lock:
+            self._pose_at(time.time())
+            return self._move is not None
+
+    def start_move(self, x, y, theta):
+        # Begin a move given in the robot frame, returns its duration in seconds
+        with self._lock:
+            now = time.time()
+            px, py, ptheta = self._pose_at(now)
+            target = (px + x * math.cos(ptheta) - y * math.sin(ptheta),
+                      py + x * math.sin(ptheta) + y * math.cos(ptheta),
+                      ptheta + theta)
+            duration = max(math.hypot(x, y) / LINEAR_SPEED, abs(theta) / ANGULAR_SPEED)
+            self._pose = (px, py, ptheta)
+            self._move = ((px, py, ptheta), target, now, duration)
+            return duration
+
+    def wait_for_move(self):
+        while self.is_moving():
+            time.sleep(0.01)
+
+    def stop(self):
+        with self._lock:
+            self._pose = self._pose_at(time.time())
+            self._move = None
+
+    def set_joints(self, names, angles):
+        if not isinstance(names, (list, tuple)):
+            names, angles = [names], [angles]
+        with self._lock:
+            for name, angle in zip(names, angles):
+                # angleInterpolation passes a list of keyframes per joint, the last one is where it ends
+                self.joints[name] = angle[-1] if isinstance(angle, (list, tuple)) else angle
@@ -0,0 +1,216 @@
+import math
+import time
+import random
+import threading
+import cv2
+import numpy as np
+from utils import logger
+from .frames import SyntheticSource, fit_frame, FramePacer
+
+# NAOqi resolution ids, unknown ids fall back to QVGA
+RESOLUTIONS = {0: (160, 120), 1: (320, 240), 2: (640, 480), 3: (1280, 960), 4: (2560, 1920),
+               7: (80, 60), 8: (40, 30)}
+
+# NAOqi colour spaces
+RGB_COLOUR_SPACE = 11
+BGR_COLOUR_SPACE = 13
+DEPTH_COLOUR_SPACES = (17, 23)
+
+# Pepper top camera field of view in radians
+TOP_CAM_HFOV = math.radians(55.2)
+TOP_CAM_VFOV = math.radians(44.3)
+
+# Approximate head geometry in metres: neck joints in the robot frame, top camera relative to the neck
+NECK_POSITION = (-0.038, 0.0, 0.99)
+TOP_CAM_OFFSET = (0.0868, 0.0, 0.0631)
+
+class SimService:
+    def __init__(self, name, latency=0.0, jitter=0.0):
+        # Base of the simulated services, every public call pays the configured RPC latency
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+
+    def _rpc(self):
+        delay = self.latency + (random.uniform(0.0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+class GenericService(SimService):
+    def __getattr__(self, method):
+        # Services the simulation does not model accept any call and do nothing
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        def call(*args, **kwargs):
+            self._rpc()
+            logger.debug("Simulated {}.{}{}".format(self.name, method, args))
+        return call
+
+class SimVideoDevice(SimService):
+    def __init__(self, name, robot, sources, latency=0.0, jitter=0.0):
+        SimService.__init__(self, name, latency, jitter)
+        self.robot = robot
+        self.sources = sources
+        self.subscriptions = {}
+        self.active_camera = 0
+        self._lock = threading.Lock()
+
+    def subscribeCamera(self, name, camera_id, resolution, colour_space, fps):
+        self._rpc()
+        if resolution not in RESOLUTIONS:
+            logger.info("Simulated camera has no resolution {}, using 320x240".format(resolution))
+        width, height = RESOLUTIONS.get(resolution, (320, 240))
+
+        handle = "{}_{}".format(name, len(self.subscriptions))
+        with self._lock:
+            self.subscriptions[handle] = {
+                'camera_id': camera_id,
+                'size': (width, height),
+                'colour_space': colour_space,
+                'pacer': FramePacer(fps),
+            }
+        return handle
+
+    def unsubscribe(self, handle):
+        self._rpc()
+        with self._lock:
+            return self.subscriptions.pop(handle, None) is not None
+
+    def setActiveCamera(self, camera_id):
+        self._rpc()
+        self.active_camera = camera_id
+        return True
+
+    def getImageRemote(self, handle):
+        # Next frame of the camera's source as a NAOqi image list, paced at the subscribed fps
+        subscription = self.subscriptions.get(handle)
+        if subscription is None:
+            return None
+
+        colour_space = subscription['colour_space']
+        depth = colour_space in DEPTH_COLOUR_SPACES
+        source = self.sources.get(subscription['camera_id'])
+        if source is None:
+            source = self.sources[subscription['camera_id']] = SyntheticSource(depth)
+
+        # Replayed recordings keep their own timing
+        if not getattr(source, 'paced', False):
+            subscription['pacer'].wait()
+        self._rpc()
+
+        frame, timestamp = source.next_frame()
+        if frame is None:
+            return None
+        if timestamp is None:
+            timestamp = time.time()
+
+        width, height = subscription['size']
+        frame = fit_frame(frame, width, height)
+        if depth:
+            frame = frame.astype(np.uint16)
+        elif frame.ndim == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        if colour_space == RGB_COLOUR_SPACE:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+        seconds = int(timestamp)
+        layers = 1 if frame.ndim == 2 else frame.shape[2]
+        return [width, height, layers, colour_space, seconds, int((timestamp - seconds) * 1e6),
+                np.ascontiguousarray(frame).tobytes(), subscription['camera_id']]
+
+    def releaseImage(self, handle):
+        return True
+
+    def getAngularPositionFromImagePosition(self, camera_id, position):
+        # Pinhole approximation: normalised image position to [yaw, pitch] relative to the camera
+        self._rpc()
+        x, y = position
+        yaw = math.atan((0.5 - x) * 2.0 * math.tan(TOP_CAM_HFOV / 2.0))
+        pitch = math.atan((y - 0.5) * 2.0 * math.tan(TOP_CAM_VFOV / 2.0))
+        return [yaw, pitch]
+
+class SimMotion(GenericService):
+    def __init__(self, name, robot, latency=0.0, jitter=0.0):
+        GenericService.__init__(self, name, latency, jitter)
+        self.robot = robot
+
+    def getRobotPosition(self, use_sensors=True):
+        self._rpc()
+        return list(self.robot.get_pose())
+
+    def getTransform(self, name, frame, use_sensors=True):
+        # Top camera pose from the head joints as a row-major 4x4 list, other frames are the robot origin
+        # Frames are given in the robot frame whatever frame is asked for
+        self._rpc()
+        transform = np.eye(4)
+        if name == "CameraTop":
+            yaw = self.robot.joints.get("HeadYaw", 0.0)
+            pitch = self.robot.joints.get("HeadPitch", 0.0)
+            rotate_yaw = np.array([[math.cos(yaw), -math.sin(yaw), 0], [math.sin(yaw), math.cos(yaw), 0], [0, 0, 1]])
+            rotate_pitch = np.array([[math.cos(pitch), 0, math.sin(pitch)], [0, 1, 0],
+                                     [-math.sin(pitch), 0, math.cos(pitch)]])
+            transform[:3, :3] = np.dot(rotate_yaw, rotate_pitch)
+            transform[:3, 3] = np.array(NECK_POSITION) + np.dot(transform[:3, :3], TOP_CAM_OFFSET)
+        return transform.reshape(-1).tolist()
+
+    def moveTo(self, x, y, theta, *args, **kwargs):
+        # Blocks until the move ends unless called with _async=True, like a NAOqi post
+        self._rpc()
+        self.robot.start_move(x, y, theta)
+        if not kwargs.get('_async'):
+            self.robot.wait_for_move()
+        return True
+
+    def moveInit(self):
+        self._rpc()
+
+    def stopMove(self):
+        self._rpc()
+        self.robot.stop()
+
+    def waitUntilMoveIsFinished(self):
+        self.robot.wait_for_move()
+
+    def getMoveStatus(self):
+        self._rpc()
+        return ["moving" if self.robot.is_moving() else "idle"]
+
+    def setAngles(self, names, angles, speed):
+        self._rpc()
+        self.robot.set_joints(names, angles)
+
+    def angleInterpolation(self, names, angles, times, is_absolute):
+        # Blocks for the length of the longest keyframe list
+        self._rpc()
+        self.robot.set_joints(names, angles)
+        if not isinstance(times, (list, tuple)):
+            times = [times]
+        longest = max(t[-1] if isinstance(t, (list, tuple)) else t for t in times)
+        time.sleep(longest)
+
+    def setStiffnesses(self, names, stiffness):
+        self._rpc()
+        if not isinstance(names, (list, tuple)):
+            names = [names]
+        for name in names:
+            self.robot.stiffness[name] = stiffness
+
+class SimNavigation(GenericService):
+    def __init__(self, name, robot, latency=0.0, jitter=0.0):
+        GenericService.__init__(self, name, latency, jitter)
+        self.robot = robot
+
+    def navigateTo(self, x, y, *args):
+        # No obstacles in the simulation, the robot drives straight to the target
+        self._rpc()
+        self.robot.start_move(x, y, 0.0)
+        self.robot.wait_for_move()
+        return True
+
+class SimTextToSpeech(GenericService):
+    def say(self, text, *args):
+        # Speech takes roughly as long as saying it would
+        self._rpc()
+        logger.info("Pepper says: {}".format(text))
+        time.sleep(0.3 * len(str(text).split()))
@@ -1,22 +1,52 @@
 import socket
+import threading
 import time
+from config import STATS_INTERVAL, CLOCK_SYNC_INTERVAL
 from utils import logger
+from metrics import RateCounters
+from clock_sync import ClockOffsetEstimator
+from detection_protocol import decode_detections, decode_sync, encode_ping, message_type, TYPE_PONG
+
+class _Entry:
+    def __init__(self, record, info):
+        self.record = record
+        self.info = info
+        self.taken = False
 
 class NetworkListener:
     def __init__(self):
         # Initialise network listener
         self.location_sock = None
         self.running = False
+        self.thread = None
+
+        # Newest detection per class, and per track when the detector tracks objects
+        self._latest = {}
+        self._condition = threading.Condition()
+        self.counters = RateCounters(('received', 'superseded', 'expired', 'invalid'), STATS_INTERVAL)
+
+        # Offset of the detector clock, estimated by pinging whichever address detections come from
+        self.clock = ClockOffsetEstimator()
+        self._detector_address = None
+        self._ping_sequence = 0
+        self._last_ping = 0.0
 
     def initialise(self, server_ip, port):
         # Initialise object tracker socket
         try:
             self.location_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
             self.location_sock.bind((server_ip, port))
+            self.location_sock.settimeout(0.5)
             self.running = True
+
+            # Drain the socket continuously so only fresh detections are kept
+            self.thread = threading.Thread(target=self._receive_loop, name="detection_receiver")
+            self.thread.setDaemon(True)
+            self.thread.start()
+
             logger.info("Network listener initialised on {}.{}".format(server_ip, port))
             return True
-        
+
         except Exception as e:
             logger.error("Error initialising network listener: {}".format(e))
 
@@ -24,6 +54,8 @@ class NetworkListener:
         # Cleanup network resources
         try:
             self.running = False
+            if self.thread:
+                self.thread.join(1.0)
             if self.location_sock:
                 self.location_sock.close()
             logger.info("Network listener cleaned up")
@@ -31,43 +63,135 @@ class NetworkListener:
         except Exception as e:
             logger.error("Error during network listener cleanup: {}".format(e))
 
-    def get_object_coords(self):
+    def _receive_loop(self):
+        while self.running:
+            try:
+                data, address = self.location_sock.recvfrom(65536)
+                received_ts = time.time()
+
+                try:
+                    if message_type(data) == TYPE_PONG:
+                        pong = decode_sync(data)
+                        self.clock.add_sample(pong.t0, pong.t1, pong.t2, received_ts)
+                    else:
+                        self._store(decode_detections(data), received_ts)
+                        self.counters.add('received')
+                        self._detector_address = address
+                except ValueError as e:
+                    self.counters.add('invalid')
+                    logger.warning("Invalid detection message received: {}".format(e))
+
+            except socket.timeout:
+                pass
+            except Exception as e:
+                if self.running:
+                    logger.error("Failed to receive detections: {}".format(e))
+                    time.sleep(0.1)
+
+            self._ping_detector()
+
+            rates = self.counters.poll()
+            if rates:
+                logger.info("Detection messages: {}".format(self.counters.format(rates)))
+                logger.info("Detector clock: {}".format(self.clock.format()))
+
+    def _ping_detector(self):
+        # Periodic ping, the pong is handled by the receive loop
+        now = time.time()
+        if self._detector_address is None or now - self._last_ping < CLOCK_SYNC_INTERVAL:
+            return
+
+        self._last_ping = now
+        self._ping_sequence += 1
+        try:
+            self.location_sock.sendto(encode_ping(self._ping_sequence, time.time(), self.clock.offset),
+                                      self._detector_address)
+        except Exception as e:
+            logger.warning("Failed to ping detector: {}".format(e))
+
+    def _store(self, message, received_ts):
+        # Keep the newest detection for every class and track of the message
+        with self._condition:
+            for record in message.records:
+                key = (record.class_id, record.track_id)
+                previous = self._latest.get(key)
+
+                if previous is not None:
+                    if previous.info['capture_ts'] > message.capture_ts:
+                        # Reordered datagram from an older frame
+                        self.counters.add('superseded')
+                        continue
+                    if not previous.taken:
+                        self.counters.add('superseded')
+
+                # Detector timestamps are converted to this clock, capture times come from the robot
+                x_cen, y_cen = record.center
+                self._latest[key] = _Entry(record, {
+                    'x': x_cen,
+                    'y': y_cen,
+                    'box': (record.x1, record.y1, record.x2, record.y2),
+                    'category': record.category,
+                    'score': record.score,
+                    'sent_ts': self.clock.to_local(message.send_ts),
+                    'received_ts': received_ts,
+                    'frame_id': message.frame_id,
+                    'capture_ts': message.capture_ts,
+                    'decode_ts': self.clock.to_local(message.decode_ts),
+                    'inference_ts': self.clock.to_local(message.inference_ts),
+                    'clock_offset': self.clock.offset,
+                    'track_id': record.track_id,
+                    'velocity': (record.vx, record.vy),
+                    'detected': record.detected,
+                })
+
+            self._condition.notify_all()
+
+    def get_clock_stats(self):
+        # Current detector clock offset, round trip delay and jitter in seconds, None until synced
+        return {'offset': self.clock.offset, 'delay': self.clock.delay, 'jitter': self.clock.jitter}
+
+    def get_latest(self, max_age=2.0, new_only=False):
+        # Fresh detections, most confident first, without blocking
+        # new_only skips detections already returned by an earlier call
+        now = time.time()
+        with self._condition:
+            fresh = []
+            for key, entry in list(self._latest.items()):
+                if now - entry.info['sent_ts'] > max_age:
+                    del self._latest[key]
+                    if not entry.taken:
+                        self.counters.add('expired')
+                    continue
+
+                if new_only and entry.taken:
+                    continue
+
+                entry.taken = True
+                fresh.append(entry.info)
+
+        fresh.sort(key=lambda info: info['score'], reverse=True)
+        return fresh
+
+    def get_object_coords(self, max_age=2.0, timeout=0.5):
+        # Wait up to timeout for a detection not yet returned, then return the most confident one
         try:
             if not self.running or not self.location_sock:
                 logger.error("Network listener not initialised")
-                return None, None, None
-                       
-            # Receive coordinate data
-            data, _ = self.location_sock.recvfrom(1024)
-
-            if not data:
-                logger.warning("No data received from object detector")
-                return None, None, None
-            
-            # Decode data from socket
-            coords = data.decode().split(',')
-            if len(coords) < 3:
-                logger.warning("Invalid data format received: {}".format(data))
-                return None, None, None
-            
-            x_cen = float(coords[0])
-            y_cen = float(coords[1])
-            category = str(coords[2])
-            timestamp = float(coords[3])
-
-            current_time = time.time()
-
-            time_dif = current_time - timestamp
-
-            # Check if co-ordinates are older than 2 seconds
-            if time_dif > 2.0:
-                logger.warning("No new object detected")
-                return None, None, None
-
-            logger.info("Detected {0} at coordinates ({1}, {2})".format(category, x_cen, y_cen))
-
-            return x_cen, y_cen, category
-        
+                return None, None, None, None
+
+            with self._condition:
+                if all(entry.taken for entry in self._latest.values()):
+                    self._condition.wait(timeout)
+
+            latest = self.get_latest(max_age, new_only=True)
+            if not latest:
+                return None, None, None, None
+
+            info = latest[0]
+            logger.info("Detected {0} at coordinates ({1}, {2})".format(info['category'], info['x'], info['y']))
+
+            return info['x'], info['y'], info['category'], info
+
         except Exception as e:
             logger.error("Failed to get coordinates: {}".format(e))
-            return None, None, None
+            return None, None, None, None
@@ -0,0 +1,53 @@
+import time
+import threading
+from utils import logger, ALProxy
+
+def create_proxies(services, robot_ip, robot_port):
+    # Connect to several NAOqi services at once, each connection is a round trip to the robot
+    # Returns ({service: proxy}, {service: seconds taken})
+    proxies = {}
+    timings = {}
+    errors = []
+
+    def connect(service):
+        start = time.time()
+        try:
+            proxies[service] = ALProxy(service, robot_ip, robot_port)
+            timings[service] = time.time() - start
+        except Exception as e:
+            errors.append((service, e))
+
+    threads = [threading.Thread(target=connect, args=(service,), name="proxy_{}".format(service))
+               for service in services]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        service, error = errors[0]
+        raise RuntimeError("Failed to create {} proxy: {}".format(service, error))
+
+    return proxies, timings
+
+class LazyProxy(object):
+    def __init__(self, service, robot_ip, robot_port):
+        # Stand-in for an optional service, connects on first use
+        # (a new-style class, so truth tests such as "if proxy:" do not connect)
+        self._service = service
+        self._robot_ip = robot_ip
+        self._robot_port = robot_port
+        self._proxy = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        with self._lock:
+            if self._proxy is None:
+                start = time.time()
+                self._proxy = ALProxy(self._service, self._robot_ip, self._robot_port)
+                logger.info("Connected to {} on first use in {:.0f} ms".format(
+                    self._service, 1000.0 * (time.time() - start)))
+        return self._proxy
+
+    def __getattr__(self, name):
+        return getattr(self._connect(), name)
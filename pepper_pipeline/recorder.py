@@ -0,0 +1,112 @@
+import time
+import threading
+import numpy as np
+from collections import deque
+from utils import logger
+from config import STATS_INTERVAL
+from recording import RecordingWriter, STREAM_TOP, STREAM_DEPTH, STREAM_ODOMETRY
+
+class Recorder:
+    def __init__(self, path, odometry_rate=10.0, queue_size=60):
+        # Persist top frames, raw depth frames and odometry so a run can be replayed later
+        # Frames are copied on the grabber threads and written to disk on a separate thread
+        self.writer = RecordingWriter(path)
+        self.odometry_rate = odometry_rate
+        self.motion_controller = None
+        self._camera_offset = None
+
+        self._queue = deque()
+        self._queue_size = queue_size
+        self._condition = threading.Condition()
+        self.running = False
+        self.threads = []
+
+        # Statistics
+        self.written = 0
+        self.dropped = 0
+        self._last_report = time.time()
+
+    def attach(self, camera_manager, motion_controller=None):
+        # Listen to the camera grabbers, must be called after camera_manager.initialise()
+        if 'top' in camera_manager.grabbers:
+            camera_manager.grabbers['top'].add_listener(self._on_top)
+        if 'depth' in camera_manager.grabbers:
+            # Depth is recorded before the noise filter so filters can be compared on replay
+            camera_manager.grabbers['depth'].add_raw_listener(self._on_depth)
+        self.motion_controller = motion_controller
+
+    def start(self):
+        self.running = True
+        targets = [(self._write_loop, "recorder")]
+        if self.motion_controller:
+            targets.append((self._odometry_loop, "odometry_recorder"))
+        for target, name in targets:
+            thread = threading.Thread(target=target, name=name)
+            thread.setDaemon(True)
+            thread.start()
+            self.threads.append(thread)
+        logger.info("Recording to {}".format(self.writer.path))
+
+    def stop(self):
+        self.running = False
+        with self._condition:
+            self._condition.notify_all()
+        for thread in self.threads:
+            thread.join(2.0)
+        self.writer.close()
+        logger.info("Recording stopped, {} entries written, {} dropped".format(self.written, self.dropped))
+
+    def _on_top(self, frame, timestamp, sequence):
+        # Camera clock minus local clock, late by the decode time but close enough to line up odometry
+        self._camera_offset = timestamp - time.time()
+        self._put(STREAM_TOP, frame.copy(), timestamp)
+
+    def _on_depth(self, image, timestamp):
+        depth = np.frombuffer(image[6], dtype=np.uint16).reshape(image[1], image[0])
+        self._put(STREAM_DEPTH, depth.copy(), timestamp)
+
+    def _odometry_loop(self):
+        # Sample the robot position at a fixed rate, timestamped on the camera clock
+        # (NAOqi timestamps come from the robot, which need not agree with this computer)
+        interval = 1.0 / self.odometry_rate
+        while self.running:
+            start = time.time()
+            try:
+                pose = self.motion_controller.get_robot_position()
+                offset = self._camera_offset or 0.0
+                self._put(STREAM_ODOMETRY, np.array(pose, dtype=np.float64), start + offset)
+            except Exception as e:
+                logger.error("Error recording odometry: {}".format(e))
+            time.sleep(max(0.0, interval - (time.time() - start)))
+
+    def _put(self, stream, array, timestamp):
+        # Drop the newest entry rather than block a grabber when the disk falls behind
+        with self._condition:
+            if not self.running:
+                return
+            if len(self._queue) >= self._queue_size:
+                self.dropped += 1
+                return
+            self._queue.append((stream, array, timestamp))
+            self._condition.notify()
+
+    def _write_loop(self):
+        while True:
+            with self._condition:
+                while not self._queue and self.running:
+                    self._condition.wait(0.5)
+                if not self._queue:
+                    break
+                stream, array, timestamp = self._queue.popleft()
+
+            try:
+                self.writer.write(stream, array, timestamp)
+                self.written += 1
+            except Exception as e:
+                logger.error("Error writing recording: {}".format(e))
+
+            now = time.time()
+            if now - self._last_report >= STATS_INTERVAL:
+                self.writer.flush()
+                logger.info("Recorder: {} entries written, {} dropped".format(self.written, self.dropped))
+                self._last_report = now
@@ -1,12 +1,78 @@
+import time
 import numpy as np
+import cv2
 import math
-from utils import logger
-from config import TOP_CAM_ID, CALIBRATION_FILE
+from utils import logger, scale_camera_matrix
+from config import (TOP_CAM_ID, CALIBRATION_FILE, CALIBRATION_RESOLUTION, DEPTH_CALIBRATION_RESOLUTION,
+                    RAY_TABLE_STEP, REGISTRATION_CACHE_DIR, DEPTH_WINDOW, DEPTH_TRIM, DEPTH_MIN_VALID_RATIO,
+                    OBJECT_MAX_POINTS, OBJECT_VOXEL_SIZE, OBJECT_DEPTH_BIN, OBJECT_DEPTH_BAND,
+                    OBJECT_MIN_POINTS, CAMERA_TRANSFORM_MAX_AGE)
+from depth_registration import DepthRegistration, file_hash
+
+class RayTable:
+    def __init__(self, camera_matrix, dist_coeffs, calibration_size, size, step=1):
+        # Undistorted normalised image coordinates (x / z, y / z) for a grid of pixels of one resolution
+        # Built once, then pixels are looked up with bilinear interpolation instead of undistorting each time
+        # step > 1 keeps every step-th pixel per side, the lens model is smooth enough in between
+        width, height = size
+        camera_matrix = scale_camera_matrix(camera_matrix, calibration_size, size)
+
+        self.size = size
+        self.step = step
+        xs = np.arange(0, width - 1 + step, step, dtype=np.float64)
+        ys = np.arange(0, height - 1 + step, step, dtype=np.float64)
+        grid = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 1, 2)
+        normalised = cv2.undistortPoints(grid, camera_matrix, np.asarray(dist_coeffs, dtype=np.float64))
+        self.table = normalised.reshape(len(ys), len(xs), 2)
+
+    def normalised(self, pixels):
+        # (N, 2) pixels to (N, 2) normalised coordinates, x right and y down
+        pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+        rows, cols = self.table.shape[:2]
+        u = np.clip(pixels[:, 0] / self.step, 0, cols - 1)
+        v = np.clip(pixels[:, 1] / self.step, 0, rows - 1)
+        u0 = np.minimum(np.floor(u).astype(np.intp), cols - 2)
+        v0 = np.minimum(np.floor(v).astype(np.intp), rows - 2)
+        du = (u - u0)[:, np.newaxis]
+        dv = (v - v0)[:, np.newaxis]
+
+        table = self.table
+        top = table[v0, u0] * (1 - du) + table[v0, u0 + 1] * du
+        bottom = table[v0 + 1, u0] * (1 - du) + table[v0 + 1, u0 + 1] * du
+        return top * (1 - dv) + bottom * dv
+
+    def rays(self, pixels):
+        # (N, 3) unit ray directions in the camera frame, x right, y down, z forward
+        normalised = self.normalised(pixels)
+        rays = np.concatenate([normalised, np.ones((len(normalised), 1))], axis=1)
+        return rays / np.linalg.norm(rays, axis=1)[:, np.newaxis]
+
+    def angles(self, pixels):
+        # (N, 2) [yaw, pitch] like getAngularPositionFromImagePosition, yaw positive left, pitch positive down
+        normalised = self.normalised(pixels)
+        return np.stack([np.arctan(-normalised[:, 0]), np.arctan(normalised[:, 1])], axis=1)
+
+    def points(self, pixels, depths):
+        # (N, 3) camera frame points in metres, depths are distances along the optical axis
+        normalised = self.normalised(pixels)
+        depths = np.asarray(depths, dtype=np.float64).reshape(-1, 1)
+        return np.concatenate([normalised * depths, depths], axis=1)
+
+# NAOqi frame id of the robot frame, x forward, y left, z up from the ground between the wheels
+FRAME_ROBOT = 2
+
+# Optical frame (x right, y down, z forward) to NAOqi sensor frame (x forward, y left, z up)
+OPTICAL_TO_CAMERA = np.array([[0.0, 0.0, 1.0], [-1.0, 0.0, 0.0], [0.0, -1.0, 0.0]])
 
 class SpatialMapper:
     def __init__(self, video_proxy, motion_proxy):
         self.video_proxy = video_proxy
         self.motion_proxy = motion_proxy
+        self.ray_tables = {}
+        self.registrations = {}
+        self.calibration_hash = None
+        self._registered = None # (timestamp, registered depth) of the last registered frame
+        self._camera_transform = None # (time fetched, 4x4 top camera to robot transform)
 
         # Load calibration data
         try: 
@@ -17,6 +83,8 @@ class SpatialMapper:
                 self.T = self.calibration_data['T']
                 self.camera_matrix_top = self.calibration_data['camera_matrix_top']
                 self.camera_matrix_depth = self.calibration_data['camera_matrix_depth']
+                self.dist_coeffs_top = self.calibration_data['dist_coeffs_top']
+                self.calibration_hash = file_hash(CALIBRATION_FILE)
                 logger.info("Calibration data loaded successfully")
             else:
                 logger.warning("Error loading calibration data")
@@ -25,99 +93,246 @@ class SpatialMapper:
             logger.error("Error while loading calibration data: {}".format(e))
             self.calibration_data = None
 
-    def map_pixel_to_depth(self, x_top, y_top):
-        # Map top camera coordinates to depth camera coordinates
+    def get_ray_table(self, width, height):
+        # Ray table for the top camera at this resolution, None without calibration
         if not self.calibration_data:
-            logger.warning("No calibration data available")
-            return int(x_top), int(y_top)
-        
-        try:
-            top_coords = np.array([x_top, y_top, 1.0]) # Homogenous coordinates
-            transformed = np.dot(self.camera_matrix_top, top_coords)
-            depth_x, depth_y = transformed[0] / transformed[2], transformed[1] / transformed[2]
-            return int(depth_x), int(depth_y)
-        
-        except Exception as e:
-            logger.error("Error mapping coordinates: {}".format(e))
-            return int(x_top), int(y_top)
-        
-    def get_depth_at_pixel(self, depth_x, depth_y, depth_image, width, height, samples=5):
-        # Get depth at given pixel location
-        try:
-            depth_x = int(depth_x)
-            depth_y = int(depth_y)
+            return None
 
-            # Get depth from 3x3 pixel region
-            region_size = 3
+        table = self.ray_tables.get((width, height))
+        if table is None:
+            start = time.time()
+            table = RayTable(self.camera_matrix_top, self.dist_coeffs_top, CALIBRATION_RESOLUTION,
+                             (width, height), RAY_TABLE_STEP)
+            self.ray_tables[(width, height)] = table
+            logger.info("Built {}x{} ray table in {:.0f} ms".format(width, height, 1000.0 * (time.time() - start)))
+        return table
 
-            anom_threshold = 1.0
+    def get_pixel_angles(self, pixels, width, height):
+        # (N, 2) [yaw, pitch] of top camera pixels, from the ray table or one RPC per pixel without calibration
+        table = self.get_ray_table(width, height)
+        if table is not None:
+            return table.angles(pixels)
 
-            depth_samples = []
-            
-            for _ in range(samples):
-                # Get depth from 3x3 pixel region
-                x_start = max(0, depth_x - region_size//2)
-                x_end = min(width, depth_x + region_size//2 + 1)
-                y_start = max(0, depth_y - region_size//2)
-                y_end = min(height, depth_y + region_size//2 + 1)
-
-                depth_region = depth_image[y_start:y_end, x_start:x_end]
-
-                # Filter zero values and get median depth
-                valid_depths = depth_region[depth_region > 0]
-                if len(valid_depths) > 0:
-                    sample_depth = np.median(valid_depths) / 1000  # Convert from mm to m
-                    depth_samples.append(sample_depth)
-            
-            if len(depth_samples) == 0:
-                logger.warning("No valid depth data found in any sample")
-                return
-            
-            # Remove anomolies
-            filtered_samples, removed_anomalies = self._filter_anomalies(depth_samples, anom_threshold)
-            
-            if len(filtered_samples) < max(2, samples // 2):
-                logger.warning("Too many anomalies detected: {}/{} samples removed".format(len(removed_anomalies), len(depth_samples)))
-            if len(filtered_samples) == 0:
-                return
+        pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+        return np.array([self.video_proxy.getAngularPositionFromImagePosition(
+            TOP_CAM_ID, [x / float(width), y / float(height)]) for x, y in pixels])
+
+    def get_registration(self, depth_size, top_size):
+        # Depth to top camera registration for these resolutions, None without calibration
+        if not self.calibration_data:
+            return None
+
+        registration = self.registrations.get((depth_size, top_size))
+        if registration is None:
+            registration = DepthRegistration(self.calibration_data, depth_size, top_size,
+                                             DEPTH_CALIBRATION_RESOLUTION, CALIBRATION_RESOLUTION,
+                                             REGISTRATION_CACHE_DIR, self.calibration_hash)
+            self.registrations[(depth_size, top_size)] = registration
+        return registration
+
+    def get_registered_depth(self, depth_image, top_size, timestamp=None):
+        # Depth image aligned with the top camera, registered once per depth frame
+        # Detections from the same frame share its timestamp, so only the first registers the frame
+        cached = self._registered
+        if timestamp is not None and cached and cached[0] == timestamp:
+            return cached[1]
+
+        height, width = depth_image.shape[:2]
+        registration = self.get_registration((width, height), top_size)
+        if registration is not None:
+            registered = registration.register(depth_image)
+        else:
+            # Without calibration assume both cameras see the same view and only scale to the top image
+            registered = cv2.resize(depth_image, tuple(top_size), interpolation=cv2.INTER_NEAREST)
+
+        self._registered = (timestamp, registered)
+        return registered
+
+    def prepare(self, top_size, depth_size=None):
+        # Build the lookup tables for the active resolutions at startup rather than on the first detection
+        table = self.get_ray_table(*top_size)
+        registration = self.get_registration(depth_size, top_size) if depth_size else None
+        return table is not None or registration is not None
+
+    def get_depth_stats(self, depth_image, queries, window=DEPTH_WINDOW, trim=DEPTH_TRIM):
+        # Robust depth statistics for many queries at once, in one NumPy pass
+        # queries is an (N, 2) array of (x, y) pixels, sampled over a window x window neighbourhood,
+        # or an (N, 4) array of (x1, y1, x2, y2) boxes, sampled on a window x window grid inside each box
+        # Returns a dict of (N,) arrays: median, trimmed_mean and spread (interquartile range) in metres,
+        # NaN where no pixel was valid, and valid_ratio, the share of sampled pixels with a depth reading
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, np.shape(queries)[-1])
+        height, width = depth_image.shape[:2]
+        steps = np.arange(window)
+
+        if queries.shape[1] == 2:
+            xs = np.round(queries[:, 0:1]).astype(np.intp) + (steps - window // 2)
+            ys = np.round(queries[:, 1:2]).astype(np.intp) + (steps - window // 2)
+        elif queries.shape[1] == 4:
+            fractions = (steps + 0.5) / window
+            xs = np.floor(queries[:, 0:1] + (queries[:, 2:3] - queries[:, 0:1]) * fractions).astype(np.intp)
+            ys = np.floor(queries[:, 1:2] + (queries[:, 3:4] - queries[:, 1:2]) * fractions).astype(np.intp)
+        else:
+            raise ValueError("Depth queries must be (x, y) points or (x1, y1, x2, y2) boxes")
 
-            median_depth = np.median(depth_samples)
-            std_deviation = np.std(depth_samples)
+        # Every (y, x) pair of each query's sample grid, pixels outside the image count as invalid
+        inside = ((ys >= 0) & (ys < height))[:, :, np.newaxis] & ((xs >= 0) & (xs < width))[:, np.newaxis, :]
+        values = depth_image[np.clip(ys, 0, height - 1)[:, :, np.newaxis],
+                             np.clip(xs, 0, width - 1)[:, np.newaxis, :]]
+        values = values.reshape(len(queries), -1).astype(np.float64) / 1000.0 # Convert from mm to m
+        valid = inside.reshape(len(queries), -1) & (values > 0)
 
-            logger.info("Object is {}m away (std: {}m, samples: {})".format(
-                median_depth, std_deviation, len(depth_samples)))
-            logger.debug("All depth samples: {}".format(depth_samples))
+        # Sort with invalid pixels last, so each row's first count entries are its valid depths
+        values[~valid] = np.inf
+        values.sort(axis=1)
+        count = valid.sum(axis=1)
 
-            if median_depth is not None:
-                logger.info("Object is {}m away".format(median_depth))
+        # Trimmed mean over the middle of each row, cut evenly from both ends
+        cut = np.floor(count * trim).astype(np.intp)
+        finite = np.where(np.isfinite(values), values, 0.0)
+        sums = np.concatenate([np.zeros((len(queries), 1)), np.cumsum(finite, axis=1)], axis=1)
+        rows = np.arange(len(queries))
+        kept = count - 2 * cut
+        with np.errstate(invalid='ignore', divide='ignore'):
+            trimmed_mean = (sums[rows, count - cut] - sums[rows, cut]) / kept
 
-            return median_depth
+        return {
+            'median': _sorted_quantile(values, count, 0.5),
+            'trimmed_mean': np.where(kept > 0, trimmed_mean, np.nan),
+            'spread': _sorted_quantile(values, count, 0.75) - _sorted_quantile(values, count, 0.25),
+            'valid_ratio': count / float(values.shape[1]),
+        }
+
+    def get_depth_at_pixel(self, depth_x, depth_y, depth_image, width, height):
+        # Get depth at given pixel location
+        try:
+            stats = self.get_depth_stats(depth_image, [[depth_x, depth_y]])
+            median_depth = stats['median'][0]
+
+            if np.isnan(median_depth):
+                logger.warning("No valid depth data found around ({}, {})".format(depth_x, depth_y))
+                return
+            if stats['valid_ratio'][0] < DEPTH_MIN_VALID_RATIO:
+                logger.warning("Only {:.0%} of the depth pixels around the object are valid".format(
+                    stats['valid_ratio'][0]))
+
+            logger.info("Object is {}m away (spread: {}m, trimmed mean: {}m, valid: {:.0%})".format(
+                median_depth, stats['spread'][0], stats['trimmed_mean'][0], stats['valid_ratio'][0]))
+
+            return float(median_depth)
         
         except Exception as e:
             logger.error("Failed to get depth: {}".format(e))
 
-    def get_3d_position(self, x_cen, y_cen, camera_manager):
-        try:
-            logger.debug("Received pixel coordinates: x_cen={}, y_cen={}".format(x_cen, y_cen))
+    def get_camera_transform(self):
+        # Top camera pose in the robot frame as a 4x4 matrix, fetched again once CAMERA_TRANSFORM_MAX_AGE old
+        # so every detection in between does not pay for a round trip to the robot
+        now = time.time()
+        cached = self._camera_transform
+        if cached is None or now - cached[0] > CAMERA_TRANSFORM_MAX_AGE:
+            transform = self.motion_proxy.getTransform("CameraTop", FRAME_ROBOT, True)
+            if not transform or len(transform) != 16:
+                raise RuntimeError("No CameraTop transform available")
+            cached = self._camera_transform = (now, np.array(transform, dtype=np.float64).reshape(4, 4))
+        return cached[1]
+
+    def localise_object(self, box, depth_image, top_size):
+        # Object position from the point cloud inside its detection box, depth_image registered to the top camera
+        # Returns centroid, extent and nearest surface point in the robot frame (metres), None when unusable
+        table = self.get_ray_table(*top_size)
+        if table is None:
+            return None
+
+        width, height = top_size
+        x1, y1 = max(0, int(box[0])), max(0, int(box[1]))
+        x2, y2 = min(width, int(math.ceil(box[2]))), min(height, int(math.ceil(box[3])))
+        if x2 <= x1 or y2 <= y1:
+            return None
+
+        # Large boxes are sampled with a stride, the voxel grid would merge the extra points anyway
+        stride = max(1, int(math.ceil(math.sqrt(float((x2 - x1) * (y2 - y1)) / OBJECT_MAX_POINTS))))
+        xs = np.arange(x1, x2, stride)
+        ys = np.arange(y1, y2, stride)
+        depth = depth_image[np.ix_(ys, xs)].reshape(-1)
+        valid = depth > 0
+        if np.count_nonzero(valid) < OBJECT_MIN_POINTS:
+            return None
 
-            # Normalise coordinates between 0 and 1
-            norm_x = x_cen / 320 # Image width
-            norm_y = y_cen / 240 # Image height
+        grid_x, grid_y = np.meshgrid(xs, ys)
+        pixels = np.stack([grid_x.reshape(-1)[valid], grid_y.reshape(-1)[valid]], axis=1)
+        depth = depth[valid] / 1000.0
 
-            # Convert 2D array into 3D
-            angular_position = self.video_proxy.getAngularPositionFromImagePosition(TOP_CAM_ID, [norm_x, norm_y])
+        # Separate object from background before voxels even out the point density, so the object's
+        # share of the box counts rather than its surface area; detectors centre boxes on the object,
+        # so pixels near the centre weigh more
+        centre = np.array([(box[0] + box[2]) / 2.0, (box[1] + box[3]) / 2.0])
+        sigma = np.maximum(np.array([box[2] - box[0], box[3] - box[1]], dtype=np.float64) / 4.0, 1.0)
+        weights = np.exp(-0.5 * (((pixels - centre) / sigma) ** 2).sum(axis=1))
+        keep = _object_depth_mask(depth, weights, OBJECT_DEPTH_BIN, OBJECT_DEPTH_BAND)
+        if np.count_nonzero(keep) < OBJECT_MIN_POINTS:
+            return None
 
-            # Transform top cam coords into depth cam coords
-            depth_x, depth_y = self.map_pixel_to_depth(x_cen, y_cen)
+        # Back-project the object pixels in one go, then one point per voxel
+        points = _voxel_downsample(table.points(pixels[keep], depth[keep]), OBJECT_VOXEL_SIZE)
 
-            # Get depth image
-            depth_result = camera_manager.get_depth_image()
+        # Nearest surface to the camera, then everything into the robot frame
+        nearest_index = np.argmin(np.einsum('ij,ij->i', points, points))
+        transform = self.get_camera_transform()
+        rotation = np.dot(transform[:3, :3], OPTICAL_TO_CAMERA)
+        points = np.dot(points, rotation.T) + transform[:3, 3]
+
+        return {
+            'centroid': points.mean(axis=0),
+            'extent': points.max(axis=0) - points.min(axis=0),
+            'nearest': points[nearest_index],
+            'points': len(points),
+        }
+
+    def get_3d_position(self, x_cen, y_cen, camera_manager, timestamp=None, box=None):
+        try:
+            logger.debug("Received pixel coordinates: x_cen={}, y_cen={}".format(x_cen, y_cen))
+
+            # Convert 2D array into 3D using the resolution the detection frame was captured at
+            resolution = camera_manager.get_resolution('top')
+            if resolution is None:
+                logger.error("No top camera frame received yet")
+                return None, None
+            angular_position = self.get_pixel_angles([[x_cen, y_cen]], *resolution)[0]
+
+            # Get depth image captured with the detection frame when its timestamp is known
+            if timestamp is not None:
+                depth_result = camera_manager.get_depth_image_at(timestamp)
+            else:
+                depth_result = camera_manager.get_depth_image()
             if depth_result is None:
                 logger.error("Failed to get depth image")
                 return None, None
             
-            depth_image, width, height = depth_result
-            depth = self.get_depth_at_pixel(depth_x, depth_y, depth_image, width, height)
+            # Depth as seen from the top camera, so the detection pixel indexes it directly
+            depth_image = self.get_registered_depth(depth_result[0], resolution, timestamp)
+
+            # Whole-box point cloud when calibrated, robust to boxes whose centre misses a thin object
+            if box is not None and self.calibration_data:
+                try:
+                    located = self.localise_object(box, depth_image, resolution)
+                except Exception as e:
+                    logger.warning("Box localisation failed, using the box centre: {}".format(e))
+                    located = None
+
+                if located is not None:
+                    x, y, z = located['centroid']
+                    logger.info("Object at ({:.3f}, {:.3f}, {:.3f})m, extent ({:.3f}, {:.3f}, {:.3f})m, "
+                                "{} points".format(x, y, z, located['extent'][0], located['extent'][1],
+                                                   located['extent'][2], located['points']))
+                    return float(np.linalg.norm(located['nearest'][:2])), {
+                        "x": float(x),
+                        "y": float(y),
+                        "z": float(z),
+                        "theta": math.atan2(y, x),
+                        "extent": tuple(float(e) for e in located['extent']),
+                        "nearest": tuple(float(n) for n in located['nearest']),
+                    }
+
+            depth = self.get_depth_at_pixel(x_cen, y_cen, depth_image, *resolution)
 
             if depth is not None:
                 # Calculate position in robot frame
@@ -136,33 +351,35 @@ class SpatialMapper:
         except Exception as e:
             logger.error("Error calculating 3D position: {}".format(e))
 
-    def _filter_anomalies(self, samples, threshold=1.0):
+def _voxel_downsample(points, voxel_size):
+    # Mean point of every occupied voxel, voxel indices packed into one integer key per point
+    voxels = np.floor(points / voxel_size).astype(np.int64)
+    voxels -= voxels.min(axis=0)
+    spans = voxels.max(axis=0) + 1
+    keys = (voxels[:, 0] * spans[1] + voxels[:, 1]) * spans[2] + voxels[:, 2]
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    sums = np.stack([np.bincount(inverse, weights=points[:, i], minlength=len(counts)) for i in range(3)], axis=1)
+    return sums / counts[:, np.newaxis]
 
-        if len(samples) < 4:  # Not enough samples for reliable IQR
-            return samples, []
-        
-        # Sort the samples
-        sorted_samples = sorted(samples)
-        
-        # Calculate Q1 and Q3
-        q1_idx = int(len(sorted_samples) * 0.25)
-        q3_idx = int(len(sorted_samples) * 0.75)
-        q1 = sorted_samples[q1_idx]
-        q3 = sorted_samples[q3_idx]
-        
-        # Calculate IQR and boundaries
-        iqr = q3 - q1
-        lower_bound = q1 - (threshold * iqr)
-        upper_bound = q3 + (threshold * iqr)
-        
-        # Filter samples
-        filtered_samples = []
-        removed_anomalies = []
-        
-        for sample in samples:
-            if lower_bound <= sample <= upper_bound:
-                filtered_samples.append(sample)
-            else:
-                removed_anomalies.append(sample)
-        
-        return filtered_samples, removed_anomalies
\ No newline at end of file
+def _object_depth_mask(depth, weights, bin_size, band):
+    # Depths within band of the object, the mode of the weighted depth histogram
+    # The nearest bin at least half as heavy as the mode wins, so a thin object in front of a wall is kept
+    bins = np.floor((depth - depth.min()) / bin_size).astype(np.intp)
+    counts = np.bincount(bins, weights=weights)
+    peak = np.flatnonzero(counts >= 0.5 * counts.max())[0]
+    in_peak = bins == peak
+    centre = np.average(depth[in_peak], weights=weights[in_peak])
+    return np.abs(depth - centre) <= band
+
+def _sorted_quantile(values, count, q):
+    # Linearly interpolated quantile of each row's first count entries, rows already sorted
+    # NaN for rows without entries
+    rows = np.arange(len(values))
+    position = np.maximum(count - 1, 0) * q
+    lower = np.floor(position).astype(np.intp)
+    upper = np.minimum(lower + 1, np.maximum(count - 1, 0))
+    low_values = values[rows, lower]
+    high_values = values[rows, upper]
+    with np.errstate(invalid='ignore'):
+        result = low_values + (high_values - low_values) * (position - lower)
+    return np.where(count > 0, result, np.nan)
@@ -1,3 +1,4 @@
+import os
 import sys
 import numpy as np
 import logging
@@ -10,14 +11,22 @@ logging.basicConfig(
 logger = logging.getLogger('pepper_robot')
 
 # Add NAOqi library to system path
-from config import NAOQI_PATH
+from config import NAOQI_PATH, USE_SIMULATOR
 sys.path.append(NAOQI_PATH)
 
-try:
-    from naoqi import ALProxy, ALBroker
-except ImportError:
-    logger.error("Failed to import NAOqi. Check the path and installation.")
-    sys.exit(1)
+# Add modules shared with object_recognition to system path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+
+if USE_SIMULATOR:
+    # No robot or NAOqi SDK needed
+    from naoqi_sim import ALProxy, ALBroker
+    logger.info("Using the NAOqi simulator")
+else:
+    try:
+        from naoqi import ALProxy, ALBroker
+    except ImportError:
+        logger.error("Failed to import NAOqi. Check the path and installation.")
+        sys.exit(1)
 
 # Load camera claibration data from a file
 def load_calibration_data(file_path):
@@ -33,4 +42,15 @@ def load_calibration_data(file_path):
         }
     except Exception as e:
         logger.error("Failed to load calibration data: {}".format(e))
-        return None
\ No newline at end of file
+        return None
+
+# Camera matrix for another image size than the calibration images, scaled about pixel centres
+def scale_camera_matrix(camera_matrix, calibration_size, size):
+    scale_x = float(size[0]) / calibration_size[0]
+    scale_y = float(size[1]) / calibration_size[1]
+    camera_matrix = np.array(camera_matrix, dtype=np.float64)
+    camera_matrix[0, 0] *= scale_x
+    camera_matrix[1, 1] *= scale_y
+    camera_matrix[0, 2] = (camera_matrix[0, 2] + 0.5) * scale_x - 0.5
+    camera_matrix[1, 2] = (camera_matrix[1, 2] + 0.5) * scale_y - 0.5
+    return camera_matrix
\ No newline at end of file
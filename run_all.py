@@ -1,10 +1,18 @@
-import subprocess
 import os
 import sys
+import time
+import signal
+import shutil
+import argparse
+import subprocess
 
 # === USER CONFIGURATION SECTION ===
 env_1 = "pepper27" # Python 2.7 environment
 env_2 = "pepper3"  # Python 3 environment
+
+# Interpreter paths override the conda environments above, e.g. "/opt/pepper27/bin/python"
+python_1 = os.environ.get("PEPPER_PYTHON27")
+python_2 = os.environ.get("PEPPER_PYTHON3")
 # ====================================
 
 
@@ -14,14 +22,166 @@ base_dir = os.path.abspath(base_dir)
 script_1 = os.path.join(base_dir, "pepper_pipeline", "main.py")
 script_2 = os.path.join(base_dir, "object_recognition", "stream.py")
 
-# Open Terminal 1 (Python 2.7)
-subprocess.Popen([
-    "cmd.exe", "/k",
-    f'call conda activate {env_1} && python {script_1}'
-])
-
-# Open Terminal 2 (Python 3.12)
-subprocess.Popen([
-    "cmd.exe", "/k",
-    f'call conda activate {env_2} && python {script_2}'
-])
\ No newline at end of file
+sys.path.append(os.path.join(base_dir, "common"))
+from readiness import ReadinessListener, READY_PORT_ENV
+
+# Restart backoff in seconds, reset once a child has stayed up for STABLE_TIME
+BACKOFF_START = 1.0
+BACKOFF_MAX = 30.0
+STABLE_TIME = 60.0
+
+
+def log(message):
+    print(f"[run_all {time.strftime('%H:%M:%S')}] {message}", flush=True)
+
+
+def python_command(interpreter, env, script):
+    # Run the script with an interpreter path, or inside a conda environment
+    if interpreter:
+        return [interpreter, "-u", script]
+    conda = shutil.which("conda") or os.environ.get("CONDA_EXE")
+    if not conda:
+        raise RuntimeError(f"conda not found, set the interpreter for {os.path.basename(script)} instead")
+    return [conda, "run", "--no-capture-output", "-n", env, "python", "-u", script]
+
+
+class Child:
+    def __init__(self, name, command, cwd, ready_port):
+        self.name = name
+        self.command = command
+        self.cwd = cwd
+        self.ready_port = ready_port
+
+        self.process = None
+        self.started = 0.0
+        self.ready = False
+        self.address = None
+        self.restarts = 0
+        self.backoff = BACKOFF_START
+        self.restart_at = 0.0
+
+    def start(self):
+        env = dict(os.environ)
+        env[READY_PORT_ENV] = str(self.ready_port)
+        env["PYTHONUNBUFFERED"] = "1"
+
+        self.process = subprocess.Popen(self.command, cwd=self.cwd, env=env)
+        self.started = time.time()
+        self.ready = False
+        self.address = None
+        log(f"Started {self.name} (pid {self.process.pid})")
+
+    def exited(self):
+        return self.process is not None and self.process.poll() is not None
+
+    def schedule_restart(self):
+        # Exponential backoff, a child that ran long enough starts again from the shortest delay
+        if time.time() - self.started > STABLE_TIME:
+            self.backoff = BACKOFF_START
+
+        self.restart_at = time.time() + self.backoff
+        log(f"{self.name} exited with code {self.process.returncode}, restarting in {self.backoff:.0f}s")
+        self.backoff = min(self.backoff * 2, BACKOFF_MAX)
+        self.restarts += 1
+        self.process = None
+
+    def stop(self, timeout=5.0):
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class Supervisor:
+    def __init__(self, args):
+        self.listener = ReadinessListener()
+        self.launch_time = time.time()
+        self.first_detection = None
+        self.running = True
+
+        # Both children start together, so the detector loads its model while the pipeline connects
+        self.pipeline = Child("pipeline", python_command(args.python27 or python_1, args.env27 or env_1, script_1),
+                              os.path.dirname(script_1), self.listener.port)
+        self.detector = Child("detector", python_command(args.python3 or python_2, args.env3 or env_2, script_2),
+                              os.path.dirname(script_2), self.listener.port)
+        self.children = {"pipeline": self.pipeline, "detector": self.detector}
+
+    def run(self):
+        for child in self.children.values():
+            child.start()
+
+        while self.running:
+            result = self.listener.poll(0.5)
+            if result:
+                self._handle(*result)
+
+            if not self.running:
+                break
+
+            for child in self.children.values():
+                if child.process is None:
+                    if time.time() >= child.restart_at:
+                        child.start()
+                elif child.exited():
+                    child.schedule_restart()
+
+            self._release_pipeline()
+
+    def _handle(self, message, address):
+        child = self.children.get(message.get("name"))
+        if child is None:
+            return
+
+        state = message.get("state")
+        if state == "ready":
+            child.ready = True
+            child.address = address
+            log(f"{child.name} ready after {time.time() - child.started:.1f}s")
+        elif state == "first_detection" and self.first_detection is None:
+            self.first_detection = time.time()
+            log(f"Time to first detection: {self.first_detection - self.launch_time:.1f}s")
+
+    def _release_pipeline(self):
+        # The pipeline only starts streaming once the detector can process frames
+        pipeline = self.pipeline
+        if pipeline.ready and pipeline.address and self.detector.ready:
+            self.listener.send_start(pipeline.address)
+            log(f"Detector ready, pipeline streaming ({time.time() - self.launch_time:.1f}s after launch)")
+            pipeline.address = None
+
+    def stop(self):
+        self.running = False
+        for child in self.children.values():
+            child.stop()
+        self.listener.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run and supervise the robot pipeline and the detector")
+    parser.add_argument("--python27", help="Python 2.7 interpreter for pepper_pipeline")
+    parser.add_argument("--python3", help="Python 3 interpreter for object_recognition")
+    parser.add_argument("--env27", help="conda environment for pepper_pipeline")
+    parser.add_argument("--env3", help="conda environment for object_recognition")
+    args = parser.parse_args()
+
+    supervisor = Supervisor(args)
+
+    def shutdown(signum, frame):
+        supervisor.running = False
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    try:
+        supervisor.run()
+    finally:
+        log("Stopping children")
+        supervisor.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+import detection_protocol as protocol
+from clock_sync import ClockOffsetEstimator
+from detection_protocol import ObjectRecord
+
+
+def record(score, box=(10, 20, 30, 40), detected=True):
+    return ObjectRecord(protocol.class_id('cup'), score, box[0], box[1], box[2], box[3], 7, 1.5, -2.0, detected)
+
+
+class DetectionProtocolTest(unittest.TestCase):
+    def test_round_trip(self):
+        data = protocol.encode_detections(42, 1.0, 2.0, 3.0, 4.0, [record(0.5)])
+        message = protocol.decode_detections(data)
+        self.assertEqual(protocol.message_type(data), protocol.TYPE_DETECTIONS)
+        self.assertEqual(message.frame_id, 42)
+        self.assertEqual((message.capture_ts, message.decode_ts, message.inference_ts, message.send_ts),
+                         (1.0, 2.0, 3.0, 4.0))
+        self.assertEqual(message.records, [record(0.5)])
+        self.assertEqual(message.records[0].category, 'cup')
+
+    def test_box_is_clamped_to_int16(self):
+        data = protocol.encode_detections(1, 0.0, 0.0, 0.0, 0.0, [record(0.5, (-40000, 12.6, 40000, 99.4))])
+        box = protocol.decode_detections(data).records[0][2:6]
+        self.assertEqual(box, (-0x8000, 13, 0x7FFF, 99))
+
+    def test_too_many_records_keeps_best_scores(self):
+        records = [record(index / 10000.0) for index in range(protocol.MAX_RECORDS + 10)]
+        data = protocol.encode_detections(1, 0.0, 0.0, 0.0, 0.0, records)
+        self.assertLessEqual(len(data), protocol.MAX_DATAGRAM)
+
+        scores = [r.score for r in protocol.decode_detections(data).records]
+        self.assertEqual(len(scores), protocol.MAX_RECORDS)
+        self.assertAlmostEqual(min(scores), 10 / 10000.0, places=6)
+
+    def test_detected_flag(self):
+        data = protocol.encode_detections(1, 0.0, 0.0, 0.0, 0.0, [record(0.5), record(0.4, detected=False)])
+        records = protocol.decode_detections(data).records
+        self.assertEqual([r.detected for r in records], [True, False])
+
+        # The flag is the low bit of the first record's flags field
+        flags_offset = protocol.HEADER.size + 2
+        self.assertEqual(bytearray(data)[flags_offset + 1], protocol.FLAG_DETECTED)
+
+    def test_wrong_magic_or_version_is_rejected(self):
+        data = protocol.encode_detections(1, 0.0, 0.0, 0.0, 0.0, [record(0.5)])
+        ping = protocol.encode_ping(1, 0.0)
+        for message, decode in ((data, protocol.decode_detections), (ping, protocol.decode_sync)):
+            wrong_magic = b'XX' + message[2:]
+            wrong_version = message[:2] + bytes(bytearray([protocol.VERSION + 1])) + message[3:]
+            self.assertIsNone(protocol.message_type(wrong_magic))
+            self.assertRaises(ValueError, decode, wrong_magic)
+            self.assertRaises(ValueError, decode, wrong_version)
+        self.assertRaises(ValueError, protocol.decode_detections, data[:-1])
+
+
+class ClockSyncTest(unittest.TestCase):
+    def test_offset_from_ping_pong(self):
+        # The remote clock runs 2.5 s ahead, the second exchange has the shortest round trip
+        offset = 2.5
+        estimator = ClockOffsetEstimator()
+        for sequence, (t0, outbound, inbound) in enumerate(((10.0, 0.030, 0.010), (11.0, 0.002, 0.002),
+                                                            (12.0, 0.050, 0.001))):
+            ping = protocol.decode_sync(protocol.encode_ping(sequence, t0, estimator.offset))
+            self.assertEqual(ping.message_type, protocol.TYPE_PING)
+
+            t1 = t0 + outbound + offset
+            pong = protocol.decode_sync(protocol.encode_pong(ping, t1, t1 + 0.001))
+            self.assertEqual(pong.message_type, protocol.TYPE_PONG)
+            self.assertEqual(pong.sequence, sequence)
+            self.assertEqual(pong.synced, sequence > 0)
+
+            t3 = pong.t2 - offset + inbound
+            estimator.add_sample(pong.t0, pong.t1, pong.t2, t3)
+
+        self.assertAlmostEqual(estimator.offset, offset, places=6)
+        self.assertAlmostEqual(estimator.delay, 0.004, places=6)
+        self.assertAlmostEqual(estimator.to_local(100.0), 100.0 - offset, places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(base_dir, os.pardir, "common"))
+sys.path.append(os.path.join(base_dir, os.pardir, "object_recognition"))
+from detectors import Detector, Detection
+from roi_tracker import RoiDetector
+
+
+class FixedDetector(Detector):
+    # Finds the same box on full frames, counts the frame sizes it was given
+    def __init__(self, box):
+        super().__init__()
+        self.input_size = (320, 320)
+        self.box = box
+        self.calls = []
+
+    def detect(self, frame):
+        self.calls.append(frame.shape[:2])
+        return [Detection(*self.box, "cup", 0.9)]
+
+
+class RoiDetectorTest(unittest.TestCase):
+    def test_small_box_uses_roi(self):
+        detector = RoiDetector(FixedDetector((140, 100, 180, 140)))
+        frame = np.zeros((240, 320, 3), dtype=np.uint8)
+        for _ in range(3):
+            detector.detect(frame)
+        self.assertEqual(detector.counters.totals["full"], 1)
+        self.assertEqual(detector.counters.totals["roi"], 2)
+
+    def test_large_box_is_not_lost(self):
+        # A 150 px box expanded twice is wider than the frame, so there is no crop to run on
+        inner = FixedDetector((80, 40, 230, 190))
+        detector = RoiDetector(inner)
+        frame = np.zeros((240, 320, 3), dtype=np.uint8)
+        for _ in range(5):
+            detector.detect(frame)
+        self.assertEqual(detector.counters.totals["full"], 5)
+        self.assertEqual(detector.counters.totals["roi"], 0)
+        self.assertEqual(detector.counters.totals["lost"], 0)
+        self.assertEqual(inner.calls, [(240, 320)] * 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from video_protocol import FrameSender, FrameReassembler
+
+
+class CapturingSocket(object):
+    # Stands in for a UDP socket, keeps every datagram sent
+    def __init__(self):
+        self.datagrams = []
+
+    def sendto(self, data, address):
+        self.datagrams.append(data)
+
+
+def deliver(sender, reassembler, count, start_ts):
+    # Send count frames through the reassembler, returns the frames it completed
+    delivered = []
+    for index in range(count):
+        sender.sock.datagrams = []
+        sender.send(b'x' * 20, start_ts + index)
+        for data in sender.sock.datagrams:
+            frame = reassembler.add_packet(data, now=0.0)
+            if frame is not None:
+                delivered.append(frame)
+    return delivered
+
+
+class FrameReassemblerTest(unittest.TestCase):
+    def test_chunks_are_reassembled(self):
+        sender = FrameSender(CapturingSocket(), None, chunk_size=8)
+        frames = deliver(sender, FrameReassembler(), 3, 100.0)
+        self.assertEqual([frame[0] for frame in frames], [1, 2, 3])
+        self.assertEqual(frames[0][2], b'x' * 20)
+
+    def test_sender_restart_is_not_late(self):
+        reassembler = FrameReassembler()
+        deliver(FrameSender(CapturingSocket(), None), reassembler, 5000, 0.0)
+
+        # A restarted sender numbers its frames from 1 again
+        frames = deliver(FrameSender(CapturingSocket(), None), reassembler, 100, 6000.0)
+        self.assertEqual(len(frames), 100)
+        self.assertEqual(frames[0][0], 1)
+
+    def test_old_session_is_late_after_restart(self):
+        reassembler = FrameReassembler()
+        old_sender = FrameSender(CapturingSocket(), None)
+        deliver(old_sender, reassembler, 10, 0.0)
+        deliver(FrameSender(CapturingSocket(), None), reassembler, 1, 20.0)
+
+        # Datagrams still in flight from the old sender must not reset the receiver again
+        self.assertEqual(deliver(old_sender, reassembler, 1, 11.0), [])
+        self.assertEqual(reassembler.last_delivered, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()